@@ -1,8 +1,17 @@
 
 import streamlit as st
 import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()  # before csi_backend reads its configuration from the environment
+
 import csi_backend as csi
-import os
+import csi_jobs as jobs
+import csi_media as media
+import csi_reports as reports
+import csi_tracing as tracing
+import json
+import textwrap
 import time
 
 # (Triggers Reload)
@@ -14,9 +23,19 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# --- Listing Limits ---
+SIDEBAR_PAGE_SIZE = 25
+MAP_MAX_POINTS = 5000
+QUERY_CASE_LIMIT = 500
+SEARCH_RESULT_LIMIT = 20
+JOB_POLL_SECONDS = 0.5
+CASE_CACHE_ENTRIES = 32  # case versions kept rendered in memory
+
 # --- Session State (Must be initialized before Sidebar usage) ---
 if "current_case" not in st.session_state:
     st.session_state.current_case = None
+if "active_job" not in st.session_state:
+    st.session_state.active_job = None
 
 # --- Custom CSS (CSI/Glass Theme) ---
 st.markdown("""
@@ -186,30 +205,40 @@ with st.sidebar:
     st.image("https://img.icons8.com/nolan/96/fingerprint.png", width=80) 
     st.title("Case History")
     
-# 1. Dynamic History List
-    df_cases = csi.list_all_cases_df()
-    if not df_cases.empty:
+# 1. Dynamic History List (newest first, one page at a time)
+    # The newest page is re-read on every run (so new cases appear); older pages
+    # are fetched once with a keyset cursor and kept in the session.
+    if "sidebar_older" not in st.session_state:
+        st.session_state.sidebar_older = []
+        st.session_state.sidebar_more = True
+    sidebar_columns = ["case_id", "mem_primary_weapon", "updated_at"]
+    recent = csi.case_manager.list_cases(limit=SIDEBAR_PAGE_SIZE, columns=sidebar_columns)
+    shown = {row["case_id"] for row in recent}
+    sidebar_rows = recent + [row for row in st.session_state.sidebar_older if row["case_id"] not in shown]
+    if sidebar_rows:
         st.markdown("<div style='font-size: 0.8em; color: #94a3b8; margin-top: 20px; margin-bottom: 10px;'>RECENT CASES</div>", unsafe_allow_html=True)
         # Iterate desc (newest first)
-        for idx, row in df_cases.iterrows():
+        for row in sidebar_rows:
             # Create a label (concise)
-            c_label = f"{row['case_id'][:8]}.. | {row['mem_primary_weapon'][:8]}"
+            c_label = f"{row['case_id'][:8]}.. | {(row['mem_primary_weapon'] or '')[:8]}"
             
             # Style differently if active
             btn_type = "primary" if st.session_state.current_case and st.session_state.current_case.get("case_id") == row['case_id'] else "secondary"
             
             # Compact buttons
             if st.button(c_label, key=f"sidebar_case_{row['case_id']}", use_container_width=True, type=btn_type):
-                full_state = csi.case_manager.get_session(row['case_id'])
-                if full_state and "case:aggregate" in full_state:
-                    res = {
-                        "case_id": row['case_id'],
-                        "aggregate": full_state["case:aggregate"],
-                        "json_path": csi.OUT_DIR / f"{row['case_id']}.json",
-                        "pdf_path": csi.OUT_DIR / f"{row['case_id']}.pdf"
-                    }
-                    st.session_state.current_case = res
-                    st.rerun()
+                # Loaded (and rendered) by display_case through the case cache
+                st.session_state.current_case = {"case_id": row['case_id']}
+                st.rerun()
+
+        if len(recent) >= SIDEBAR_PAGE_SIZE and st.session_state.sidebar_more:
+            if st.button("Show older cases", key="sidebar_more_btn", use_container_width=True):
+                last = sidebar_rows[-1]
+                page = csi.case_manager.list_cases(limit=SIDEBAR_PAGE_SIZE, columns=sidebar_columns,
+                                                   offset=(last["updated_at"], last["case_id"]))
+                st.session_state.sidebar_older.extend(page)
+                st.session_state.sidebar_more = len(page) >= SIDEBAR_PAGE_SIZE
+                st.rerun()
 
     st.markdown("---")
     st.info("**System Status:** Online\n\n**Version:** 2.2.0 (Ultra)\n\n**Secure Connection:** Active")
@@ -224,43 +253,229 @@ def render_metric_card(label, value, color="blue", subtext=None):
     </div>
     """, unsafe_allow_html=True)
 
-def display_case(result, show_input=False):
-    agg = result.get("aggregate", {})
-    case_id = result.get("case_id")
-    
+def render_waterfall(trace):
+    spans = sorted(trace["spans"], key=lambda sp: sp["start"])
+    if not spans:
+        st.info("No spans recorded.")
+        return
+    t0 = min(sp["start"] for sp in spans)
+    total = max(sp["start"] + (sp["duration_ms"] or 0) / 1000 for sp in spans) - t0 or 1e-9
+    parents = {sp["span_id"]: sp["parent_id"] for sp in spans}
+
+    def depth(sp):
+        d, parent = 0, sp["parent_id"]
+        while parent:
+            d, parent = d + 1, parents.get(parent)
+        return d
+
+    rows = ""
+    for sp in spans:
+        left = (sp["start"] - t0) / total * 100
+        width = max((sp["duration_ms"] or 0) / 1000 / total * 100, 0.3)
+        color = {"stage": "#3b82f6", "http": "#f59e0b", "llm": "#a855f7"}.get(sp["name"].split(":")[0], "#22c55e")
+        attrs = ", ".join(f"{k}={v}" for k, v in sp["attrs"].items())
+        rows += f"""
+        <div style="display:flex; align-items:center; font-size:0.75em; margin:2px 0;" title="{attrs}">
+            <div style="width:32%; padding-left:{depth(sp) * 10}px; color:#cbd5e1; white-space:nowrap; overflow:hidden;">{sp['name']}</div>
+            <div style="width:58%; position:relative; height:12px; background:rgba(255,255,255,0.04);">
+                <div style="position:absolute; left:{left:.2f}%; width:{width:.2f}%; height:100%; background:{color}; border-radius:2px;"></div>
+            </div>
+            <div style="width:10%; text-align:right; color:#94a3b8;">{sp['duration_ms']:.0f} ms</div>
+        </div>"""
+    st.markdown(f'<div class="css-card">{textwrap.dedent(rows)}</div>', unsafe_allow_html=True)
+
+# --- Case View Cache ---
+# Keyed on (case_id, revision): every saved update changes the key, so stale entries are never served.
+@st.cache_resource(max_entries=CASE_CACHE_ENTRIES, show_spinner=False)
+def load_case(case_id, revision):
+    """Stored aggregate for one version of a case (shared between reruns and sessions: read-only)."""
+    state = csi.case_manager.get_session(case_id) or {}
+    return state.get("case:aggregate", {})
+
+@st.cache_data(max_entries=CASE_CACHE_ENTRIES, show_spinner=False)
+def evidence_frame(case_id, revision):
+    """Evidence table columns for display_case, or None without evidence."""
+    evidence = load_case(case_id, revision).get("evidence_items", [])
+    if not evidence:
+        return None
+    return pd.DataFrame(evidence)[["type", "description", "confidence"]]
+
+@st.cache_data(max_entries=CASE_CACHE_ENTRIES, show_spinner=False)
+def case_html(case_id, revision):
+    """The HTML cards of display_case, by name ("" for cards the case doesn't have)."""
+    agg = load_case(case_id, revision)
+    html = {}
+
     # Extract description text safely
     desc_obj = agg.get("description", "No description available.")
     if isinstance(desc_obj, dict):
         scene_text = desc_obj.get("description", "No description available.")
     else:
         scene_text = str(desc_obj)
+
+    # User Input / Description Card
+    html["input"] = f"""
+    <div class="css-card" style="height: 100%; overflow-y: auto; max-height: 400px; margin-bottom: 10px;">
+        <div style="display:flex; justify-content:space-between; align-items:center;">
+            <h3>📝 Case Input</h3>
+            <span style="font-size:0.7em; background:#3b82f6; padding:2px 6px; border-radius:4px;">Gemini 2.0 Flash</span>
+        </div>
+        <div style="font-size: 0.9em; color: #cbd5e1; white-space: pre-wrap; margin-top: 10px;">{scene_text[:500] + ("..." if len(scene_text)>500 else "")}</div>
+        <br>
+        <div style="font-size: 0.75em; color: #64748b;">ID: {case_id}</div>
+    </div>
+    """
+
+    # New Visual Analysis Card
+    vis_analysis = agg.get("visual_analysis", "")
+    html["visual"] = ""
+    if vis_analysis:
+        html["visual"] = f"""
+        <div class="css-card" style="height: 100%; overflow-y: auto; max-height: 300px; border: 1px solid rgba(56, 189, 248, 0.3);">
+            <h3>👁️ Visual Forensics</h3>
+            <div style="font-size: 0.85em; color: #7dd3fc; white-space: pre-wrap; margin-top: 5px;">{vis_analysis}</div>
+        </div>
+        """
+
+    risk = agg.get("risk_score", 0)
+    risk_color = "#ef4444" if risk > 7 else "#f59e0b" if risk > 4 else "#22c55e"
+    html["risk"] = f"""
+    <div class="css-card" style="border-left: 5px solid {risk_color}; height: 100%; display: flex; flex-direction: column; justify-content: center;">
+        <h3 style="color:{risk_color}; margin: 0;">Risk Level</h3>
+        <div style="font-size: 3.5em; font-weight: bold; color: {risk_color}; line-height: 1.2;">{risk}<span style="font-size: 0.4em; color: #64748b">/10</span></div>
+        <p style="margin: 0; opacity: 0.8;">{'CRITICAL' if risk > 7 else 'HIGH' if risk > 4 else 'LOW'} PRIORITY</p>
+    </div>
+    """
+
+    summary = agg.get("executive_summary")
+    summary_content = summary if summary else "Summary unavailable."
+    html["summary"] = f"""
+    <div class="css-card" style="height: 100%; overflow-y:auto; max-height: 250px;">
+        <h3>📑 Executive Summary</h3>
+        <div style="margin-top: 10px; line-height: 1.6; color: #e2e8f0; font-size: 0.95em;">{summary_content}</div>
+    </div>
+    """
+
+    vp = agg.get("victim_profile", {})
+    html["victim"] = ""
+    if vp and vp.get("risk_level") != "Unknown":
+        html["victim"] = f"""
+        <div class="css-card" style="margin-top: 10px; margin-bottom: 10px; border: 1px solid rgba(168, 85, 247, 0.3);">
+            <h3 style="color: #c084fc;">🩸 Victimology Profile</h3>
+            <div style="display: flex; gap: 20px; flex-wrap: wrap; margin-top: 10px;">
+                <div><strong>Inferred Demographics:</strong> {vp.get('demographics_inferred', 'N/A')}</div>
+                <div><strong>Suspect Relation:</strong> {vp.get('relation_to_suspect_hypothesis', 'N/A')}</div>
+                <div><strong>Victim Risk:</strong> {vp.get('risk_level', 'N/A')}</div>
+            </div>
+        </div>
+        """
+
+    # Weapon Analysis (Pure HTML)
+    weapons = agg.get("weapons", [])
+    injuries = agg.get("injuries", [])
+
+    w_html = ""
+    if weapons:
+        w = weapons[0]
+        w_html = f"""
+        <div style="margin-bottom: 15px;">
+            <div style="color: #38bdf8; font-weight: bold; font-size: 1.1em;">PRIMARY WEAPON</div>
+            <div style="font-size: 1.4em; color: white;">{w['weapon'].upper()}</div>
+            <div style="font-size: 0.8em; color: #94a3b8;">{w['reason']} ({int(w['confidence']*100)}% Conf)</div>
+        </div>
+        """
+
+    i_html = ""
+    if injuries:
+        i = injuries[0]
+        i_html = f"""
+        <div>
+            <div style="color: #f87171; font-weight: bold; font-size: 1.1em;">INJURY PATTERN</div>
+            <div style="font-size: 1.4em; color: white;">{i['injury'].upper()}</div>
+            <div style="font-size: 0.8em; color: #94a3b8;">{i['reason']}</div>
+        </div>
+        """
+
+    # Strip indentation to prevent code block rendering
+    html["forensics"] = textwrap.dedent(f"""
+        <h3>🔫 Forensic Analysis</h3>
+        {w_html}
+        <hr style="border-color: rgba(255,255,255,0.1);">
+        {i_html}
+    """)
+
+    timeline = agg.get("timeline", [])
+    t_items = ""
+    for t in timeline:
+        # Construct each item without extra internal indentation
+        t_items += f"""
+        <div style="border-left: 2px solid #3b82f6; padding-left: 15px; margin-bottom: 20px; position: relative;">
+            <div style="position: absolute; left: -6px; top: 0; width: 10px; height: 10px; background: #3b82f6; border-radius: 50%;"></div>
+            <strong style="color: #38bdf8">Step {t['step']}</strong>
+            <div style="margin-top: 4px; font-weight: 500;">{t['event']}</div>
+            <div style="font-size: 0.85em; color: #64748b; margin-top: 2px;">{t['reason']}</div>
+        </div>"""
+
+    # Clean up the timeline Items string
+    t_items = textwrap.dedent(t_items)
+
+    html["timeline"] = textwrap.dedent(f"""
+        <h3>🕰️ Reconstruction</h3>
+        <div style="margin-top: 15px;">
+            {t_items}
+        </div>
+    """)
+
+    suspects = agg.get("suspect_hypotheses", [])
+    s_html = ""
+    if suspects:
+        for idx, sus in enumerate(suspects):
+            s_html += f"""
+            <div style="background: rgba(15, 23, 42, 0.4); padding: 15px; border-radius: 8px; margin-bottom: 10px; border: 1px solid rgba(255,255,255,0.05);">
+                <div style="color: #a78bfa; font-weight: bold;">HYPOTHESIS {idx+1}</div>
+                <div style="margin: 5px 0;"><strong>Age/Build:</strong> {sus.get('age_range')}, {sus.get('build')}</div>
+                <div style="font-size: 0.9em; color: #94a3b8; font-style: italic;">"{sus.get('reason')}"</div>
+            </div>"""
+    else:
+        s_html = "<div>Insufficient data for profiling.</div>"
+
+    # Clean up the suspect items string
+    s_html = textwrap.dedent(s_html)
+
+    html["suspects"] = textwrap.dedent(f"""
+        <h3>👤 Suspect Profiling</h3>
+        {s_html}
+    """)
+
+    return html
+
+@st.cache_data(max_entries=CASE_CACHE_ENTRIES, show_spinner=False)
+def json_payload(case_id, revision):
+    """The case JSON export, built from the stored aggregate (no dependency on csi_output files)."""
+    return json.dumps(load_case(case_id, revision), indent=2, ensure_ascii=False).encode("utf-8")
+
+@st.cache_data(max_entries=CASE_CACHE_ENTRIES, show_spinner=False)
+def pdf_payload(case_id, revision):
+    return reports.read_pdf(case_id, load_case(case_id, revision))
+
+def display_case(result, show_input=False):
+    case_id = result.get("case_id")
+    revision = csi.case_manager.get_revision(case_id)
+    if revision is None:
+        st.info(f"Case {case_id} no longer exists.")
+        return
+    html = case_html(case_id, revision)
     
     # --- ROW 1: Input (Left) + Risk & Summary (Right) ---
     r1c1, r1c2 = st.columns([1, 2])
     
     with r1c1:
         # User Input / Description Card
-        st.markdown(f"""
-        <div class="css-card" style="height: 100%; overflow-y: auto; max-height: 400px; margin-bottom: 10px;">
-            <div style="display:flex; justify-content:space-between; align-items:center;">
-                <h3>📝 Case Input</h3>
-                <span style="font-size:0.7em; background:#3b82f6; padding:2px 6px; border-radius:4px;">Gemini 2.0 Flash</span>
-            </div>
-            <div style="font-size: 0.9em; color: #cbd5e1; white-space: pre-wrap; margin-top: 10px;">{scene_text[:500] + ("..." if len(scene_text)>500 else "")}</div>
-            <br>
-            <div style="font-size: 0.75em; color: #64748b;">ID: {case_id}</div>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(html["input"], unsafe_allow_html=True)
         
         # New Visual Analysis Card
-        vis_analysis = agg.get("visual_analysis", "")
-        if vis_analysis:
-            st.markdown(f"""
-            <div class="css-card" style="height: 100%; overflow-y: auto; max-height: 300px; border: 1px solid rgba(56, 189, 248, 0.3);">
-                <h3>👁️ Visual Forensics</h3>
-                <div style="font-size: 0.85em; color: #7dd3fc; white-space: pre-wrap; margin-top: 5px;">{vis_analysis}</div>
-            </div>
-            """, unsafe_allow_html=True)
+        if html["visual"]:
+            st.markdown(html["visual"], unsafe_allow_html=True)
             
         # Update / Append Button (ChatGPT Style - Add to Context)
         if st.toggle("✏️ Update / Add Evidence"):
@@ -269,65 +484,27 @@ def display_case(result, show_input=False):
                 new_files = st.file_uploader("Add New Media", accept_multiple_files=True)
                 
                 if st.form_submit_button("🔄 Update Case Analysis"):
-                    # MERGE LOGIC: Combine old text + new text.
-                    # Ideally, backend handles context window, but for now we append.
-                    combined_text = scene_text + "\n\n[UPDATED LOG]: " + new_notes if new_notes else scene_text
+                    # Backend merges the delta into the stored case (only new media/notes are analyzed)
+                    # Stored once per content (shared across cases), streamed in chunks
+                    img_paths = [media.store_blob(uf).path for uf in new_files or []]
                     
-                    with st.spinner("Updating case files..."):
-                         img_paths = []
-                         if new_files:
-                             uploads_dir = Path("uploads")
-                             uploads_dir.mkdir(exist_ok=True)
-                             for uf in new_files:
-                                 path = uploads_dir / uf.name
-                                 with open(path, "wb") as f:
-                                     f.write(uf.getbuffer())
-                                 img_paths.append(str(path))
-                         
-                         # CALL BACKEND WITH EXISTING ID
-                         upd_result = csi.run_full_investigation(combined_text, img_paths, case_id=case_id)
-                         st.session_state.current_case = upd_result
-                         st.toast(f"Case {case_id} updated!", icon="🔄")
-                         time.sleep(1)
-                         st.rerun()
+                    # QUEUE BACKEND UPDATE WITH EXISTING ID (runs in a background worker)
+                    st.session_state.active_job = jobs.job_queue.submit_update(case_id, new_notes, img_paths)
+                    st.toast(f"Update for case {case_id} queued.", icon="🔄")
+                    st.rerun()
 
     with r1c2:
         # Risk & Executive Summary Split
         sub_c1, sub_c2 = st.columns([1, 2])
         with sub_c1:
-            risk = agg.get("risk_score", 0)
-            risk_color = "#ef4444" if risk > 7 else "#f59e0b" if risk > 4 else "#22c55e"
-            st.markdown(f"""
-            <div class="css-card" style="border-left: 5px solid {risk_color}; height: 100%; display: flex; flex-direction: column; justify-content: center;">
-                <h3 style="color:{risk_color}; margin: 0;">Risk Level</h3>
-                <div style="font-size: 3.5em; font-weight: bold; color: {risk_color}; line-height: 1.2;">{risk}<span style="font-size: 0.4em; color: #64748b">/10</span></div>
-                <p style="margin: 0; opacity: 0.8;">{'CRITICAL' if risk > 7 else 'HIGH' if risk > 4 else 'LOW'} PRIORITY</p>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(html["risk"], unsafe_allow_html=True)
             
         with sub_c2:
-            summary = agg.get("executive_summary")
-            summary_content = summary if summary else "Summary unavailable."
-            st.markdown(f"""
-            <div class="css-card" style="height: 100%; overflow-y:auto; max-height: 250px;">
-                <h3>📑 Executive Summary</h3>
-                <div style="margin-top: 10px; line-height: 1.6; color: #e2e8f0; font-size: 0.95em;">{summary_content}</div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(html["summary"], unsafe_allow_html=True)
 
     # --- ROW 1.5: Victim Profile (NEW) ---
-    vp = agg.get("victim_profile", {})
-    if vp and vp.get("risk_level") != "Unknown":
-        st.markdown(f"""
-        <div class="css-card" style="margin-top: 10px; margin-bottom: 10px; border: 1px solid rgba(168, 85, 247, 0.3);">
-            <h3 style="color: #c084fc;">🩸 Victimology Profile</h3>
-            <div style="display: flex; gap: 20px; flex-wrap: wrap; margin-top: 10px;">
-                <div><strong>Inferred Demographics:</strong> {vp.get('demographics_inferred', 'N/A')}</div>
-                <div><strong>Suspect Relation:</strong> {vp.get('relation_to_suspect_hypothesis', 'N/A')}</div>
-                <div><strong>Victim Risk:</strong> {vp.get('risk_level', 'N/A')}</div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+    if html["victim"]:
+        st.markdown(html["victim"], unsafe_allow_html=True)
 
     # --- ROW 2: Evidence & Weapons ---
     r2c1, r2c2 = st.columns([1.5, 1])
@@ -335,11 +512,10 @@ def display_case(result, show_input=False):
     with r2c1:
         # Evidence Table
         st.markdown('<div class="css-card"><h3>🔎 Detected Evidence</h3>', unsafe_allow_html=True)
-        evidence = agg.get("evidence_items", [])
-        if evidence:
-            df_ev = pd.DataFrame(evidence)
+        df_ev = evidence_frame(case_id, revision)
+        if df_ev is not None:
             st.dataframe(
-                df_ev[["type", "description", "confidence"]], 
+                df_ev, 
                 use_container_width=True, 
                 hide_index=True,
                 column_config={
@@ -354,116 +530,85 @@ def display_case(result, show_input=False):
             
     with r2c2:
         # Weapon Analysis (Pure HTML)
-        weapons = agg.get("weapons", [])
-        injuries = agg.get("injuries", [])
-        
-        w_html = ""
-        if weapons:
-            w = weapons[0]
-            w_html = f"""
-            <div style="margin-bottom: 15px;">
-                <div style="color: #38bdf8; font-weight: bold; font-size: 1.1em;">PRIMARY WEAPON</div>
-                <div style="font-size: 1.4em; color: white;">{w['weapon'].upper()}</div>
-                <div style="font-size: 0.8em; color: #94a3b8;">{w['reason']} ({int(w['confidence']*100)}% Conf)</div>
-            </div>
-            """
-        
-        i_html = ""
-        if injuries:
-            i = injuries[0]
-            i_html = f"""
-            <div>
-                <div style="color: #f87171; font-weight: bold; font-size: 1.1em;">INJURY PATTERN</div>
-                <div style="font-size: 1.4em; color: white;">{i['injury'].upper()}</div>
-                <div style="font-size: 0.8em; color: #94a3b8;">{i['reason']}</div>
-            </div>
-            """
-            
-        # Strip indentation to prevent code block rendering
-        import textwrap
-        content = textwrap.dedent(f"""
-            <h3>🔫 Forensic Analysis</h3>
-            {w_html}
-            <hr style="border-color: rgba(255,255,255,0.1);">
-            {i_html}
-        """)
-        
-        st.markdown(f'<div class="css-card" style="height: 100%;">{content}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="css-card" style="height: 100%;">{html["forensics"]}</div>', unsafe_allow_html=True)
 
     # --- ROW 3: Timeline & Profiles ---
-    import textwrap
-
     r3c1, r3c2 = st.columns(2)
     
     with r3c1:
-        timeline = agg.get("timeline", [])
-        t_items = ""
-        for t in timeline:
-            # Construct each item without extra internal indentation
-            t_items += f"""
-            <div style="border-left: 2px solid #3b82f6; padding-left: 15px; margin-bottom: 20px; position: relative;">
-                <div style="position: absolute; left: -6px; top: 0; width: 10px; height: 10px; background: #3b82f6; border-radius: 50%;"></div>
-                <strong style="color: #38bdf8">Step {t['step']}</strong>
-                <div style="margin-top: 4px; font-weight: 500;">{t['event']}</div>
-                <div style="font-size: 0.85em; color: #64748b; margin-top: 2px;">{t['reason']}</div>
-            </div>"""
-            
-        # Clean up the timeline Items string
-        t_items = textwrap.dedent(t_items)
-        
-        content_timeline = textwrap.dedent(f"""
-            <h3>🕰️ Reconstruction</h3>
-            <div style="margin-top: 15px;">
-                {t_items}
-            </div>
-        """)
-        
-        st.markdown(f'<div class="css-card">{content_timeline}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="css-card">{html["timeline"]}</div>', unsafe_allow_html=True)
         
     with r3c2:
-        suspects = agg.get("suspect_hypotheses", [])
-        s_html = ""
-        if suspects:
-            for idx, s in enumerate(suspects):
-                s_html += f"""
-                <div style="background: rgba(15, 23, 42, 0.4); padding: 15px; border-radius: 8px; margin-bottom: 10px; border: 1px solid rgba(255,255,255,0.05);">
-                    <div style="color: #a78bfa; font-weight: bold;">HYPOTHESIS {idx+1}</div>
-                    <div style="margin: 5px 0;"><strong>Age/Build:</strong> {s.get('age_range')}, {s.get('build')}</div>
-                    <div style="font-size: 0.9em; color: #94a3b8; font-style: italic;">"{s.get('reason')}"</div>
-                </div>"""
-        else:
-            s_html = "<div>Insufficient data for profiling.</div>"
-
-        # Clean up the suspect items string
-        s_html = textwrap.dedent(s_html)
-
-        content_suspects = textwrap.dedent(f"""
-            <h3>👤 Suspect Profiling</h3>
-            {s_html}
-        """)
-
-        st.markdown(f'<div class="css-card">{content_suspects}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="css-card">{html["suspects"]}</div>', unsafe_allow_html=True)
 
     # DOWNLOADS (Footer)
     col1, col2, _ = st.columns([1,1,3])
     with col1:
-        with open(result.get("json_path"), "rb") as f:
-            st.download_button("💾 Export JSON", f, file_name=f"{case_id}.json", mime="application/json", use_container_width=True)
+        st.download_button("💾 Export JSON", json_payload(case_id, revision), file_name=f"{case_id}.json",
+                           mime="application/json", use_container_width=True)
     with col2:
-        try:
-             with open(result.get("pdf_path"), "rb") as f:
-                st.download_button("📄 Export PDF", f, file_name=f"{case_id}.pdf", mime="application/pdf", use_container_width=True)
-        except:
-            pass
+        # Read (or rendered, if the background report isn't ready) on the first click per case version
+        st.download_button("📄 Export PDF", lambda: pdf_payload(case_id, revision), file_name=f"{case_id}.pdf",
+                           mime="application/pdf", use_container_width=True)
+            
+    # Stage waterfall for the latest pipeline run (optional panel)
+    traces = csi.case_manager.get_traces(case_id, limit=1)
+    if traces:
+        with st.expander("⏱️ Stage Waterfall"):
+            render_waterfall(traces[0])
+            t1, t2, _ = st.columns([1, 1, 3])
+            with t1:
+                st.download_button("Export JSONL", tracing.to_jsonl(traces[0]), file_name=f"{case_id}_trace.jsonl",
+                                   mime="application/x-ndjson", use_container_width=True)
+            with t2:
+                st.download_button("Export Chrome Trace", json.dumps(tracing.to_chrome_trace(traces[0])),
+                                   file_name=f"{case_id}_trace.json", mime="application/json", use_container_width=True)
             
     # Delete Option in View
     if st.button("🗑️ Delete This Case", key=f"del_main_{case_id}", type="secondary"):
         csi.case_manager.delete_session(case_id)
         st.session_state.current_case = None
+        st.session_state.sidebar_older = [r for r in st.session_state.sidebar_older if r["case_id"] != case_id]
         st.toast("Case deleted.")
         time.sleep(0.5)
         st.rerun()
 
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_progress():
+    """Poll the active background job; swap in the case once it finishes."""
+    job_id = st.session_state.active_job
+    if not job_id:
+        return
+    job = jobs.job_queue.status(job_id)
+    if job is None:
+        st.session_state.active_job = None
+        return
+
+    if job["status"] == jobs.DONE:
+        st.session_state.current_case = jobs.job_queue.result(job_id)
+        st.session_state.active_job = None
+        st.toast(f"Case {job['case_id']} ready!", icon="✅")
+        st.rerun()
+    elif job["status"] in (jobs.FAILED, jobs.CANCELLED):
+        st.error(f"Job {job_id} {job['status']}: {job['error'] or ''}")
+        if st.button("Dismiss", key=f"dismiss_{job_id}"):
+            st.session_state.active_job = None
+            st.rerun()
+    else:
+        label = "Queued..." if job["status"] == jobs.QUEUED else f"Running stage: {job['stage'] or '...'}"
+        st.markdown(f"""
+        <div class="css-card" style="margin-bottom: 10px;">
+            <h3>⚙️ Neural Forensics In Progress</h3>
+            <div style="font-size: 0.8em; color: #94a3b8;">{job['case_id']} · {job_id}</div>
+        </div>
+        """, unsafe_allow_html=True)
+        st.progress(job["fraction"], text=label)
+        draft = job["partial"].get("summary")
+        if draft:
+            st.markdown(f"**Drafting executive summary...**\n\n{draft}")
+        if st.button("✖ Cancel", key=f"cancel_{job_id}"):
+            jobs.job_queue.cancel(job_id)
+
 # --- Top Navigation ---
 st.title("AI CRIME SCENE INVESTIGATOR")
 tabs = st.tabs(["📊 Dashboard", "🕵️ Investigation", "🧠 Neural Query"])
@@ -471,12 +616,12 @@ tabs = st.tabs(["📊 Dashboard", "🕵️ Investigation", "🧠 Neural Query"])
 # --- TAB 1: DASHBOARD ---
 with tabs[0]:
     st.markdown("<br>", unsafe_allow_html=True)
-    df = csi.list_all_cases_df()
+    stats = csi.case_manager.case_stats()
     
     # KPI Row
     kpi1, kpi2, kpi3 = st.columns(3)
     with kpi1:
-        render_metric_card("Total Cases Solved", len(df), "#3b82f6", "Updated in real-time")
+        render_metric_card("Total Cases Solved", stats["total_cases"], "#3b82f6", "Updated in real-time")
     with kpi2:
         # Cloud Agent Status Sim
         st.markdown("""
@@ -493,14 +638,14 @@ with tabs[0]:
         """, unsafe_allow_html=True)
 
     with kpi3:
-        evidence_count = df['num_evidence'].sum() if not df.empty else 0
-        render_metric_card("Evidence Items", evidence_count, "#22c55e", "Processed by vision systems")
+        render_metric_card("Evidence Items", stats["total_evidence"], "#22c55e", "Processed by vision systems")
 
     # GIS Crime Map
     st.markdown("### 🗺️ Geospatial Crime Mapping")
-    if not df.empty and 'lat' in df.columns:
-        # Filter for valid coordinates
-        map_df = df.dropna(subset=['lat', 'lon'])
+    if stats["total_cases"]:
+        # Only cases with valid coordinates
+        map_df = csi.list_cases_df(limit=MAP_MAX_POINTS, columns=["lat", "lon"],
+                                   filters={"lat": ("!=", None), "lon": ("!=", None)})
         if not map_df.empty:
             st.map(map_df, latitude='lat', longitude='lon', size=20, color='#ef4444')
         else:
@@ -508,13 +653,14 @@ with tabs[0]:
     else:
         st.info("Awaiting GIS synchronization...")
 
-    if not df.empty:
+    if stats["total_cases"]:
+        df = csi.list_cases_df(limit=5, columns=["case_id", "mem_primary_weapon", "risk_score", "updated_at"])
         st.markdown("""
         <div class="css-card">
             <h3>📡 Recent System Activity</h3>
         """, unsafe_allow_html=True)
         st.dataframe(
-            df[["case_id", "mem_primary_weapon", "risk_score", "updated_at"]].sort_values("updated_at", ascending=False).head(5),
+            df,
             use_container_width=True,
             hide_index=True,
             column_config={
@@ -531,6 +677,7 @@ with tabs[0]:
 # --- TAB 2: INVESTIGATION (Dynamic) ---
 with tabs[1]:
     st.markdown("<br>", unsafe_allow_html=True)
+    render_job_progress()
     
     # Logic: If case exists, show RESULTS MODE. Else, show INPUT MODE.
     if st.session_state.current_case:
@@ -559,21 +706,12 @@ with tabs[1]:
                 submitted = st.form_submit_button("🚀 RUN DIAGNOSTICS", use_container_width=True)
                 
                 if submitted and scene_text:
-                    with st.spinner("Initializing neural forensics..."):
-                        img_paths = []
-                        if uploaded_files:
-                            uploads_dir = Path("uploads")
-                            uploads_dir.mkdir(exist_ok=True)
-                            for uf in uploaded_files:
-                                path = uploads_dir / uf.name
-                                with open(path, "wb") as f:
-                                    f.write(uf.getbuffer())
-                                img_paths.append(str(path))
-                        
-                        # New Case -> No ID passed, backend generates one
-                        result = csi.run_full_investigation(scene_text, img_paths)
-                        st.session_state.current_case = result
-                        st.rerun()
+                    # Content-addressed blob store: identical photos are stored (and analyzed) once
+                    img_paths = [media.store_blob(uf).path for uf in uploaded_files or []]
+                    
+                    # New Case -> queued; a background worker generates the ID and runs the pipeline
+                    st.session_state.active_job = jobs.job_queue.submit(scene_text, img_paths)
+                    st.rerun()
 
         with col2:
              st.markdown("""
@@ -589,7 +727,7 @@ with tabs[2]:
     st.markdown("<br>", unsafe_allow_html=True)
     c1, c2 = st.columns([1,2])
     
-    df = csi.list_all_cases_df()
+    df = csi.list_cases_df(limit=QUERY_CASE_LIMIT, columns=["case_id"])
     
     if not df.empty:
         with c1:
@@ -601,8 +739,10 @@ with tabs[2]:
             </div>
             """, unsafe_allow_html=True)
             
+            scope = st.radio("Query Scope", ["Selected case", "All cases"], horizontal=True, label_visibility="collapsed")
             # Widget (Appears "inside" or attached to the card due to styling)
-            case_id = st.selectbox("Active Case Context", df["case_id"].tolist(), label_visibility="collapsed")
+            case_id = st.selectbox("Active Case Context", df["case_id"].tolist(), label_visibility="collapsed",
+                                   disabled=scope == "All cases")
             
         with c2:
             st.markdown("""
@@ -620,10 +760,18 @@ with tabs[2]:
                 """, unsafe_allow_html=True)
                 
                 with st.chat_message("assistant"):
-                    with st.spinner("Searching neural pathways..."):
-                        answer = csi.ask_memory_helper(query, case_id)
-                        time.sleep(0.5) # UI effect
-                        st.markdown(f"**Analysis Result:**\n\n{answer}")
+                    if scope == "All cases":
+                        # Archive-wide full-text search; no LLM call
+                        hits = csi.case_manager.search_cases(query, limit=SEARCH_RESULT_LIMIT)
+                        st.markdown(f"**Matching Cases:** {len(hits)}")
+                        for hit in hits:
+                            st.markdown(f"`{hit['case_id']}` · {hit['primary_weapon']} · risk {hit['risk_score']}  \n"
+                                        f"{hit['snippet']}")
+                        if not hits:
+                            st.info("No cases match this query.")
+                    else:
+                        st.markdown("**Analysis Result:**")
+                        st.write_stream(csi.ask_memory_stream(query, case_id))
                 
                 st.markdown("</div>", unsafe_allow_html=True)
     else:
@@ -0,0 +1,265 @@
+"""End-to-end pipeline benchmarks against the offline OpenRouter stand-in.
+
+    python benchmark.py                       # run and compare with bench_baseline.json
+    python benchmark.py --update-baseline     # record a new baseline
+    python benchmark.py --images 0,4,20 --cases 100,10000
+
+Times the cold import of the backend modules (-X importtime in a fresh
+interpreter), run_full_investigation (per image count), concurrent
+arun_full_investigation calls on one event loop, ask_memory_helper,
+list_all_cases_df (per archive size) and PDF generation, reports p50/p95
+latency and throughput, and exits non-zero when a p95 regresses past the
+stored baseline by more than --tolerance, or when an import exceeds
+--import-budget-ms or creates files.
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_openrouter import MockOpenRouter
+
+REPO_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = REPO_DIR / "bench_baseline.json"
+IMPORT_MODULES = ("csi_backend", "csi_jobs")
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()  # first call pays one-off setup (event loop, client pools, fonts)
+    samples = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, time.perf_counter() - started)
+
+
+def summarize(samples, total):
+    repeat = len(samples)
+    return {
+        "n": repeat,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "throughput_per_s": round(repeat / total, 3) if total else None
+    }
+
+
+def make_image(path, seed):
+    """Write a small synthetic JPEG (falls back to raw bytes without Pillow)."""
+    try:
+        from PIL import Image
+        # Noise rather than a flat colour, so images are not perceptual duplicates of each other
+        img = Image.frombytes("RGB", (640, 480), random.Random(seed).randbytes(640 * 480 * 3))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=85)
+        path.write_bytes(buf.getvalue())
+    except ImportError:
+        path.write_bytes(b"\xff\xd8\xff\xe0" + os.urandom(32 * 1024))
+    return str(path)
+
+
+def import_time(module, workdir):
+    """Cumulative import time of `module` (seconds) in a fresh interpreter, from -X importtime."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_DIR), os.environ.get("PYTHONPATH")])))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # time a normal start, with cached bytecode
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=workdir, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    # Lines look like "import time:  self [us] | cumulative | <indent>name"
+    for line in reversed(proc.stderr.splitlines()):
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1e6
+    raise RuntimeError(f"no -X importtime entry for {module}")
+
+
+def measure_import(module, repeat, warmup=1):
+    """Cold-import timings, run in an empty directory to catch import-time side effects."""
+    with tempfile.TemporaryDirectory(prefix="csi_import_") as workdir:
+        for _ in range(warmup):
+            import_time(module, workdir)  # first run may compile bytecode
+        samples = [import_time(module, workdir) for _ in range(repeat)]
+        created = sorted(os.listdir(workdir))
+    stats = summarize(samples, sum(samples))
+    stats["files_created"] = created
+    return stats
+
+
+def synthetic_aggregate(csi, i):
+    evidence = [{"type": "blood_stain", "description": f"Stain {j}", "confidence": 0.8, "location": "floor"}
+                for j in range(i % 7)]
+    aggregate = {
+        "case_id": f"BENCH-{i:06d}",
+        "description": "Officer Log: synthetic benchmark case " * 20,
+        "visual_analysis": "",
+        "evidence_items": evidence,
+        "weapons": [{"weapon": "bladed_object", "confidence": 0.9, "reason": "bench"}],
+        "injuries": [{"injury": "bleeding_wound", "lethality_probability": "medium", "reason": "bench"}],
+        "suspect_hypotheses": [],
+        "victim_profile": {},
+        "timeline": [],
+        "gis_location": {"lat": 40.7, "lon": -74.0},
+        "executive_summary": "Synthetic summary. " * 50
+    }
+    aggregate["risk_score"] = csi.calculate_risk_score(aggregate)
+    return aggregate
+
+
+def seed_cases(csi, target):
+    """Grow the case archive to `target` synthetic cases."""
+    have = csi.case_manager.case_stats()["total_cases"]
+    batch = []
+    for i in range(have, target):
+        agg = synthetic_aggregate(csi, i)
+        batch.append((agg["case_id"], csi.case_state(agg, [])))
+        if len(batch) >= 1000:
+            csi.case_manager.save_sessions(batch)
+            batch = []
+    if batch:
+        csi.case_manager.save_sessions(batch)
+
+
+def run_benchmarks(image_counts, case_counts, concurrency, repeat, latency, workdir):
+    os.chdir(workdir)
+    # Before this process imports csi_backend, so it cannot warm anything for the subprocesses
+    results = {f"import[{m}]": measure_import(m, repeat) for m in IMPORT_MODULES}
+    with MockOpenRouter(latency=latency, seed=7) as mock:
+        os.environ["OPENROUTER_URL"] = mock.url
+        os.environ.setdefault("CSI_LLM_CACHE_BYPASS", "1")
+        os.environ.setdefault("CSI_RATE_LIMIT_RPS", "0")  # measure the pipeline, not the throttle
+        import csi_backend as csi
+
+        images = [make_image(Path(workdir) / f"bench_{i}.jpg", i) for i in range(max(image_counts or [0]))]
+
+        for n in image_counts:
+            results[f"run_full_investigation[images={n}]"] = measure(
+                lambda: csi.run_full_investigation("Blood on the floor, knife near the door.", images[:n]), repeat)
+
+        async def concurrent_cases(n):
+            await asyncio.gather(*(csi.arun_full_investigation(f"Concurrent case {i}: blood, knife.", [])
+                                   for i in range(n)))
+
+        for n in concurrency:
+            results[f"arun_full_investigation[concurrent={n}]"] = measure(
+                lambda: csi.run_sync(concurrent_cases(n)), repeat)
+
+        case_id = csi.run_full_investigation("Benchmark case for memory queries.", [])["case_id"]
+        results["ask_memory_helper"] = measure(
+            lambda: csi.ask_memory_helper("What weapon was determined?", case_id), repeat)
+
+        for n in sorted(case_counts):
+            seed_cases(csi, n)
+            results[f"list_all_cases_df[cases={n}]"] = measure(csi.list_all_cases_df, repeat)
+
+        summary = synthetic_aggregate(csi, 0)["executive_summary"]
+        results["markdown_to_pdf"] = measure(
+            lambda: csi.markdown_to_pdf(f"Case Report: BENCH\n\n{summary}", "bench_report.pdf"), repeat)
+
+        results["_mock"] = dict(mock.stats)
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Return a list of regression messages (p95 beyond tolerance)."""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if name.startswith("_") or not base:
+            continue
+        limit = base["p95_ms"] * (1 + tolerance)
+        if stats["p95_ms"] > limit and stats["p95_ms"] - base["p95_ms"] > min_delta_ms:
+            regressions.append(f"{name}: p95 {stats['p95_ms']:.1f}ms > baseline {base['p95_ms']:.1f}ms "
+                               f"(+{tolerance:.0%} allowed)")
+    return regressions
+
+
+def check_imports(results, budget_ms):
+    """Return messages for imports over budget or with file-system side effects."""
+    problems = []
+    for name, stats in results.items():
+        if not name.startswith("import["):
+            continue
+        if stats["p50_ms"] > budget_ms:
+            problems.append(f"{name}: p50 {stats['p50_ms']:.1f}ms > budget {budget_ms:.1f}ms")
+        if stats.get("files_created"):
+            problems.append(f"{name}: importing created {', '.join(stats['files_created'])}")
+    return problems
+
+
+def print_table(results):
+    print(f"{'benchmark':<40} {'n':>4} {'p50 ms':>10} {'p95 ms':>10} {'ops/s':>9}")
+    for name, s in results.items():
+        if not name.startswith("_"):
+            print(f"{name:<40} {s['n']:>4} {s['p50_ms']:>10.1f} {s['p95_ms']:>10.1f} {s['throughput_per_s']:>9.2f}")
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CSI pipeline benchmark suite (offline).")
+    parser.add_argument("--images", type=_int_list, default=[0, 1, 4], help="image counts per case")
+    parser.add_argument("--cases", type=_int_list, default=[10, 1000], help="archive sizes for listing")
+    parser.add_argument("--concurrency", type=_int_list, default=[20], help="cases in flight on one event loop")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02, help="mock server latency (seconds)")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed p95 slowdown (0.5 = +50%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore regressions smaller than this")
+    parser.add_argument("--import-budget-ms", type=float, default=200.0,
+                        help="max p50 cold-import time of each backend module")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, str(REPO_DIR))
+    with tempfile.TemporaryDirectory(prefix="csi_bench_") as workdir:
+        cwd = os.getcwd()
+        try:
+            results = run_benchmarks(args.images, args.cases, args.concurrency, args.repeat, args.latency, workdir)
+        finally:
+            os.chdir(cwd)
+
+    print_table(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    problems = check_imports(results, args.import_budget_ms)
+    for p in problems:
+        print(f"IMPORT {p}")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Baseline written to {baseline_path}")
+        return 1 if problems else 0
+    if not baseline_path.exists():
+        print("No baseline found; run with --update-baseline to create one.")
+        return 1 if problems else 0
+    regressions = compare(results, json.loads(baseline_path.read_text(encoding="utf-8")),
+                          args.tolerance, args.min_delta_ms)
+    for r in regressions:
+        print(f"REGRESSION {r}")
+    return 1 if regressions or problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,78 +3,351 @@ import os
 import json
 import uuid
 import base64
-import requests
+import asyncio
+import inspect
+import weakref
+import queue
 import random
 import sqlite3
-import pandas as pd
+import threading
 from typing import List, Dict, Any
 from pathlib import Path
-from fpdf import FPDF
-import google.generativeai as genai
+import re
 import textwrap
 import time
+import logging
+from email.utils import parsedate_to_datetime
 
-from dotenv import load_dotenv
+from csi_cache import ResponseCache
+import csi_media as media
+import csi_prompts as prompts
+import csi_retrieval as retrieval
+import csi_reports as reports
+import csi_tracing as tracing
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # --- Configuration & Setup ---
 APP_NAME = "CSI_APP"
 DB_FILE = "csi_app.db"
+CACHE_DB_FILE = str(Path(DB_FILE).with_name("csi_cache.db"))
+SQLITE_BUSY_TIMEOUT_MS = float(os.getenv("CSI_SQLITE_BUSY_TIMEOUT_MS", "5000"))
 # User provided key for OpenRouter / Gemini 2.0 Flash
 # User provided key for OpenRouter / Gemini 2.0 Flash
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "").strip()
 OPENROUTER_MODEL = "google/gemini-2.0-flash-exp:free"
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 
-# Ensure output directory exists
+# HTTP connection pool (shared by every OpenRouter call)
+HTTP_MAX_CONNECTIONS = int(os.getenv("CSI_HTTP_MAX_CONNECTIONS", "64"))  # open at once, all hosts together
+HTTP_MAX_KEEPALIVE = int(os.getenv("CSI_HTTP_MAX_KEEPALIVE", "16"))  # idle connections kept for reuse, all hosts
+HTTP_CONNECT_TIMEOUT = float(os.getenv("CSI_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("CSI_HTTP_READ_TIMEOUT", "60"))
+
+# Client-side rate limiting + retries for OpenRouter (free-tier models throttle hard)
+RATE_LIMIT_RPS = float(os.getenv("CSI_RATE_LIMIT_RPS", "2"))  # sustained requests/second
+RATE_LIMIT_BURST = int(os.getenv("CSI_RATE_LIMIT_BURST", "5"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("CSI_RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("CSI_RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("CSI_RETRY_MAX_DELAY", "30"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Concurrency cap for independent pipeline stages (1 = strictly serial)
+PIPELINE_MAX_WORKERS = int(os.getenv("CSI_PIPELINE_MAX_WORKERS", "4"))
+
+# Vision stage: parallel requests and images packed into each request
+VISION_MAX_WORKERS = int(os.getenv("CSI_VISION_MAX_WORKERS", "4"))
+VISION_IMAGES_PER_REQUEST = int(os.getenv("CSI_VISION_IMAGES_PER_REQUEST", "1"))
+
+# LLM response cache (set CSI_LLM_CACHE_BYPASS=1 to always hit the API)
+LLM_CACHE_TTL = float(os.getenv("CSI_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("CSI_LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("CSI_LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_BYPASS = os.getenv("CSI_LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+# Output directory (created on first write)
 OUT_DIR = Path("csi_output")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 # --- Database / Persistence Layer ---
 class CaseManager:
+    """SQLite-backed case store sharing one WAL-mode connection across threads."""
+
+    _initialized_dbs = set()
+    _init_lock = threading.Lock()
+
+    SCHEMA_VERSION = 6
+
+    # Fixed SQL text so sqlite3's statement cache reuses the prepared statements
+    _SQL_SAVE = """INSERT INTO sessions (session_id, state, updated_at, revision) VALUES (?, ?, ?, 1)
+                   ON CONFLICT (session_id) DO UPDATE SET state = excluded.state,
+                   updated_at = excluded.updated_at, revision = revision + 1"""
+    _SQL_SAVE_CASE = """INSERT OR REPLACE INTO cases
+                        (case_id, risk_score, primary_weapon, num_evidence, lat, lon, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)"""
+    _SQL_SAVE_EVIDENCE = """INSERT INTO evidence_items (case_id, idx, type, description, confidence, location)
+                            VALUES (?, ?, ?, ?, ?, ?)"""
+    _SQL_GET = "SELECT state FROM sessions WHERE session_id = ?"
+    _SQL_GET_REVISION = "SELECT revision FROM sessions WHERE session_id = ?"
+    _SQL_DELETE = "DELETE FROM sessions WHERE session_id = ?"
+    _SQL_DELETE_CASE = "DELETE FROM cases WHERE case_id = ?"
+    _SQL_DELETE_EVIDENCE = "DELETE FROM evidence_items WHERE case_id = ?"
+    _SQL_SAVE_INDEX = "INSERT OR REPLACE INTO case_index (case_id, version, idx) VALUES (?, ?, ?)"
+    _SQL_GET_INDEX = "SELECT version, idx FROM case_index WHERE case_id = ?"
+    _SQL_SAVE_TEXT = "INSERT INTO case_text (case_id, scene, evidence, summary) VALUES (?, ?, ?, ?)"
+    _SQL_DELETE_TEXT = "DELETE FROM case_text WHERE case_id = ?"
+    _SQL_SAVE_MEDIA = "INSERT INTO case_media (case_id, idx, digest) VALUES (?, ?, ?)"
+    _SQL_DELETE_MEDIA = "DELETE FROM case_media WHERE case_id = ?"
+    _SQL_MEDIA_CASES = "SELECT DISTINCT case_id FROM case_media WHERE digest = ?"
+    _SQL_SEARCH = """SELECT t.case_id, bm25(case_fts, 1.0, 2.0, 1.5) AS score,
+                            snippet(case_fts, -1, '**', '**', ' ... ', 12),
+                            c.risk_score, c.primary_weapon, c.updated_at
+                     FROM case_fts
+                     JOIN case_text t ON t.docid = case_fts.rowid
+                     LEFT JOIN cases c ON c.case_id = t.case_id
+                     WHERE case_fts MATCH ? ORDER BY score LIMIT ?"""
+    _SQL_LIST = "SELECT session_id, state, updated_at FROM sessions ORDER BY updated_at DESC"
+    _SQL_GET_EVIDENCE_COUNT = "SELECT num_evidence FROM cases WHERE case_id = ?"
+    _SQL_LIST_CASES = """SELECT case_id, risk_score, primary_weapon, num_evidence, updated_at, lat, lon
+                         FROM cases ORDER BY updated_at DESC, case_id DESC"""
+
     def __init__(self, db_path=DB_FILE):
         self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False,
+                                     timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, cached_statements=128)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
         self._init_db()
+        # Process-wide dashboard caches: running totals + memoized list_cases pages.
+        # Our own writes update them; commits from other connections are detected
+        # through PRAGMA data_version and drop them.
+        self._stats = None
+        self._list_cache = {}
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
 
     def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS sessions
-                     (session_id TEXT PRIMARY KEY, state TEXT, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        conn.commit()
-        conn.close()
+        # Schema setup runs once per database file per process
+        key = os.path.abspath(self.db_path) if self.db_path != ":memory:" else None
+        with CaseManager._init_lock:
+            if key in CaseManager._initialized_dbs:
+                return
+            with self._lock:
+                if self._conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                    with self._conn:
+                        # Other processes may open the same old database at once: take the
+                        # write lock first, so _migrate reads a user_version nobody else is upgrading
+                        self._conn.execute("BEGIN IMMEDIATE")
+                        self._conn.execute('''CREATE TABLE IF NOT EXISTS sessions
+                                     (session_id TEXT PRIMARY KEY, state TEXT, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+                        self._migrate()
+            if key is not None:
+                CaseManager._initialized_dbs.add(key)
+
+    def _migrate(self):
+        """Upgrade the schema in place, tracked through PRAGMA user_version (call inside BEGIN IMMEDIATE)."""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            # v1: indexed per-case summary columns + one row per evidence item
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS cases
+                         (case_id TEXT PRIMARY KEY, risk_score INTEGER, primary_weapon TEXT,
+                          num_evidence INTEGER, lat REAL, lon REAL, updated_at TIMESTAMP)''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_updated ON cases (updated_at, case_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_risk ON cases (risk_score)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_weapon ON cases (primary_weapon)")
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS evidence_items
+                         (case_id TEXT, idx INTEGER, type TEXT, description TEXT, confidence REAL,
+                          location TEXT, PRIMARY KEY (case_id, idx))''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_evidence_type ON evidence_items (type)")
+            # Backfill from the existing JSON blobs
+            for session_id, blob, updated_at in self._conn.execute(self._SQL_LIST).fetchall():
+                try:
+                    state = json.loads(blob)
+                except:
+                    state = {}
+                self._write_case_rows(session_id, state, updated_at)
+        if version < 2:
+            # v2: per-run stage traces stored alongside each case
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS case_traces
+                         (trace_id TEXT PRIMARY KEY, case_id TEXT, name TEXT, created_at REAL,
+                          duration_ms REAL, trace TEXT)''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_case_traces_case ON case_traces (case_id, created_at)")
+        if version < 3:
+            # v3: per-case BM25 chunk index for Neural Query (older cases are indexed on first query)
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS case_index
+                         (case_id TEXT PRIMARY KEY, version INTEGER, idx TEXT)''')
+        if version < 4:
+            # v4: FTS5 index over scene text, evidence and summaries for cross-case search.
+            # case_text holds the documents; the triggers keep case_fts in step with it.
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS case_text
+                         (docid INTEGER PRIMARY KEY, case_id TEXT UNIQUE, scene TEXT, evidence TEXT, summary TEXT)''')
+            self._conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS case_fts USING fts5
+                         (scene, evidence, summary, content='case_text', content_rowid='docid',
+                          tokenize='porter unicode61')''')
+            self._conn.execute('''CREATE TRIGGER IF NOT EXISTS case_text_ai AFTER INSERT ON case_text BEGIN
+                         INSERT INTO case_fts (rowid, scene, evidence, summary)
+                         VALUES (new.docid, new.scene, new.evidence, new.summary); END''')
+            self._conn.execute('''CREATE TRIGGER IF NOT EXISTS case_text_ad AFTER DELETE ON case_text BEGIN
+                         INSERT INTO case_fts (case_fts, rowid, scene, evidence, summary)
+                         VALUES ('delete', old.docid, old.scene, old.evidence, old.summary); END''')
+            for session_id, blob, _ in self._conn.execute(self._SQL_LIST).fetchall():
+                try:
+                    state = json.loads(blob)
+                except:
+                    state = {}
+                self._write_search_text(session_id, state)
+        if version < 5:
+            # v5: blob-store media referenced by each case (older uploads/ paths aren't content-addressed: no backfill)
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS case_media
+                         (case_id TEXT, idx INTEGER, digest TEXT, PRIMARY KEY (case_id, idx))''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_case_media_digest ON case_media (digest)")
+        if version < 6:
+            # v6: per-session save counter; updated_at only has one-second resolution
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN revision INTEGER NOT NULL DEFAULT 1")
+        self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _write_case_rows(self, session_id, state, updated_at):
+        agg = state.get("case:aggregate", {})
+        w_list = agg.get("weapons", [])
+        w_main = w_list[0]["weapon"] if w_list else "Unknown"
+        loc = agg.get("gis_location", {})
+        evidence = agg.get("evidence_items", [])
+        self._conn.execute(self._SQL_SAVE_CASE, (
+            session_id, state.get("case:risk_score", 0), w_main, len(evidence),
+            loc.get("lat"), loc.get("lon"), updated_at))
+        self._conn.execute(self._SQL_DELETE_EVIDENCE, (session_id,))
+        rows = []
+        for i, e in enumerate(evidence):
+            try:
+                confidence = float(e.get("confidence", 0.0))
+            except (TypeError, ValueError):
+                confidence = None
+            rows.append((session_id, i, e.get("type"), e.get("description"), confidence, e.get("location")))
+        self._conn.executemany(self._SQL_SAVE_EVIDENCE, rows)
+
+    def _write_index(self, session_id, state):
+        index = retrieval.build_index(state.get("case:aggregate", {}))
+        self._conn.execute(self._SQL_SAVE_INDEX, (session_id, retrieval.INDEX_VERSION, json.dumps(index)))
+
+    def _write_search_text(self, session_id, state):
+        agg = state.get("case:aggregate", {})
+        evidence = [f"{e.get('type', '')}: {e.get('description', '')}" for e in agg.get("evidence_items", [])]
+        evidence += [str(w.get("weapon", "")).replace("_", " ") for w in agg.get("weapons", [])]
+        # Explicit delete: INSERT OR REPLACE would skip the delete trigger
+        self._conn.execute(self._SQL_DELETE_TEXT, (session_id,))
+        self._conn.execute(self._SQL_SAVE_TEXT, (session_id, str(agg.get("description", "")),
+                                                 "\n".join(evidence), str(agg.get("executive_summary", ""))))
+
+    def _write_media(self, session_id, state):
+        digests = [media.blob_digest(p) for p in state.get("case:images") or []]
+        self._conn.execute(self._SQL_DELETE_MEDIA, (session_id,))
+        self._conn.executemany(self._SQL_SAVE_MEDIA, [(session_id, i, d) for i, d in enumerate(digests) if d])
+
+    def _check_external_writes(self):
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._stats = None
+            self._list_cache.clear()
+
+    def _apply_write(self, case_delta, evidence_delta):
+        self._list_cache.clear()
+        if self._stats is not None:
+            self._stats["total_cases"] += case_delta
+            self._stats["total_evidence"] += evidence_delta
+
+    def _stored_evidence_count(self, session_id):
+        row = self._conn.execute(self._SQL_GET_EVIDENCE_COUNT, (session_id,)).fetchone()
+        return row[0] if row else None
 
     def save_session(self, session_id: str, state: dict):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("INSERT OR REPLACE INTO sessions (session_id, state) VALUES (?, ?)",
-                  (session_id, json.dumps(state)))
-        conn.commit()
-        conn.close()
+        self.save_sessions([(session_id, state)])
+
+    def save_sessions(self, items):
+        """Write many (session_id, state) pairs in a single transaction."""
+        payloads = [(session_id, state, json.dumps(state)) for session_id, state in items]
+        updated_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        with self._lock:
+            self._check_external_writes()
+            case_delta = evidence_delta = 0
+            with self._conn:
+                for session_id, state, payload in payloads:
+                    previous = self._stored_evidence_count(session_id)
+                    self._conn.execute(self._SQL_SAVE, (session_id, payload, updated_at))
+                    self._write_case_rows(session_id, state, updated_at)
+                    self._write_index(session_id, state)
+                    self._write_search_text(session_id, state)
+                    self._write_media(session_id, state)
+                    num_evidence = len(state.get("case:aggregate", {}).get("evidence_items", []))
+                    if previous is None:
+                        case_delta += 1
+                    evidence_delta += num_evidence - (previous or 0)
+            self._apply_write(case_delta, evidence_delta)
 
     def get_session(self, session_id: str):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("SELECT state FROM sessions WHERE session_id = ?", (session_id,))
-        row = c.fetchone()
-        conn.close()
+        with self._lock:
+            row = self._conn.execute(self._SQL_GET, (session_id,)).fetchone()
         if row:
             return json.loads(row[0])
         return None
 
+    def get_revision(self, session_id: str):
+        """Save counter of a session (bumped on every save; a cheap cache key), or None if it doesn't exist."""
+        with self._lock:
+            row = self._conn.execute(self._SQL_GET_REVISION, (session_id,)).fetchone()
+        return row[0] if row else None
+
     def delete_session(self, session_id: str):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._check_external_writes()
+            with self._conn:
+                previous = self._stored_evidence_count(session_id)
+                self._conn.execute(self._SQL_DELETE, (session_id,))
+                self._conn.execute(self._SQL_DELETE_CASE, (session_id,))
+                self._conn.execute(self._SQL_DELETE_EVIDENCE, (session_id,))
+                self._conn.execute("DELETE FROM case_traces WHERE case_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM case_index WHERE case_id = ?", (session_id,))
+                self._conn.execute(self._SQL_DELETE_TEXT, (session_id,))
+                self._conn.execute(self._SQL_DELETE_MEDIA, (session_id,))
+            if previous is not None:
+                self._apply_write(-1, -(previous or 0))
+
+    def get_case_index(self, case_id):
+        """BM25 chunk index for a case; built and stored on first use for cases saved without one."""
+        with self._lock:
+            row = self._conn.execute(self._SQL_GET_INDEX, (case_id,)).fetchone()
+            if row and row[0] == retrieval.INDEX_VERSION:
+                return json.loads(row[1])
+            state = self.get_session(case_id)
+            if not state:
+                return None
+            with self._conn:
+                self._write_index(case_id, state)
+            row = self._conn.execute(self._SQL_GET_INDEX, (case_id,)).fetchone()
+        return json.loads(row[1])
+
+    def media_cases(self, digest):
+        """Ids of the cases that reference a blob-store digest (e.g. before removing the blob)."""
+        with self._lock:
+            return [r[0] for r in self._conn.execute(self._SQL_MEDIA_CASES, (digest,)).fetchall()]
+
+    def search_cases(self, query, limit=20):
+        """Full-text search across every case, best match first (no LLM involved).
+
+        Returns [{"case_id", "score", "snippet", "risk_score", "primary_weapon", "updated_at"}];
+        higher score is more relevant.
+        """
+        match = retrieval.fts_query(query)
+        if not match:
+            return []
+        with self._lock:
+            rows = self._conn.execute(self._SQL_SEARCH, (match, limit)).fetchall()
+        return [{"case_id": r[0], "score": -r[1], "snippet": " ".join(r[2].split()), "risk_score": r[3],
+                 "primary_weapon": r[4], "updated_at": r[5]} for r in rows]
 
     def list_sessions(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("SELECT session_id, state, updated_at FROM sessions ORDER BY updated_at DESC")
-        rows = c.fetchall()
-        conn.close()
+        with self._lock:
+            rows = self._conn.execute(self._SQL_LIST).fetchall()
         sessions = []
         for r in rows:
             try:
@@ -88,45 +361,175 @@ class CaseManager:
             })
         return sessions
 
-# Global instance
-case_manager = CaseManager()
+    # Columns exposed by list_cases: public name -> cases column
+    CASE_COLUMNS = {
+        "case_id": "case_id",
+        "risk_score": "risk_score",
+        "mem_primary_weapon": "primary_weapon",
+        "num_evidence": "num_evidence",
+        "updated_at": "updated_at",
+        "lat": "lat",
+        "lon": "lon"
+    }
+    _FILTER_OPS = {"=", "!=", "<", "<=", ">", ">=", "like"}
+    LIST_CACHE_SIZE = 64
+
+    def list_cases(self, limit=50, offset=None, columns=None, order_by="-updated_at", filters=None):
+        """Page through case summaries using only the indexed columns.
+
+        columns: subset of CASE_COLUMNS to return (default: all).
+        order_by: a CASE_COLUMNS name, prefixed with "-" for descending.
+        offset: a keyset cursor, i.e. the (order value, case_id) pair of the
+            last row of the previous page, or None for the first page. An int
+            falls back to plain OFFSET paging.
+        filters: {column: value} for equality (None matches NULL), or
+            {column: (op, value)} with op in =, !=, <, <=, >, >=, like.
+        """
+        columns = list(columns or self.CASE_COLUMNS)
+        for c in columns:
+            if c not in self.CASE_COLUMNS:
+                raise ValueError(f"Unknown case column: {c}")
+        descending = order_by.startswith("-")
+        order_key = order_by.lstrip("-")
+        if order_key not in self.CASE_COLUMNS:
+            raise ValueError(f"Unknown order column: {order_key}")
+        order_col = self.CASE_COLUMNS[order_key]
+        direction = "DESC" if descending else "ASC"
+
+        where, params = [], []
+        for name, cond in (filters or {}).items():
+            if name not in self.CASE_COLUMNS:
+                raise ValueError(f"Unknown filter column: {name}")
+            op, value = cond if isinstance(cond, tuple) else ("=", cond)
+            op = op.lower()
+            if op not in self._FILTER_OPS:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            col = self.CASE_COLUMNS[name]
+            if value is None and op in ("=", "!="):
+                where.append(f"{col} IS {'NOT ' if op == '!=' else ''}NULL")
+            else:
+                where.append(f"{col} {op.upper()} ?")
+                params.append(value)
+
+        paging = ""
+        if isinstance(offset, (tuple, list)):
+            cmp = "<" if descending else ">"
+            where.append(f"({order_col}, case_id) {cmp} (?, ?)")
+            params.extend(offset)
+        elif offset:
+            paging = " OFFSET ?"
+
+        sql = f"SELECT {', '.join(self.CASE_COLUMNS[c] for c in columns)} FROM cases"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order_col} {direction}, case_id {direction} LIMIT ?" + paging
+        params.append(int(limit))
+        if paging:
+            params.append(int(offset))
+        cache_key = (sql, tuple(params))
+        with self._lock:
+            self._check_external_writes()
+            rows = self._list_cache.get(cache_key)
+            if rows is None:
+                rows = self._conn.execute(sql, params).fetchall()
+                if len(self._list_cache) >= self.LIST_CACHE_SIZE:
+                    self._list_cache.clear()
+                self._list_cache[cache_key] = rows
+        return [dict(zip(columns, r)) for r in rows]
+
+    def case_stats(self):
+        """Total case count and summed evidence items (kept as running totals)."""
+        with self._lock:
+            self._check_external_writes()
+            if self._stats is None:
+                count, evidence = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(num_evidence), 0) FROM cases").fetchone()
+                self._stats = {"total_cases": count, "total_evidence": evidence}
+            return dict(self._stats)
+
+    def save_trace(self, case_id, trace):
+        """Store a tracing.Trace dict for a case run."""
+        durations = [sp["duration_ms"] for sp in trace["spans"] if sp["parent_id"] is None]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO case_traces (trace_id, case_id, name, created_at, duration_ms, trace) VALUES (?, ?, ?, ?, ?, ?)",
+                (trace["trace_id"], case_id, trace["name"], trace["start"], sum(durations), json.dumps(trace)))
+
+    def get_traces(self, case_id, limit=10):
+        """Most recent traces for a case, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT trace FROM case_traces WHERE case_id = ? ORDER BY created_at DESC LIMIT ?",
+                (case_id, limit)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def list_case_summaries(self):
+        """Per-case dashboard fields straight from the indexed columns (no JSON parsing)."""
+        with self._lock:
+            rows = self._conn.execute(self._SQL_LIST_CASES).fetchall()
+        return [{
+            "case_id": r[0],
+            "risk_score": r[1],
+            "mem_primary_weapon": r[2],
+            "num_evidence": r[3],
+            "updated_at": r[4],
+            "lat": r[5],
+            "lon": r[6]
+        } for r in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Global instances are created on first use (get_case_manager / get_response_cache,
+# or the module attributes case_manager / response_cache), so importing this
+# module touches no files.
+_case_manager = None
+_response_cache = None
+_instances_lock = threading.Lock()
+
+def get_case_manager():
+    global _case_manager
+    if _case_manager is None:
+        with _instances_lock:
+            if _case_manager is None:
+                _case_manager = CaseManager()
+    return _case_manager
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        with _instances_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(CACHE_DB_FILE, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES,
+                                                max_bytes=LLM_CACHE_MAX_BYTES, bypass=LLM_CACHE_BYPASS)
+    return _response_cache
+
+def __getattr__(name):
+    if name == "case_manager":
+        return get_case_manager()
+    if name == "response_cache":
+        return get_response_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Helper Functions ---
 def save_json(obj, filename):
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
     path = OUT_DIR / filename
     with open(path, "w", encoding="utf-8") as f:
         json.dump(obj, f, indent=2, ensure_ascii=False)
     return str(path)
 
 def write_markdown(text, filename="case_report.md"):
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
     path = OUT_DIR / filename
     path.write_text(text, encoding="utf-8")
     return str(path)
 
 def markdown_to_pdf(md_text, filename="case_report.pdf"):
+    """Render a PDF synchronously in this process (case reports go through csi_reports.submit)."""
     filename = filename.strip().replace("\n", "").replace("\r", "")
-    safe_text = (
-        md_text.replace("—", "-")
-               .replace("–", "-")
-               .replace("’", "'")
-               .replace("“", '"')
-               .replace("”", '"')
-    )
-    # Simple fix for utf-8 chars in FPDF
-    safe_text = safe_text.encode("latin-1", "ignore").decode("latin-1")
-
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    pdf.set_font("Arial", size=11)
-    pdf.multi_cell(0, 6, safe_text)
-    
-    out_path = OUT_DIR / filename
-    try:
-        pdf.output(str(out_path))
-    except:
-        pass 
-    return str(out_path)
+    return reports.render_pdf(md_text, OUT_DIR / filename)
 
 def get_random_coordinates():
     # Simulate crime locations (Fictional city spread)
@@ -136,110 +539,562 @@ def get_random_coordinates():
 
 # --- OpenRouter / Gemini Integration ---
 
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+class TokenBucket:
+    """Thread-safe token bucket; callers reserve a slot and sleep until it is due.
+
+    pause() empties the bucket and holds refills until a deadline (used for
+    Retry-After), so one 429 throttles all threads instead of each discovering
+    it separately, and callers queued behind it resume 1/rate apart.
+    """
+
+    def __init__(self, rate=RATE_LIMIT_RPS, burst=RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()  # refill clock; in the future while paused
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token; returns how long the caller must wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return wait + (self._updated - now)
+
+    def _refill(self):
+        now = time.monotonic()
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+        return now
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def aacquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def pause(self, seconds):
+        with self._lock:
+            now = self._refill()
+            # Slots already handed out stay owed; the bucket refills from the deadline
+            self._tokens = min(0.0, self._tokens)
+            self._updated = max(self._updated, now + seconds)
+
+def _retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class OpenRouterClient:
+    """Pooled keep-alive async HTTP client for OpenRouter calls.
 
+    Every request passes through a shared token bucket and is retried with
+    exponential backoff (honouring Retry-After) on 429/5xx and connection errors.
+    An httpx.AsyncClient is bound to the event loop it first runs on, so use
+    get_openrouter_client() rather than sharing one instance across loops.
+    """
+
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, max_keepalive=HTTP_MAX_KEEPALIVE,
+                 connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 limiter=None, max_attempts=RETRY_MAX_ATTEMPTS):
+        import httpx  # deferred: only needed once a request is made
+
+        self.limiter = limiter or rate_limiter
+        self.max_attempts = max(1, max_attempts)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            headers={
+                "Content-Type": "application/json",
+                "HTTP-Referer": "https://localhost:8501",
+                "X-Title": APP_NAME
+            }
+        )
+
+    async def post_chat(self, payload, timeout=None):
+        """POST a chat-completions payload, reusing pooled connections."""
+        data = json.dumps(payload).encode("utf-8")
+        with tracing.span("http:openrouter", model=payload.get("model"), bytes_sent=len(data), retries=0) as s:
+            response = await self._send(data, timeout, stream=False, s=s)
+            if s is not None:
+                s.set(bytes_received=len(response.content))
+            return response
+
+    async def stream_chat(self, payload, timeout=None):
+        """Stream a chat completion over SSE, yielding content deltas as they arrive.
+
+        Retries only happen before the first byte; a non-200 final response
+        raises httpx.HTTPStatusError, and a stream that ends before the model
+        finished (no [DONE] or finish_reason) raises ConnectionError.
+        """
+        data = json.dumps(dict(payload, stream=True)).encode("utf-8")
+        with tracing.span("http:openrouter_stream", model=payload.get("model"), bytes_sent=len(data), retries=0) as s:
+            started = time.perf_counter()
+            response = await self._send(data, timeout, stream=True, s=s)
+            try:
+                if response.status_code != 200:
+                    await response.aread()
+                    response.raise_for_status()
+                received = 0
+                finished = False
+                async for line in response.aiter_lines():
+                    received += len(line) + 1
+                    if not line.startswith("data:"):
+                        continue  # blank separators and ": keep-alive" comments
+                    chunk = line[5:].strip()
+                    if chunk == "[DONE]":
+                        finished = True
+                        break
+                    choices = json.loads(chunk).get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    finished = finished or bool(choices[0].get("finish_reason"))
+                    if delta:
+                        if s is not None and "first_token_ms" not in s.attrs:
+                            s.set(first_token_ms=round((time.perf_counter() - started) * 1000, 3))
+                        yield delta
+                if s is not None:
+                    s.set(bytes_received=received)
+                if not finished:
+                    raise ConnectionError("stream closed before the completion finished")
+            finally:
+                await response.aclose()
+
+    async def _send(self, data, timeout, stream, s):
+        import httpx
+
+        headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}"} if OPENROUTER_API_KEY else {}
+        for attempt in range(self.max_attempts):
+            last = attempt == self.max_attempts - 1
+            waited = await self.limiter.aacquire()
+            if s is not None and waited:
+                s.incr("rate_limited_ms", round(waited * 1000, 1))
+            request = self.client.build_request("POST", OPENROUTER_URL, headers=headers, content=data,
+                                                timeout=timeout or httpx.USE_CLIENT_DEFAULT)
+            try:
+                response = await self.client.send(request, stream=stream)
+            except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError):
+                if last:
+                    raise
+                delay = backoff_delay(attempt)
+            else:
+                if s is not None:
+                    s.set(http_status=response.status_code)
+                if response.status_code not in RETRY_STATUSES or last:
+                    return response
+                await response.aclose()
+                retry_after = _retry_after_seconds(response)
+                # One huge Retry-After would stall every caller sharing the limiter, so cap it
+                delay = min(retry_after, RETRY_MAX_DELAY) if retry_after is not None else backoff_delay(attempt)
+                if response.status_code == 429:
+                    self.limiter.pause(delay)
+            if s is not None:
+                s.set(retries=attempt + 1)
+            logger.info("OpenRouter request retry %d in %.1fs", attempt + 1, delay)
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+# Global instances
+rate_limiter = TokenBucket()
+_clients = weakref.WeakKeyDictionary()
+
+def get_openrouter_client():
+    """The OpenRouterClient for the running event loop (one pool per loop)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = OpenRouterClient()
+    return client
+
+# --- Event loop bridge ---
+# The sync API runs the async implementation on one long-lived background loop,
+# so connections stay pooled across calls and any number of threads can share it.
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def _background_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="csi-event-loop", daemon=True).start()
+        return _loop
+
+def _sync_loop():
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("Blocking call on the backend event loop; await the async API instead.")
+    return loop
+
+def run_sync(coro):
+    """Run a backend coroutine on the shared event loop and wait for its result.
+
+    The coroutine runs in a copy of the caller's context, so trace spans opened
+    by the caller stay its parents. Must not be called from that loop itself.
+    """
+    try:
+        loop = _sync_loop()
+    except RuntimeError:
+        coro.close()
+        raise
+    # call_soon_threadsafe copies the calling thread's context into the new task
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+def iterate_sync(agen):
+    """Iterate a backend async generator from sync code, item by item as produced."""
+    loop = _sync_loop()
+    items = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        finally:
+            items.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            yield item
+        future.result()  # re-raise anything the generator raised
+    finally:
+        future.cancel()  # consumer stopped early
 
 # --- OpenRouter integration (Strict) ---
 
 def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    """Base64 of the preprocessed image (downscaled, recompressed, metadata stripped)."""
+    return base64.b64encode(media.prepare_image(image_path).data).decode('utf-8')
+
+def _vision_cache_key(prepared):
+    return ResponseCache.make_key(OPENROUTER_MODEL, VISION_PROMPT, prepared.data)
+
+async def _prepare(image):
+    """PreparedImage for a path, preprocessed off the event loop (PreparedImage passes through)."""
+    if isinstance(image, media.PreparedImage):
+        return image
+    with tracing.span("media:prepare") as s:
+        prepared = await asyncio.to_thread(media.prepare_image, image)
+        if s is not None:
+            s.set(mime=prepared.mime, bytes_in=prepared.bytes_in, bytes_out=len(prepared.data))
+        return prepared
 
-def analyze_image_openrouter(image_path):
-    """Real Computer Vision using Gemini 2.0 Flash via OpenRouter"""
+async def _fingerprint(image):
+    if image is None:
+        return None
     try:
-        base64_image = encode_image(image_path)
-        
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://localhost:8501",
-            "X-Title": APP_NAME
+        return (await _prepare(image)).fingerprint
+    except Exception:
+        return None
+
+VISION_PROMPT = "Analyze this forensic image. Identify objects, signs of struggle, weapons, or forensic clues. Be concise but detailed."
+BATCH_VISION_PROMPT = (
+    "You will receive {n} forensic images, labelled Image 1 to Image {n}. For EACH image, "
+    "identify objects, signs of struggle, weapons, or forensic clues. Be concise but detailed.\n"
+    "Return a JSON array of exactly {n} strings, one analysis per image, in the order given. JSON ONLY."
+)
+
+def _image_part(prepared):
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:{prepared.mime};base64,{base64.b64encode(prepared.data).decode('utf-8')}"
         }
-        
-        # User requested specific model
-        model = "google/gemini-2.0-flash-exp:free"
-        
+    }
+
+@tracing.traced("llm:vision")
+async def aanalyze_image_openrouter(image_path, use_cache=True):
+    """Real Computer Vision using Gemini 2.0 Flash via OpenRouter; None if the analysis failed."""
+    try:
+        prepared = await _prepare(image_path)
+        cache_key = _vision_cache_key(prepared)
+        if use_cache:
+            cached = await get_response_cache().aget(cache_key)
+            tracing.record(cache_hit=cached is not None)
+            if cached is not None:
+                return cached
+
         payload = {
-            "model": model,
+            "model": OPENROUTER_MODEL,
             "messages": [
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": "Analyze this forensic image. Identify objects, signs of struggle, weapons, or forensic clues. Be concise but detailed."},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
+                        {"type": "text", "text": VISION_PROMPT},
+                        _image_part(prepared)
                     ]
                 }
             ]
         }
         
         try:
-            # 60 timeout for vision
-            response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=payload, timeout=60)
+            response = await get_openrouter_client().post_chat(payload)
             
             if response.status_code == 200:
                 data = response.json()
                 if 'choices' in data and len(data['choices']) > 0:
-                    return data['choices'][0]['message']['content']
-                else:
-                    return f"[Analysis Empty: {json.dumps(data)}]"
-            else:
-                return f"[Analysis Failed: {response.status_code} - {response.text}]"
+                    content = data['choices'][0]['message']['content']
+                    await get_response_cache().aput(cache_key, OPENROUTER_MODEL, content)
+                    return content
+
+            # As with acall_openrouter_text: a failure is None, never an error string
+            # that would be stored as the image's analysis.
+            logger.warning("OpenRouter vision call failed: %s - %s", response.status_code, response.text[:500])
+            return None
 
         except Exception as e:
-            return f"[Connection Error: {str(e)}]"
+            logger.warning("OpenRouter connection error: %s", e)
+            return None
             
     except Exception as e:
-        return f"[System Error: {str(e)}]"
+        logger.warning("Image analysis error: %s", e)
+        return None
 
-def call_openrouter_text(prompt):
-    """Text generation using Gemini 2.0 Flash via OpenRouter"""
+def analyze_image_openrouter(image_path, use_cache=True):
+    return run_sync(aanalyze_image_openrouter(image_path, use_cache))
+
+@tracing.traced("llm:vision_batch")
+async def aanalyze_image_batch_openrouter(image_paths, use_cache=True):
+    """Analyze several images in a single multimodal request.
+
+    Cached images are skipped; falls back to one request per image if the
+    packed answer cannot be split. Images that fail come back as None.
+    """
+    results = [None] * len(image_paths)
+    prepared = await asyncio.gather(*(_prepare(p) for p in image_paths), return_exceptions=True)
+    missing = []
+    for i, p in enumerate(prepared):
+        if isinstance(p, Exception):
+            logger.warning("Image preprocessing failed: %s", p)
+            continue
+        if use_cache:
+            results[i] = await get_response_cache().aget(_vision_cache_key(p))
+        if results[i] is None:
+            missing.append(i)
+    tracing.record(images=len(image_paths), cache_hits=sum(r is not None for r in results))
+    if missing:
+        analyses = await _analyze_uncached_batch([prepared[i] for i in missing], use_cache)
+        for i, a in zip(missing, analyses):
+            results[i] = a
+    return results
+
+def analyze_image_batch_openrouter(image_paths, use_cache=True):
+    return run_sync(aanalyze_image_batch_openrouter(image_paths, use_cache))
+
+async def _analyze_uncached_batch(image_paths, use_cache):
+    if len(image_paths) == 1:
+        return [await aanalyze_image_openrouter(image_paths[0], use_cache=False)]
     try:
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://localhost:8501", 
-            "X-Title": APP_NAME
+        content = [{"type": "text", "text": BATCH_VISION_PROMPT.format(n=len(image_paths))}]
+        for i, p in enumerate(image_paths):
+            content.append({"type": "text", "text": f"Image {i+1}:"})
+            content.append(_image_part(p))
+        payload = {
+            "model": OPENROUTER_MODEL,
+            "messages": [{"role": "user", "content": content}]
         }
-        
-        model = "google/gemini-2.0-flash-exp:free"
-        
+        response = await get_openrouter_client().post_chat(payload)
+        if response.status_code == 200:
+            data = response.json()
+            res = data['choices'][0]['message']['content']
+            res = res.replace("```json", "").replace("```", "").strip()
+            analyses = json.loads(res)
+            if isinstance(analyses, list) and len(analyses) == len(image_paths):
+                analyses = [str(a) for a in analyses]
+                for p, a in zip(image_paths, analyses):
+                    await get_response_cache().aput(_vision_cache_key(p), OPENROUTER_MODEL, a)
+                return analyses
+    except Exception:
+        pass
+    return [await aanalyze_image_openrouter(p, use_cache=False) for p in image_paths]
+
+async def aanalyze_images_openrouter(image_paths, max_workers=VISION_MAX_WORKERS,
+                                     images_per_request=VISION_IMAGES_PER_REQUEST, use_cache=True,
+                                     reference_images=()):
+    """Batched vision stage: at most max_workers image groups in flight at once.
+
+    Images are preprocessed first; perceptual duplicates of an earlier image
+    (including reference_images, the case's already-analyzed images, which
+    are numbered first; pass None for any whose analysis failed) are not sent.
+    Results come back in the original order, None where the analysis failed
+    (including duplicates of such an image).
+    """
+    if not image_paths:
+        return []
+    reference = await asyncio.gather(*(_fingerprint(p) for p in reference_images))
+    results, _ = await _analyze_images(image_paths, max_workers, images_per_request, use_cache, reference)
+    return results
+
+async def _analyze_images(image_paths, max_workers=VISION_MAX_WORKERS, images_per_request=VISION_IMAGES_PER_REQUEST,
+                          use_cache=True, reference=()):
+    """aanalyze_images_openrouter against stored reference fingerprints; returns (results, fingerprints).
+
+    The fingerprints (None where preprocessing failed) are kept in the case
+    state, so later updates never decode the case's earlier images again.
+    """
+    if not image_paths:
+        return [], []
+    prepared = await asyncio.gather(*(_prepare(p) for p in image_paths), return_exceptions=True)
+    reference = list(reference)
+    prints = [None if isinstance(p, Exception) else p.fingerprint for p in prepared]
+    duplicates = media.find_duplicates(reference + prints, start=len(reference))
+
+    results = [None] * len(image_paths)
+    todo = []
+    for i, (p, dup) in enumerate(zip(prepared, duplicates)):
+        if isinstance(p, Exception):
+            logger.warning("Image preprocessing failed: %s", p)
+        elif dup is not None:
+            results[i] = f"[Duplicate of Image {dup + 1} - skipped]"
+        else:
+            todo.append(i)
+    tracing.record(duplicates=sum(d is not None for d in duplicates))
+
+    per_request = max(1, images_per_request)
+    groups = [todo[i:i + per_request] for i in range(0, len(todo), per_request)]
+    limit = asyncio.Semaphore(max(1, max_workers))
+
+    async def analyze(group):
+        async with limit:
+            return await aanalyze_image_batch_openrouter([prepared[i] for i in group], use_cache)
+
+    analyses = await asyncio.gather(*(analyze(group) for group in groups))
+    for group, group_analyses in zip(groups, analyses):
+        for i, a in zip(group, group_analyses):
+            results[i] = a
+    for i, dup in enumerate(duplicates):
+        if dup is not None and dup >= len(reference) and results[dup - len(reference)] is None:
+            results[i] = None  # its original failed, so nothing was analyzed
+    return results, prints
+
+def analyze_images_openrouter(image_paths, max_workers=VISION_MAX_WORKERS,
+                              images_per_request=VISION_IMAGES_PER_REQUEST, use_cache=True,
+                              reference_images=()):
+    return run_sync(aanalyze_images_openrouter(image_paths, max_workers, images_per_request, use_cache,
+                                               reference_images))
+
+@tracing.traced("llm:text")
+async def acall_openrouter_text(prompt, use_cache=True):
+    """Text generation using Gemini 2.0 Flash via OpenRouter"""
+    try:
+        cache_key = ResponseCache.make_key(OPENROUTER_MODEL, prompt)
+        if use_cache:
+            cached = await get_response_cache().aget(cache_key)
+            tracing.record(cache_hit=cached is not None)
+            if cached is not None:
+                return cached
+
         payload = {
-            "model": model,
+            "model": OPENROUTER_MODEL,
             "messages": [{"role": "user", "content": prompt}]
         }
         
         try:
-            response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=payload, timeout=60)
+            response = await get_openrouter_client().post_chat(payload)
             
             if response.status_code == 200:
                 data = response.json()
                 if 'choices' in data and len(data['choices']) > 0:
-                    return data['choices'][0]['message']['content']
+                    content = data['choices'][0]['message']['content']
+                    await get_response_cache().aput(cache_key, OPENROUTER_MODEL, content)
+                    return content
             
-            return f"(Analysis Failed: {response.status_code} - {response.text})"
+            # Callers treat a falsy result as failure and fall back; never hand
+            # them an error string that could be parsed or stored as output.
+            logger.warning("OpenRouter text call failed: %s - %s", response.status_code, response.text[:500])
+            return None
             
         except Exception as e:
-            return f"(Connection Error: {str(e)})"
+            logger.warning("OpenRouter connection error: %s", e)
+            return None
 
     except Exception as e:
-        return f"(System Error: {str(e)})"
+        logger.warning("OpenRouter text call error: %s", e)
+        return None
 
-def generate_victim_profile(description, evidence):
+def call_openrouter_text(prompt, use_cache=True):
+    return run_sync(acall_openrouter_text(prompt, use_cache))
+
+async def acall_openrouter_text_stream(prompt, use_cache=True):
+    """Streaming text generation: yields text chunks as the model produces them.
+
+    A cached answer is yielded in one piece; only a completed stream is
+    cached. If the request fails or the stream breaks off, the error is
+    logged and re-raised after whatever text was already yielded, so callers
+    can tell a partial answer from a complete one.
+    """
+    with tracing.span("llm:text_stream") as s:
+        cache_key = ResponseCache.make_key(OPENROUTER_MODEL, prompt)
+        if use_cache:
+            cached = await get_response_cache().aget(cache_key)
+            tracing.record(cache_hit=cached is not None)
+            if cached is not None:
+                yield cached
+                return
+
+        payload = {
+            "model": OPENROUTER_MODEL,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        parts = []
+        try:
+            async for delta in get_openrouter_client().stream_chat(payload):
+                parts.append(delta)
+                yield delta
+        except Exception as e:
+            logger.warning("OpenRouter streaming call failed: %s", e)
+            if s is not None:
+                s.set(error=f"{type(e).__name__}: {e}")
+            raise
+        if parts:
+            await get_response_cache().aput(cache_key, OPENROUTER_MODEL, "".join(parts))
+
+def call_openrouter_text_stream(prompt, use_cache=True):
+    """Generator form of acall_openrouter_text_stream for synchronous callers."""
+    return iterate_sync(acall_openrouter_text_stream(prompt, use_cache))
+
+async def agenerate_victim_profile(description, evidence):
     """Generate Victimology Profile based on scene data"""
+    data = prompts.fit_sections([
+        prompts.Section("Description", description, 2),
+        prompts.Section("Evidence", prompts.slim_evidence(evidence), 1)
+    ], budget=prompts.EXTRACTION_TOKEN_BUDGET)
     prompt = f"""
     Based on the forensic data below, generate a 'Victim Profile'.
     Infer likely characteristics and risk level.
     
-    Description: {description}
-    Evidence: {evidence}
+    {data}
     
     Return valid JSON only in this format:
     {{
@@ -249,13 +1104,13 @@ def generate_victim_profile(description, evidence):
         "notes": "string"
     }}
     """
-    res = call_openrouter_text(prompt)
+    res = await acall_openrouter_text(prompt)
     if res:
         try:
             # clean json wrapper
             res = res.replace("```json", "").replace("```", "").strip()
             return json.loads(res)
-        except:
+        except Exception:
             pass
     
     return {
@@ -265,15 +1120,18 @@ def generate_victim_profile(description, evidence):
         "notes": "Insufficient data."
     }
 
+def generate_victim_profile(description, evidence):
+    return run_sync(agenerate_victim_profile(description, evidence))
+
 # --- Core Forensics Logic ---
 
-def extract_evidence_llm(description_text: str) -> dict:
+async def aextract_evidence_llm(description_text: str) -> dict:
     """Uses Gemini 2.0 Flash to extract structured evidence from text."""
     prompt = f"""
     Analyze this forensic log and visual description. Extract ALL potential evidence items, clues, and context.
     
     Input:
-    {description_text}
+    {prompts.fit_sections([prompts.Section(None, description_text, 1)], budget=prompts.EXTRACTION_TOKEN_BUDGET)}
     
     Return a JSON object with this key: "evidence_items" (list of objects).
     Each item must have:
@@ -284,12 +1142,12 @@ def extract_evidence_llm(description_text: str) -> dict:
     
     JSON ONLY.
     """
-    res = call_openrouter_text(prompt)
+    res = await acall_openrouter_text(prompt)
     if res:
         try:
             res = res.replace("```json", "").replace("```", "").strip()
             return json.loads(res)
-        except:
+        except Exception:
             pass
             
     # Fallback if LLM fails
@@ -301,6 +1159,9 @@ def extract_evidence_llm(description_text: str) -> dict:
             items.append({"type": v, "description": f"Detected {k}", "confidence": 0.7, "location": "scene"})
     return {"evidence_items": items}
 
+def extract_evidence_llm(description_text: str) -> dict:
+    return run_sync(aextract_evidence_llm(description_text))
+
 def analyze_weapon_and_injury(evidence_items: List[dict]) -> dict:
     w_list = []
     i_list = []
@@ -360,89 +1221,212 @@ def calculate_confidence(evidence_items):
 
 # --- Main Logic ---
 
-def run_full_investigation(scene_text: str, image_paths=None, case_id=None, api_key=None):
-    if case_id is None:
-        case_id = f"CASE-{uuid.uuid4().hex[:8]}"
-    if image_paths is None:
-        image_paths = []
+async def arun_stage_graph(stages, max_workers=PIPELINE_MAX_WORKERS, progress_callback=None):
+    """Run {name: (deps, fn)} stages as asyncio tasks, each as soon as its deps finish.
 
-    # 1. Real Computer Vision Analysis
-    image_analyses = []
-    for p in image_paths:
-        analysis = analyze_image_openrouter(p)
-        image_analyses.append(analysis)
-    
-    full_visual_context = "\n".join([f"[Image {i+1} Analysis]: {a}" for i, a in enumerate(image_analyses)])
-    
-    # 2. Combined Context
+    Each fn receives a snapshot of the results produced so far and returns a
+    value or an awaitable (blocking work should go through asyncio.to_thread).
+    At most max_workers stages run at once and ready stages start in insertion
+    order, so max_workers=1 reproduces the serial path. progress_callback(stage,
+    status) is called on the event loop with "pending" for every stage up front,
+    then "started" and "done"; an exception raised by the callback aborts the run.
+    """
+    notify = progress_callback or (lambda stage, status: None)
+    results = {}
+    pending = dict(stages)
+    running = {}
+    for name in stages:
+        notify(name, "pending")
+    try:
+        while pending or running:
+            for name in list(pending):
+                if len(running) >= max(1, max_workers):
+                    break
+                deps, fn = pending[name]
+                if all(d in results for d in deps):
+                    del pending[name]
+                    # Tasks copy the current context, so stage spans nest under the pipeline span
+                    task = asyncio.create_task(_run_stage(name, fn, dict(results)), name=f"stage:{name}")
+                    running[task] = name
+                    notify(name, "started")
+            if not running:
+                raise ValueError(f"Unresolvable stage dependencies: {sorted(pending)}")
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                results[name] = task.result()
+                notify(name, "done")
+    except BaseException:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        raise
+    return results
+
+def run_stage_graph(stages, max_workers=PIPELINE_MAX_WORKERS, progress_callback=None):
+    """Blocking form of arun_stage_graph (sync stage fns run on the event loop)."""
+    return run_sync(arun_stage_graph(stages, max_workers, progress_callback))
+
+async def _run_stage(name, fn, results):
+    with tracing.span(f"stage:{name}"):
+        result = fn(results)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+def _visual_lines(image_analyses, offset=0):
+    """Numbered analyses for the visual context; failed images (None) are left out."""
+    return "\n".join(f"[Image {offset+i+1} Analysis]: {a}" for i, a in enumerate(image_analyses) if a is not None)
+
+def _failed_images(image_analyses, offset=0):
+    return [offset + i for i, a in enumerate(image_analyses) if a is None]
+
+def _build_context(scene_text, image_analyses):
+    full_visual_context = _visual_lines(image_analyses)
     combined_context = f"Officer Log: {scene_text}\n\nVisual Forensics Data:\n{full_visual_context}"
-    
-    # 3. Evidence Extraction (LLM Powered)
-    evidence_data = extract_evidence_llm(combined_context)
+    return full_visual_context, combined_context
+
+async def _extract_evidence_items(combined_context):
+    evidence_data = await aextract_evidence_llm(combined_context)
     evidence_items = evidence_data.get("evidence_items", [])
     
     # Ensure confidence is float
     for item in evidence_items:
         item["confidence"] = float(item.get("confidence", 0.7))
+    return evidence_items
 
-    # 4. Weapon & Injury
-    weapon_result = analyze_weapon_and_injury(evidence_items)
-
-    # 5. Suspect Profiling
-    profile_result = generate_suspect_profiles({
-        "description": combined_context,
-        "evidence_items": evidence_items,
-        "weapons": weapon_result.get("weapons", [])
-    })
-    
-    # 6. Victim Profiling
-    victim_profile = generate_victim_profile(combined_context, evidence_items)
-
-    # 7. Timeline
-    timeline_result = reconstruct_timeline(evidence_items)
-    
-    # 8. GIS Mapping
-    lat, lon = get_random_coordinates()
-
-    # 9. Aggregate
-    aggregate = {
-        "case_id": case_id,
-        "description": combined_context, # Full text with visual logs
-        "visual_analysis": full_visual_context, # Dedicated field
-        "evidence_items": evidence_items,
-        "weapons": weapon_result.get("weapons", []),
-        "injuries": weapon_result.get("injuries", []),
-        "suspect_hypotheses": profile_result.get("suspect_hypotheses", []),
-        "victim_profile": victim_profile,
-        "timeline": timeline_result.get("timeline", []),
-        "gis_location": {"lat": lat, "lon": lon}
-    }
-
-    # 10. Executive Summary
+async def _write_summary(aggregate, on_text=None):
     prompt = f"""
     You are a senior forensic crime analyst.
     Write a sharp, professional forensic executive summary.
     
     Data:
-    {json.dumps(aggregate, indent=2, default=str)}
+    {prompts.fit_sections(prompts.case_sections(aggregate, prompts.SUMMARY_FIELDS))}
     """
     
-    summary_text = call_openrouter_text(prompt)
+    if on_text is None:
+        summary_text = await acall_openrouter_text(prompt)
+    else:
+        # Stream so partial text can be shown while the summary is still being written
+        summary_text = ""
+        try:
+            async for delta in acall_openrouter_text_stream(prompt):
+                summary_text += delta
+                on_text(summary_text)
+        except Exception:
+            # Never keep a summary that broke off mid-sentence: ask again without streaming
+            summary_text = await acall_openrouter_text(prompt)
+            if summary_text:
+                on_text(summary_text)
     if not summary_text:
         # Fallback if API fails
-        summary_text = f"Automated summary unavailable. Ensure Network/API connectivity.\nKey Findings: {len(evidence_items)} evidence items detected."
-            
+        summary_text = f"Automated summary unavailable. Ensure Network/API connectivity.\nKey Findings: {len(aggregate['evidence_items'])} evidence items detected."
+    return summary_text
+
+async def arun_full_investigation(scene_text: str, image_paths=None, case_id=None, api_key=None,
+                                  max_workers=PIPELINE_MAX_WORKERS, progress_callback=None, persist=True,
+                                  partial_callback=None):
+    """Run the full pipeline for one case.
+
+    progress_callback(stage, status) tracks stages (see arun_stage_graph);
+    if partial_callback(stage, text) is given, the executive summary is
+    streamed and the text so far is passed to it as it arrives.
+    """
+    if case_id is None:
+        case_id = f"CASE-{uuid.uuid4().hex[:8]}"
+    if image_paths is None:
+        image_paths = []
+
+    # Steps 1-12 as a dependency graph; independent stages run concurrently.
+    def build_aggregate(r):
+        full_visual_context, combined_context = r["context"]
+        lat, lon = r["gis"]
+        return {
+            "case_id": case_id,
+            "description": combined_context, # Full text with visual logs
+            "visual_analysis": full_visual_context, # Dedicated field
+            "evidence_items": r["evidence"],
+            "weapons": r["weapons"].get("weapons", []),
+            "injuries": r["weapons"].get("injuries", []),
+            "suspect_hypotheses": r["suspects"].get("suspect_hypotheses", []),
+            "victim_profile": r["victim"],
+            "timeline": r["timeline"].get("timeline", []),
+            "gis_location": {"lat": lat, "lon": lon}
+        }
+
+    stages = {
+        # 1. Real Computer Vision Analysis (batched, bounded worker pool)
+        "vision": ((), lambda r: _analyze_images(image_paths)),
+        # 2. Combined Context
+        "context": (("vision",), lambda r: _build_context(scene_text, r["vision"][0])),
+        # 3. Evidence Extraction (LLM Powered)
+        "evidence": (("context",), lambda r: _extract_evidence_items(r["context"][1])),
+        # 4. Weapon & Injury
+        "weapons": (("evidence",), lambda r: analyze_weapon_and_injury(r["evidence"])),
+        # 5. Suspect Profiling
+        "suspects": (("context", "evidence", "weapons"), lambda r: generate_suspect_profiles({
+            "description": r["context"][1],
+            "evidence_items": r["evidence"],
+            "weapons": r["weapons"].get("weapons", [])
+        })),
+        # 6. Victim Profiling (its prompt includes the extracted evidence)
+        "victim": (("context", "evidence"), lambda r: agenerate_victim_profile(r["context"][1], r["evidence"])),
+        # 7. Timeline
+        "timeline": (("evidence",), lambda r: reconstruct_timeline(r["evidence"])),
+        # 8. GIS Mapping
+        "gis": ((), lambda r: get_random_coordinates()),
+        # 9. Aggregate
+        "aggregate": (("context", "evidence", "weapons", "suspects", "victim", "timeline", "gis"), build_aggregate),
+        # 10. Executive Summary
+        "summary": (("aggregate",), lambda r: _write_summary(r["aggregate"], _partial_for("summary", partial_callback))),
+        # 11-12. Risk Score + Save to DB
+        "persist": (("vision", "aggregate", "summary"), lambda r: asyncio.to_thread(
+            _finalize_case, case_id, r["aggregate"], r["summary"], list(image_paths), persist,
+            _failed_images(r["vision"][0]), r["vision"][1])),
+    }
+    return await _run_traced("run_full_investigation", case_id, stages, max_workers, progress_callback,
+                             persist=persist, images=len(image_paths))
+
+def run_full_investigation(scene_text: str, image_paths=None, case_id=None, api_key=None,
+                           max_workers=PIPELINE_MAX_WORKERS, progress_callback=None, persist=True,
+                           partial_callback=None):
+    return run_sync(arun_full_investigation(scene_text, image_paths, case_id, api_key,
+                                            max_workers, progress_callback, persist, partial_callback))
+
+def _partial_for(stage, partial_callback):
+    if partial_callback is None:
+        return None
+    return lambda text: partial_callback(stage, text)
+
+async def _run_traced(name, case_id, stages, max_workers, progress_callback, persist=True, **attrs):
+    """Run a pipeline graph under a new trace and store the trace with the case (unless persist is False)."""
+    with tracing.start_trace(name, case_id=case_id, **attrs) as trace:
+        with tracing.span(f"pipeline:{name}"):
+            result = (await arun_stage_graph(stages, max_workers=max_workers,
+                                             progress_callback=progress_callback))["persist"]
+    trace_dict = trace.to_dict()
+    if persist:
+        await asyncio.to_thread(get_case_manager().save_trace, case_id, trace_dict)
+    result["trace_id"] = trace_dict["trace_id"]
+    return result
+
+def _finalize_case(case_id, aggregate, summary_text, images, persist=True, failed_images=(), fingerprints=None):
     aggregate["executive_summary"] = summary_text
+    aggregate["risk_score"] = calculate_risk_score(aggregate)
+    if not persist:
+        return {"case_id": case_id, "aggregate": aggregate, "json_path": None, "pdf_path": None,
+                "failed_images": list(failed_images), "fingerprints": fingerprints}
+    return _persist_case(case_id, aggregate, images, failed_images, fingerprints)
 
-    # 11. Risk Score (Adjusted Thresholds)
+def calculate_risk_score(aggregate):
+    """Risk score 0-10 (Adjusted Thresholds)"""
     score = 0
     # Base score on evidence count
-    score += min(len(evidence_items), 4) 
+    score += min(len(aggregate["evidence_items"]), 4) 
     
     # Weapon lethality (Adjusted for higher sensitivity)
     weapons = aggregate["weapons"]
     if weapons:
-        w_conf = weapons[0].get("confidence", 0)
         if weapons[0]["weapon"] == "firearm": score += 6
         elif weapons[0]["weapon"] == "bladed_object": score += 4
         else: score += 2
@@ -452,21 +1436,54 @@ def run_full_investigation(scene_text: str, image_paths=None, case_id=None, api_
     if injuries and injuries[0]["injury"] != "none_detected":
         score += 3
         
-    aggregate["risk_score"] = min(score, 10)
+    return min(score, 10)
 
-    # 12. Save to DB
-    case_manager_local = CaseManager()
-    case_manager_local.save_session(case_id, {
+def case_state(aggregate, images, failed_images=(), fingerprints=None):
+    """Session state stored in CaseManager for a finished case.
+
+    failed_images are indexes into images whose analysis failed; updates
+    don't treat re-uploads of those as already analyzed. fingerprints are
+    the images' dedupe fingerprints (see csi_media.prepare_image), parallel
+    to images.
+    """
+    state = {
         "case:aggregate": aggregate,
         "case:risk_score": aggregate["risk_score"],
-        "case:summary": aggregate["executive_summary"]
-    })
-    
-    out_json = save_json(aggregate, f"{case_id}.json")
-    try:
-        pdf_path = markdown_to_pdf(f"Case Report: {case_id}\n\n{aggregate['executive_summary']}", f"{case_id}.pdf")
-    except:
-        pdf_path = None
+        "case:summary": aggregate["executive_summary"],
+        "case:images": images,
+        "case:failed_images": list(failed_images)
+    }
+    if fingerprints is not None:
+        state["case:fingerprints"] = list(fingerprints)
+    return state
+
+# Error strings older versions stored as image analyses
+_LEGACY_VISION_ERROR = re.compile(r"^\[Image (\d+) Analysis\]: \[(?:Analysis Failed|Analysis Empty|Connection Error|System Error)",
+                                  re.MULTILINE)
+
+def stored_failed_images(state):
+    """Indexes of a stored case's images that have no analysis."""
+    if "case:failed_images" in state:
+        return state["case:failed_images"]
+    visual = state.get("case:aggregate", {}).get("visual_analysis", "")
+    return [int(n) - 1 for n in _LEGACY_VISION_ERROR.findall(visual)]
+
+def write_case_files(case_id, aggregate):
+    """Write the JSON output and queue the PDF report for a case; returns (json_path, pdf_path).
+
+    The PDF is rendered in the report process pool (skipped when an identical
+    report exists), so it may not be on disk yet; see csi_reports.ensure_pdf.
+    """
+    with tracing.span("file:save_json"):
+        out_json = save_json(aggregate, f"{case_id}.json")
+    with tracing.span("report:submit"):
+        pdf_path = reports.submit(case_id, aggregate)
+    return out_json, str(pdf_path)
+
+def _persist_case(case_id, aggregate, images, failed_images=(), fingerprints=None):
+    with tracing.span("sqlite:save_session"):
+        get_case_manager().save_session(case_id, case_state(aggregate, images, failed_images, fingerprints))
+    out_json, pdf_path = write_case_files(case_id, aggregate)
         
     return {
         "case_id": case_id,
@@ -475,42 +1492,194 @@ def run_full_investigation(scene_text: str, image_paths=None, case_id=None, api_
         "pdf_path": pdf_path
     }
 
-def ask_memory_helper(query, case_id):
-    state = case_manager.get_session(case_id)
-    if not state: 
-        return "Case data not found."
+def _split_context(aggregate):
+    """Recover (scene_text, visual_context) from a stored aggregate."""
+    description = aggregate.get("description", "")
+    visual = aggregate.get("visual_analysis", "")
+    head = "Officer Log: "
+    tail = f"\n\nVisual Forensics Data:\n{visual}"
+    if description.startswith(head) and description.endswith(tail):
+        return description[len(head):len(description) - len(tail)], visual
+    return description, visual
+
+def _evidence_key(item):
+    return tuple(str(item.get(k, "")).strip().lower() for k in ("type", "description", "location"))
+
+def merge_evidence(existing, new_items):
+    """Append new evidence items, dropping duplicates (keeps the higher confidence)."""
+    merged = [dict(e) for e in existing]
+    index = {_evidence_key(e): i for i, e in enumerate(merged)}
+    for item in new_items:
+        key = _evidence_key(item)
+        if key in index:
+            old = merged[index[key]]
+            old["confidence"] = max(old.get("confidence", 0.0), item["confidence"])
+        else:
+            index[key] = len(merged)
+            merged.append(item)
+    return merged
+
+async def aupdate_investigation(case_id, new_notes="", new_images=None, max_workers=PIPELINE_MAX_WORKERS,
+                               progress_callback=None, partial_callback=None):
+    """Fold new notes and images into a stored case.
+
+    Only the new images are analyzed and evidence is extracted from the new
+    material alone; derived stages are recomputed only when their inputs
+    changed.
+    """
+    state = await asyncio.to_thread(get_case_manager().get_session, case_id)
+    if not state or "case:aggregate" not in state:
+        raise ValueError(f"Case not found: {case_id}")
+    old = state["case:aggregate"]
+    new_notes = (new_notes or "").strip()
+    new_images = list(new_images or [])
+    known_images = state.get("case:images")
+    if known_images is None:
+        known_images = [None] * len(re.findall(r"\[Image \d+ Analysis\]", old.get("visual_analysis", "")))
+    known_failed = stored_failed_images(state)
+    known_prints = state.get("case:fingerprints")
+
+    if not new_notes and not new_images:
+        return {
+            "case_id": case_id,
+            "aggregate": old,
+            "json_path": str(OUT_DIR / f"{case_id}.json"),
+            "pdf_path": str(reports.pdf_path(case_id, old))
+        }
+
+    scene_text, visual = _split_context(old)
+    offset = len(known_images)
+    if known_prints is None or len(known_prints) != len(known_images):
+        # Cases saved before fingerprints were stored: decode their images once
+        known_prints = list(await asyncio.gather(*(_fingerprint(p) for p in known_images)))
+    # Only successfully analyzed images count as "already seen" for duplicate detection
+    reference = [None if i in known_failed else fp for i, fp in enumerate(known_prints)]
+
+    def build_context(r):
+        new_visual = _visual_lines(r["vision"][0], offset)
+        delta_context = f"Officer Log: {new_notes}\n\nVisual Forensics Data:\n{new_visual}"
+        log = f"{scene_text}\n\n[UPDATED LOG]: {new_notes}" if new_notes else scene_text
+        full_visual = "\n".join(v for v in (visual, new_visual) if v)
+        combined = f"Officer Log: {log}\n\nVisual Forensics Data:\n{full_visual}"
+        return full_visual, combined, delta_context
+
+    def merge(r):
+        merged = merge_evidence(old.get("evidence_items", []), r["evidence"])
+        return merged, merged != old.get("evidence_items", [])
+
+    def derived(fn, key):
+        def stage(r):
+            evidence_items, changed = r["merged"]
+            if not changed:
+                return old.get(key)
+            return fn(r, evidence_items)
+        return stage
+
+    def build_aggregate(r):
+        full_visual, combined, _ = r["context"]
+        evidence_items, changed = r["merged"]
+        aggregate = dict(old)
+        aggregate.update({
+            "description": combined,
+            "visual_analysis": full_visual,
+            "evidence_items": evidence_items,
+            "victim_profile": r["victim"]
+        })
+        if changed:
+            aggregate.update({
+                "weapons": r["weapons"].get("weapons", []),
+                "injuries": r["weapons"].get("injuries", []),
+                "suspect_hypotheses": r["suspects"].get("suspect_hypotheses", []),
+                "timeline": r["timeline"].get("timeline", [])
+            })
+        aggregate.pop("executive_summary", None)
+        aggregate.pop("risk_score", None)
+        return aggregate
+
+    stages = {
+        "vision": ((), lambda r: _analyze_images(new_images, reference=reference)),
+        "context": (("vision",), build_context),
+        "evidence": (("context",), lambda r: _extract_evidence_items(r["context"][2])),
+        "merged": (("evidence",), merge),
+        "weapons": (("merged",), derived(lambda r, ev: analyze_weapon_and_injury(ev), "weapons")),
+        "suspects": (("merged", "weapons"), derived(lambda r, ev: generate_suspect_profiles({
+            "description": r["context"][1],
+            "evidence_items": ev,
+            "weapons": r["weapons"].get("weapons", [])
+        }), "suspect_hypotheses")),
+        "timeline": (("merged",), derived(lambda r, ev: reconstruct_timeline(ev), "timeline")),
+        # The description always changes here, so the victim profile is re-run.
+        "victim": (("context", "merged"), lambda r: agenerate_victim_profile(r["context"][1], r["merged"][0])),
+        "aggregate": (("context", "merged", "weapons", "suspects", "timeline", "victim"), build_aggregate),
+        "summary": (("aggregate",), lambda r: _write_summary(r["aggregate"], _partial_for("summary", partial_callback))),
+        "persist": (("vision", "aggregate", "summary"), lambda r: asyncio.to_thread(
+            _finalize_case, case_id, r["aggregate"], r["summary"], known_images + new_images, True,
+            list(known_failed) + _failed_images(r["vision"][0], offset), known_prints + r["vision"][1])),
+    }
+    return await _run_traced("update_investigation", case_id, stages, max_workers, progress_callback,
+                             images=len(new_images))
+
+def update_investigation(case_id, new_notes="", new_images=None, max_workers=PIPELINE_MAX_WORKERS,
+                         progress_callback=None, partial_callback=None):
+    return run_sync(aupdate_investigation(case_id, new_notes, new_images, max_workers, progress_callback,
+                                          partial_callback))
+
+async def _memory_prompt(query, case_id):
+    index = await asyncio.to_thread(get_case_manager().get_case_index, case_id)
+    if index is None: 
+        return None
     
-    agg = state.get("case:aggregate", {})
-    prompt = f"""
+    # Only the chunks relevant to the query, so the prompt stays bounded as the case grows
+    hits = retrieval.search(index, query, k=retrieval.MEMORY_TOP_K)
+    tracing.record(chunks=len(index["chunks"]), chunks_sent=len(hits))
+    rank = {id(h): r for r, h in enumerate(sorted(hits, key=lambda h: -h["score"]), start=1)}
+    sections = [prompts.Section(h["field"].replace("_", " ").title(), h["text"], rank[id(h)]) for h in hits]
+    return f"""
     Answer the user query based ONLY on this forensic case data.
     
     Query: {query}
     
-    Case Data:
-    {json.dumps(agg, default=str)}
+    Case Data ({case_id}, most relevant excerpts):
+    {prompts.fit_sections(sections)}
     """
-    return call_openrouter_text(prompt) or "Analysis failed."
+
+async def aask_memory(query, case_id):
+    prompt = await _memory_prompt(query, case_id)
+    if prompt is None:
+        return "Case data not found."
+    return await acall_openrouter_text(prompt) or "Analysis failed."
+
+def ask_memory_helper(query, case_id):
+    return run_sync(aask_memory(query, case_id))
+
+async def aask_memory_stream(query, case_id):
+    """Streaming aask_memory: yields the answer in chunks as it is generated."""
+    prompt = await _memory_prompt(query, case_id)
+    if prompt is None:
+        yield "Case data not found."
+        return
+    answered = False
+    try:
+        async for delta in acall_openrouter_text_stream(prompt):
+            answered = True
+            yield delta
+    except Exception:
+        yield "\n\n[Answer interrupted - please retry.]" if answered else "Analysis failed."
+        return
+    if not answered:
+        yield "Analysis failed."
+
+def ask_memory_stream(query, case_id):
+    return iterate_sync(aask_memory_stream(query, case_id))
 
 def list_all_cases_df():
-    sessions = case_manager.list_sessions()
-    data = []
-    for s in sessions:
-        agg = s["state"].get("case:aggregate", {})
-        
-        # Safe extraction of weapon
-        w_list = agg.get("weapons", [])
-        w_main = w_list[0]["weapon"] if w_list else "Unknown"
-        
-        # safely get location
-        loc = agg.get("gis_location", {})
-        
-        data.append({
-            "case_id": s["session_id"],
-            "risk_score": s["state"].get("case:risk_score", 0),
-            "mem_primary_weapon": w_main,
-            "num_evidence": len(agg.get("evidence_items", [])),
-            "updated_at": s["updated_at"],
-            "lat": loc.get("lat", None),
-            "lon": loc.get("lon", None)
-        })
-    return pd.DataFrame(data)
+    import pandas as pd  # deferred: only the dashboards need it
+
+    return pd.DataFrame(get_case_manager().list_case_summaries())
+
+def list_cases_df(**kwargs):
+    """DataFrame over CaseManager.list_cases (same arguments)."""
+    import pandas as pd
+
+    columns = kwargs.get("columns") or list(CaseManager.CASE_COLUMNS)
+    return pd.DataFrame(get_case_manager().list_cases(**kwargs), columns=columns)
@@ -0,0 +1,238 @@
+"""Headless batch investigation of scene-log corpora.
+
+Usage:
+    python csi_batch.py cases.jsonl --workers 4
+    python csi_batch.py archive.csv --checkpoint archive.ckpt.jsonl
+
+Each record needs a scene text ("scene_text", "text" or "scene") and may carry
+"image_paths" (a list, or a ";"-separated string in CSV) and a "case_id".
+Relative image paths are resolved against the input file's directory.
+Finished cases are appended to a checkpoint file, so a re-run skips them.
+Malformed JSONL lines are logged, recorded in the checkpoint as "invalid" and
+skipped; they are parsed again on every run, so a corrected line is picked up.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()  # before csi_backend reads its configuration from the environment
+
+import csi_backend as csi
+import csi_reports as reports
+
+TEXT_FIELDS = ("scene_text", "text", "scene")
+
+
+def read_records(input_path, on_error=None):
+    """Yield (line_no, record) pairs from a JSONL or CSV file, lazily.
+
+    A JSONL line that is not a JSON object is passed to on_error(line_no, error)
+    and skipped; without on_error the error is raised.
+    """
+    path = Path(input_path)
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            for i, row in enumerate(csv.DictReader(f), start=1):
+                yield i, row
+        else:
+            for i, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    if not isinstance(record, dict):
+                        raise ValueError(f"expected a JSON object, got {type(record).__name__}")
+                except ValueError as e:
+                    if on_error is None:
+                        raise
+                    on_error(i, e)
+                    continue
+                yield i, record
+
+
+def normalize_record(record, base_dir):
+    """Return (case_id, scene_text, image_paths) for a raw input record."""
+    scene_text = next((record[k] for k in TEXT_FIELDS if record.get(k)), "")
+    images = record.get("image_paths") or []
+    if isinstance(images, str):
+        images = [p.strip() for p in images.split(";") if p.strip()]
+    image_paths = []
+    for p in images:
+        p = Path(p)
+        image_paths.append(str(p if p.is_absolute() else base_dir / p))
+    case_id = record.get("case_id")
+    if not case_id:
+        # Deterministic id so a resumed run maps the record to the same case
+        digest = hashlib.sha256(json.dumps([scene_text, images]).encode("utf-8")).hexdigest()
+        case_id = f"CASE-{digest[:8]}"
+    return case_id, scene_text, image_paths
+
+
+def load_checkpoint(checkpoint_path, log=print):
+    """Case ids the checkpoint records as done; unreadable entries are logged and ignored."""
+    done = set()
+    path = Path(checkpoint_path)
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for i, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None  # e.g. a torn last line after a crash
+                if not isinstance(entry, dict):
+                    log(f"[checkpoint] line {i}: unreadable entry ignored")
+                    continue
+                if entry.get("status") == "done" and entry.get("case_id"):
+                    done.add(entry["case_id"])
+    return done
+
+
+class BatchWriter:
+    """Buffers finished cases and writes them to CaseManager/csi_output in bulk."""
+
+    def __init__(self, checkpoint_path, flush_every=50, write_pdf=True):
+        self.flush_every = flush_every
+        self.write_pdf = write_pdf
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._checkpoint = open(checkpoint_path, "a+", encoding="utf-8")
+        if self._checkpoint.tell():
+            self._checkpoint.seek(self._checkpoint.tell() - 1)
+            if self._checkpoint.read(1) != "\n":
+                self._checkpoint.write("\n")  # start after a torn last line, not on it
+
+    def add(self, case_id, aggregate, image_paths, failed_images=(), fingerprints=None):
+        with self._lock:
+            self._buffer.append((case_id, aggregate, image_paths, failed_images, fingerprints))
+            if len(self._buffer) >= self.flush_every:
+                self._flush()
+
+    def fail(self, case_id, error):
+        with self._lock:
+            self._record({"case_id": case_id, "status": "failed", "error": error})
+            self._checkpoint.flush()
+
+    def invalid(self, line_no, error):
+        """Record an input line that could not be parsed."""
+        with self._lock:
+            self._record({"line": line_no, "status": "invalid", "error": error})
+            self._checkpoint.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+        self._checkpoint.close()
+        if self.write_pdf:
+            reports.drain()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        csi.case_manager.save_sessions([(case_id, csi.case_state(agg, images, failed, prints))
+                                        for case_id, agg, images, failed, prints in self._buffer])
+        for case_id, agg, _, _, _ in self._buffer:
+            if self.write_pdf:
+                csi.write_case_files(case_id, agg)
+            else:
+                csi.save_json(agg, f"{case_id}.json")
+        # Checkpoint only after the cases are durably stored
+        for case_id, _, _, _, _ in self._buffer:
+            self._record({"case_id": case_id, "status": "done"})
+        self._checkpoint.flush()
+        self._buffer = []
+
+    def _record(self, entry):
+        self._checkpoint.write(json.dumps(entry) + "\n")
+
+
+def run_batch(input_path, checkpoint_path=None, workers=4, stage_workers=csi.PIPELINE_MAX_WORKERS,
+              flush_every=50, write_pdf=True, limit=None, log=print):
+    """Investigate every record in input_path; returns a stats dict."""
+    input_path = Path(input_path)
+    checkpoint_path = checkpoint_path or str(input_path) + ".checkpoint.jsonl"
+    finished = load_checkpoint(checkpoint_path, log)
+    writer = BatchWriter(checkpoint_path, flush_every=flush_every, write_pdf=write_pdf)
+    stats = {"done": 0, "failed": 0, "skipped": 0}
+    stats_lock = threading.Lock()
+    started = time.time()
+
+    def investigate(case_id, scene_text, image_paths):
+        t0 = time.time()
+        try:
+            res = csi.run_full_investigation(scene_text, image_paths, case_id=case_id,
+                                             max_workers=stage_workers, persist=False)
+            writer.add(case_id, res["aggregate"], image_paths, res["failed_images"], res.get("fingerprints"))
+            with stats_lock:
+                stats["done"] += 1
+            log(f"[done] {case_id} ({time.time() - t0:.1f}s)")
+        except Exception as e:
+            writer.fail(case_id, f"{type(e).__name__}: {e}")
+            with stats_lock:
+                stats["failed"] += 1
+            log(f"[failed] {case_id}: {e}")
+
+    def invalid_line(line_no, error):
+        log(f"[skip] line {line_no}: invalid record ({error})")
+        writer.invalid(line_no, str(error))
+        stats["skipped"] += 1
+
+    seen = set()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            in_flight = set()
+            for line_no, record in read_records(input_path, on_error=invalid_line):
+                if limit is not None and len(seen) >= limit:
+                    break
+                case_id, scene_text, image_paths = normalize_record(record, input_path.parent)
+                if case_id in finished or case_id in seen:
+                    stats["skipped"] += 1
+                    continue
+                if not scene_text:
+                    log(f"[skip] line {line_no}: no scene text")
+                    stats["skipped"] += 1
+                    continue
+                seen.add(case_id)
+                # Bounded window so huge corpora are never fully materialized
+                if len(in_flight) >= workers * 2:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                in_flight.add(pool.submit(investigate, case_id, scene_text, image_paths))
+    finally:
+        writer.close()
+    stats["elapsed_s"] = round(time.time() - started, 2)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk crime-scene investigation from JSONL/CSV.")
+    parser.add_argument("input", help="JSONL or CSV file of scene logs")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <input>.checkpoint.jsonl)")
+    parser.add_argument("--workers", type=int, default=4, help="cases investigated concurrently")
+    parser.add_argument("--stage-workers", type=int, default=csi.PIPELINE_MAX_WORKERS,
+                        help="concurrent stages inside one case")
+    parser.add_argument("--flush-every", type=int, default=50, help="cases per bulk database write")
+    parser.add_argument("--no-pdf", action="store_true", help="write JSON only")
+    parser.add_argument("--limit", type=int, help="stop after this many new cases")
+    args = parser.parse_args(argv)
+
+    stats = run_batch(args.input, args.checkpoint, workers=args.workers, stage_workers=args.stage_workers,
+                      flush_every=args.flush_every, write_pdf=not args.no_pdf, limit=args.limit)
+    print(json.dumps(stats))
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
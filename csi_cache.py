@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """Persistent content-addressed cache for LLM responses.
+
+    Entries are keyed on hash(model, prompt, image bytes), expire after
+    `ttl` seconds and are evicted least-recently-used once the cache grows
+    past `max_entries` rows or `max_bytes` of stored text.
+    """
+
+    def __init__(self, db_path, ttl=7 * 24 * 3600, max_entries=5000,
+                 max_bytes=256 * 1024 * 1024, bypass=False):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS llm_cache
+                     (key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER,
+                      created_at REAL, accessed_at REAL)''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, prompt, *blobs):
+        h = hashlib.sha256()
+        for part in (model, prompt):
+            data = part.encode("utf-8")
+            h.update(len(data).to_bytes(8, "big"))
+            h.update(data)
+        for blob in blobs:
+            h.update(len(blob).to_bytes(8, "big"))
+            h.update(blob)
+        return h.hexdigest()
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss (or when bypassed)."""
+        if self.bypass:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?",
+                                     (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now))
+            self._evict(now)
+            self._conn.commit()
+
+    async def aget(self, key):
+        """get() for coroutines: the SQLite read/touch runs in a worker thread."""
+        if self.bypass:
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key, model, response):
+        """put() for coroutines: the insert and eviction run in a worker thread."""
+        await asyncio.to_thread(self.put, key, model, response)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at ASC")
+        stale = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            stale.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+        self.evictions += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": count,
+            "bytes": total
+        }
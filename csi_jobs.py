@@ -0,0 +1,308 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import csi_backend as csi
+
+# --- Configuration ---
+# Own file so job bookkeeping never bumps csi_app.db's data_version (which
+# invalidates the CaseManager listing caches)
+JOBS_DB_FILE = str(Path(csi.DB_FILE).with_name("csi_jobs.db"))
+JOB_WORKERS = int(os.getenv("CSI_JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("CSI_JOB_POLL_INTERVAL", "0.5"))
+JOB_PARTIAL_INTERVAL = float(os.getenv("CSI_JOB_PARTIAL_INTERVAL", "0.25"))  # min seconds between streamed-text writes
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("CSI_JOB_HEARTBEAT_INTERVAL", "5"))
+JOB_OWNER_TIMEOUT = float(os.getenv("CSI_JOB_OWNER_TIMEOUT", "30"))  # a queue silent this long is gone
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class JobQueue:
+    """Investigation job queue stored in SQLite and drained by background threads.
+
+    Jobs survive restarts: each queue claims jobs under an owner token unique
+    to this run and keeps it alive with a heartbeat, and any job left
+    "running" under a token without a recent heartbeat is put back in the
+    queue (PIDs are not used, as they are reused after a restart). Progress and partial
+    text reported from the pipeline's event loop are written by a single
+    writer thread, so the loop never waits on a commit.
+    """
+
+    def __init__(self, db_path=JOBS_DB_FILE, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+        self.db_path = db_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csi-job-writer")
+        self._cancelled = {}  # job_id -> threading.Event for jobs running in this process
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self._conn = sqlite3.connect(db_path, check_same_thread=False,
+                                     timeout=csi.SQLITE_BUSY_TIMEOUT_MS / 1000)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                         (job_id TEXT PRIMARY KEY, kind TEXT, status TEXT, params TEXT,
+                          stage TEXT, progress TEXT, result TEXT, error TEXT, owner TEXT,
+                          cancel_requested INTEGER DEFAULT 0, created_at REAL, updated_at REAL, partial TEXT)''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS job_owners (owner TEXT PRIMARY KEY, heartbeat REAL)")
+
+    # --- Public API ---
+    def submit(self, scene_text, image_paths=None, case_id=None):
+        """Queue a new investigation; returns the job id."""
+        if case_id is None:
+            case_id = f"CASE-{uuid.uuid4().hex[:8]}"
+        return self._enqueue("investigate", {
+            "scene_text": scene_text,
+            "image_paths": list(image_paths or []),
+            "case_id": case_id
+        })
+
+    def submit_update(self, case_id, new_notes="", new_images=None):
+        """Queue an incremental update of an existing case; returns the job id."""
+        return self._enqueue("update", {
+            "case_id": case_id,
+            "new_notes": new_notes,
+            "new_images": list(new_images or [])
+        })
+
+    def status(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, status, params, stage, progress, error, created_at, updated_at, partial FROM jobs WHERE job_id = ?",
+                (job_id,)).fetchone()
+        if not row:
+            return None
+        progress = json.loads(row[4] or "{}")
+        return {
+            "job_id": job_id,
+            "kind": row[0],
+            "status": row[1],
+            "case_id": json.loads(row[2]).get("case_id"),
+            "stage": row[3],
+            "stages": progress,
+            "fraction": (sum(1 for s in progress.values() if s == "done") / len(progress)) if progress else 0.0,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+            "partial": json.loads(row[8] or "{}")  # {stage: text so far} while a stage streams
+        }
+
+    def result(self, job_id, timeout=0):
+        """Return the finished investigation result, waiting up to `timeout` seconds.
+
+        Returns None while the job is still queued or running; raises
+        RuntimeError if it failed or was cancelled.
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self._lock:
+                row = self._conn.execute("SELECT status, result, error FROM jobs WHERE job_id = ?",
+                                         (job_id,)).fetchone()
+            if not row:
+                raise KeyError(job_id)
+            status, result, error = row
+            if status == DONE:
+                result = json.loads(result)
+                state = csi.case_manager.get_session(result["case_id"]) or {}
+                result["aggregate"] = state.get("case:aggregate", {})
+                return result
+            if status in (FAILED, CANCELLED):
+                raise RuntimeError(f"Job {job_id} {status}: {error or ''}".strip())
+            if time.time() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or ask a running one to stop at its next stage boundary."""
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+                                     (CANCELLED, now, job_id, QUEUED))
+            if cur.rowcount:
+                return True
+            cur = self._conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE job_id = ? AND status = ?",
+                                     (now, job_id, RUNNING))
+            event = self._cancelled.get(job_id)
+        if cur.rowcount and event is not None:
+            event.set()
+        return bool(cur.rowcount)
+
+    def list_jobs(self, limit=20, statuses=None):
+        sql = "SELECT job_id FROM jobs"
+        params = []
+        if statuses:
+            sql += f" WHERE status IN ({', '.join('?' * len(statuses))})"
+            params.extend(statuses)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute(sql, params).fetchall()]
+        return [self.status(j) for j in ids]
+
+    def start(self):
+        """Start worker threads (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            self._heartbeat()
+            self._requeue_orphans()
+            t = threading.Thread(target=self._keep_alive, name="csi-job-heartbeat", daemon=True)
+            t.start()
+            self._threads.append(t)
+            for i in range(max(1, self.workers)):
+                t = threading.Thread(target=self._worker, name=f"csi-job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    # --- Internals ---
+    def _enqueue(self, kind, params):
+        job_id = f"JOB-{uuid.uuid4().hex[:12]}"
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, kind, status, params, progress, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params), "{}", now, now))
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def _heartbeat(self):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO job_owners (owner, heartbeat) VALUES (?, ?)",
+                               (self.owner, time.time()))
+
+    def _keep_alive(self):
+        """Refresh this queue's heartbeat and pick up jobs of queues that stopped beating."""
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            self._heartbeat()
+            if self._requeue_orphans():
+                self._wakeup.set()
+
+    def _requeue_orphans(self):
+        """Requeue running jobs whose owner has no recent heartbeat; returns how many."""
+        cutoff = time.time() - JOB_OWNER_TIMEOUT
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM job_owners WHERE heartbeat < ? AND owner != ?", (cutoff, self.owner))
+            cur = self._conn.execute(
+                """UPDATE jobs SET status = ?, owner = NULL, updated_at = ?
+                   WHERE status = ? AND (owner IS NULL OR (owner != ? AND owner NOT IN (SELECT owner FROM job_owners)))""",
+                (QUEUED, time.time(), RUNNING, self.owner))
+        return cur.rowcount
+
+    def _claim(self):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                """UPDATE jobs SET status = ?, owner = ?, updated_at = ?
+                   WHERE job_id = (SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1)
+                   AND status = ?
+                   RETURNING job_id, kind, params""",
+                (RUNNING, self.owner, time.time(), QUEUED, QUEUED)).fetchone()
+        return row
+
+    def _worker(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(*job)
+
+    def _write(self, sql, params, cancelled=None):
+        """Commit one job update; sets `cancelled` if the job has a pending cancel request."""
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+            if cancelled is not None and self._conn.execute(
+                    "SELECT cancel_requested FROM jobs WHERE job_id = ?", (params[-1],)).fetchone()[0]:
+                cancelled.set()
+
+    def _run(self, job_id, kind, params):
+        params = json.loads(params)
+        progress = {}
+        cancelled = threading.Event()
+        persisting = [False]
+        with self._lock:
+            self._cancelled[job_id] = cancelled
+        # Picks up a cancel requested before this job was claimed
+        self._write("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id), cancelled)
+
+        # Both callbacks run on the pipeline's event loop: hand the writes to the
+        # writer thread and only check the in-memory cancel flag here.
+        def on_progress(stage, status):
+            progress[stage] = status
+            self._writer.submit(self._write, "UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE job_id = ?",
+                                (stage, json.dumps(progress), time.time(), job_id), cancelled)
+            if stage == "persist" and status != "pending":
+                persisting[0] = True
+            # Once the case is being saved the job completes, so a late cancel is ignored
+            if cancelled.is_set() and not persisting[0]:
+                raise JobCancelled(job_id)
+
+        last_partial = [0.0]
+
+        def on_partial(stage, text):
+            now = time.time()
+            if now - last_partial[0] < JOB_PARTIAL_INTERVAL:
+                return
+            last_partial[0] = now
+            self._writer.submit(self._write, "UPDATE jobs SET partial = ?, updated_at = ? WHERE job_id = ?",
+                                (json.dumps({stage: text}), now, job_id))
+
+        try:
+            if kind == "update":
+                res = csi.update_investigation(params["case_id"], params["new_notes"], params["new_images"],
+                                               progress_callback=on_progress, partial_callback=on_partial)
+            else:
+                res = csi.run_full_investigation(params["scene_text"], params["image_paths"],
+                                                 case_id=params["case_id"], progress_callback=on_progress,
+                                                 partial_callback=on_partial)
+            status, result, error = DONE, json.dumps({
+                "case_id": res["case_id"],
+                "json_path": str(res["json_path"]),
+                "pdf_path": str(res["pdf_path"]) if res["pdf_path"] else None
+            }), None
+        except JobCancelled:
+            status, result, error = CANCELLED, None, "Cancelled by user."
+        except Exception as e:
+            status, result, error = FAILED, None, f"{type(e).__name__}: {e}"
+        finally:
+            with self._lock:
+                self._cancelled.pop(job_id, None)
+        # Queued behind this job's progress writes, so the final status lands last
+        self._writer.submit(self._write, "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                            (status, result, error, time.time(), job_id)).result()
+
+
+# Global instance, created on first use (workers start on first submit)
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue()
+    return _job_queue
+
+
+def __getattr__(name):
+    if name == "job_queue":
+        return get_job_queue()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
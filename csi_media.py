@@ -0,0 +1,200 @@
+import contextlib
+import functools
+import hashlib
+import io
+import mmap
+import os
+import re
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+
+# --- Configuration ---
+IMAGE_MAX_EDGE = int(os.getenv("CSI_IMAGE_MAX_EDGE", "2048"))  # longest side after downscaling (px)
+IMAGE_JPEG_QUALITY = int(os.getenv("CSI_IMAGE_JPEG_QUALITY", "90"))
+IMAGE_DEDUPE_DISTANCE = int(os.getenv("CSI_IMAGE_DEDUPE_DISTANCE", "2"))  # dHash bits; -1 disables
+MEDIA_DIR = Path(os.getenv("CSI_MEDIA_DIR", "uploads"))  # content-addressed blob store (created on first write)
+MEDIA_CHUNK_BYTES = 1024 * 1024
+MEDIA_MMAP_MIN_BYTES = int(os.getenv("CSI_MEDIA_MMAP_MIN_BYTES", str(1024 * 1024)))  # smaller files are read
+
+# Magic-byte signatures -> MIME type
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+)
+
+PreparedImage = namedtuple("PreparedImage", "data mime fingerprint bytes_in")
+Blob = namedtuple("Blob", "digest path size")
+
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+@functools.lru_cache(maxsize=None)
+def _pil():
+    """(Image, ImageOps), imported on first use; None without Pillow."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # Pillow is optional: images are then sent as-is
+        return None
+    return Image, ImageOps
+
+
+def sniff_mime(data):
+    """Detect the image format from its leading bytes (never from the file name)."""
+    for magic, mime in _SIGNATURES:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return "application/octet-stream"
+
+
+def dhash(img, size=8):
+    """64-bit difference hash: brightness gradients of a (size+1) x size thumbnail."""
+    Image, _ = _pil()
+    small = img.convert("L").resize((size + 1, size), Image.BILINEAR)
+    px = small.tobytes()  # one byte per pixel in "L" mode, row by row
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = px[row * (size + 1) + col]
+            right = px[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def _reencode(src, max_edge, quality):
+    Image, ImageOps = _pil()
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)  # bake in orientation before EXIF is dropped
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            img, fmt, mime, options = img.convert("RGBA"), "PNG", "image/png", {"optimize": True}
+        else:
+            img, fmt, mime, options = img.convert("RGB"), "JPEG", "image/jpeg", {"quality": quality, "optimize": True}
+        if max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format=fmt, **options)  # no exif/icc arguments: metadata is stripped
+        return out.getvalue(), mime, dhash(img)
+
+
+@contextlib.contextmanager
+def _source(f, size):
+    """File object for decoding: the file mapped into memory when large, else its bytes."""
+    if size < MEDIA_MMAP_MIN_BYTES:
+        yield io.BytesIO(f.read())
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+
+@functools.lru_cache(maxsize=32)
+def _prepare_cached(path, mtime_ns, size, max_edge, quality):
+    with open(path, "rb") as f:
+        if _pil() is not None:
+            try:
+                with _source(f, size) as src:
+                    out, mime, fingerprint = _reencode(src, max_edge, quality)
+                return PreparedImage(out, mime, fingerprint, size)
+            except Exception:
+                f.seek(0)  # unreadable by Pillow: send the original bytes
+        data = f.read()
+    return PreparedImage(data, sniff_mime(data), blob_digest(path) or hashlib.sha256(data).hexdigest(), len(data))
+
+
+def prepare_image(path, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY):
+    """Load an image for upload: orientation applied, metadata stripped, downscaled and recompressed.
+
+    fingerprint is a dHash (int) when Pillow could decode the image, else a
+    sha256 of the raw bytes. Results are memoized per (path, mtime, size).
+    Large files are decoded straight from a memory map instead of being read.
+    """
+    st = os.stat(path)
+    return _prepare_cached(str(path), st.st_mtime_ns, st.st_size, max_edge, quality)
+
+
+def is_duplicate(a, b, max_distance=IMAGE_DEDUPE_DISTANCE):
+    """True when two fingerprints are perceptually the same image."""
+    if max_distance < 0 or type(a) is not type(b):
+        return False
+    if isinstance(a, int):
+        return bin(a ^ b).count("1") <= max_distance
+    return a == b
+
+
+def find_duplicates(fingerprints, max_distance=IMAGE_DEDUPE_DISTANCE, start=0):
+    """For each fingerprint from index `start` on, the index of an earlier duplicate (or None).
+
+    Entries before `start` are reference images (e.g. already analyzed for the
+    case); they are matched against but not reported. None entries are skipped.
+    """
+    origin = list(range(len(fingerprints)))
+    duplicates = []
+    for i in range(start, len(fingerprints)):
+        match = None
+        if fingerprints[i] is not None:
+            for j in range(i):
+                if fingerprints[j] is not None and is_duplicate(fingerprints[j], fingerprints[i], max_distance):
+                    match = origin[i] = origin[j]  # always point at the first copy
+                    break
+        duplicates.append(match)
+    return duplicates
+
+
+# --- Blob Store ---
+
+def blob_path(digest, media_dir=None):
+    """Where the blob with this sha256 hex digest lives (blobs/<2 hex>/<digest>)."""
+    return Path(media_dir or MEDIA_DIR) / "blobs" / digest[:2] / digest
+
+
+def blob_digest(path):
+    """The sha256 of a blob store path, or None for any other path."""
+    if not path:
+        return None
+    p = Path(path)
+    if _DIGEST.fullmatch(p.name) and p.parent.name == p.name[:2] and p.parent.parent.name == "blobs":
+        return p.name
+    return None
+
+
+def store_blob(stream, media_dir=None):
+    """Copy a binary file object into the blob store under its sha256; returns a Blob.
+
+    The content is streamed in MEDIA_CHUNK_BYTES chunks to a temp file while it
+    is hashed, then renamed into place, so identical uploads (from any case)
+    are stored once and a blob is never seen half-written.
+    """
+    root = Path(media_dir or MEDIA_DIR)
+    tmp_dir = root / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    if stream.seekable():
+        stream.seek(0)
+    sha, size = hashlib.sha256(), 0
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(MEDIA_CHUNK_BYTES), b""):
+                sha.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        digest = sha.hexdigest()
+        path = blob_path(digest, root)
+        if path.exists():
+            os.remove(tmp)  # already stored
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+    return Blob(digest, str(path), size)
+
@@ -0,0 +1,171 @@
+import json
+import logging
+import math
+import os
+from collections import namedtuple
+
+import csi_tracing as tracing
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+PROMPT_TOKEN_BUDGET = int(os.getenv("CSI_PROMPT_TOKEN_BUDGET", "6000"))  # per data block
+# Evidence extraction reads the raw log and every image analysis, so it gets a much larger ceiling
+EXTRACTION_TOKEN_BUDGET = int(os.getenv("CSI_EXTRACTION_TOKEN_BUDGET", "32000"))
+CHARS_PER_TOKEN = 4  # rough estimate; good enough for budgeting
+TRUNCATED = " ...[truncated]"
+MIN_SECTION_CHARS = 80  # below this a truncated section is dropped instead
+
+# label may be None for an unlabelled block; lower priority number = kept longer
+Section = namedtuple("Section", "label content priority")
+
+# (aggregate key, label, priority) projected into each prompt
+SUMMARY_FIELDS = (
+    ("description", "Scene", 1),
+    ("evidence_items", "Evidence", 1),
+    ("weapons", "Weapons", 2),
+    ("injuries", "Injuries", 2),
+    ("victim_profile", "Victim", 2),
+    ("visual_analysis", "Visual Analysis", 3),
+    ("timeline", "Timeline", 3),
+    ("suspect_hypotheses", "Suspect Hypotheses", 4),
+)
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def compact_json(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def slim_evidence(items):
+    """Only the evidence fields prompts use, most confident first (so truncation drops the weakest)."""
+    keep = ("type", "description", "location", "confidence")
+    slim = [{k: e[k] for k in keep if e.get(k) not in (None, "")} for e in items]
+    return sorted(slim, key=lambda e: -float(e.get("confidence") or 0))
+
+
+def case_sections(aggregate, fields=SUMMARY_FIELDS):
+    """Project the aggregate onto the given (key, label, priority) fields."""
+    sections = []
+    for key, label, priority in fields:
+        value = aggregate.get(key)
+        if value in (None, "", [], {}):
+            continue
+        if key == "evidence_items":
+            value = slim_evidence(value)
+        sections.append(Section(label, value, priority))
+    return sections
+
+
+def _dedupe(sections):
+    """Send repeated text once: contained blocks, then repeated lines (kept in the more important section)."""
+    texts = {i: s.content for i, s in enumerate(sections) if isinstance(s.content, str)}
+    priorities = [s.priority for s in sections]
+    # e.g. visual_analysis is embedded in description: strip it there and keep its own
+    # section, which takes on the description's (higher) priority
+    for i in texts:
+        for j in texts:
+            if i != j and texts[j] and len(texts[j]) < len(texts[i]) and texts[j] in texts[i]:
+                priorities[j] = min(priorities[i], priorities[j])
+                lines = texts[i].replace(texts[j], "").strip().splitlines()
+                if lines and lines[-1].rstrip().endswith(":"):
+                    lines.pop()  # heading left without its block
+                texts[i] = "\n".join(lines).strip()
+    seen = set()
+    for i in sorted(texts, key=lambda i: priorities[i]):
+        lines = []
+        for line in texts[i].splitlines():
+            key = " ".join(line.split()).lower()
+            if len(key) > 20 and key in seen:
+                continue
+            seen.add(key)
+            lines.append(line)
+        texts[i] = "\n".join(lines).strip()
+    return [s._replace(content=texts.get(i, s.content), priority=priorities[i]) for i, s in enumerate(sections)]
+
+
+def _render(section):
+    content = section.content if isinstance(section.content, str) else compact_json(section.content)
+    return f"{section.label}: {content}" if section.label else content
+
+
+def _shrink(section, max_chars):
+    """Largest version of the section whose rendering fits max_chars, or None."""
+    if isinstance(section.content, list):
+        items = list(section.content)
+        while items:
+            items.pop()
+            candidate = section._replace(content=items)
+            if len(_render(candidate)) <= max_chars:
+                return candidate if items else None
+        return None
+    text = section.content if isinstance(section.content, str) else compact_json(section.content)
+    room = max_chars - len(_render(section._replace(content=""))) - len(TRUNCATED)
+    if room < MIN_SECTION_CHARS:
+        return None
+    return section._replace(content=text[:room].rstrip() + TRUNCATED)
+
+
+def _trim_text(sections, rendered, excess, floor):
+    """Shorten free-text sections in proportion to their length above `floor` to remove `excess` chars.
+
+    Returns the number of sections trimmed; sections and rendered are updated in place.
+    """
+    spare = {i: len(r) - floor for i, r in enumerate(rendered)
+             if isinstance(sections[i].content, str) and len(r) > floor}
+    total_spare = sum(spare.values())
+    if not total_spare:
+        return 0
+    ratio = min(1.0, excess / total_spare)
+    trimmed = 0
+    for i, extra in spare.items():
+        smaller = _shrink(sections[i], len(rendered[i]) - math.ceil(extra * ratio))
+        if smaller is not None:
+            sections[i], rendered[i] = smaller, _render(smaller)
+            trimmed += 1
+    return trimmed
+
+
+def fit_sections(sections, budget=PROMPT_TOKEN_BUDGET):
+    """Render sections as one compact data block of at most `budget` tokens.
+
+    Repeated text is removed and structured values are serialized without
+    whitespace. When the block is still too long, long free text is trimmed
+    first, in proportion to its length (so a huge officer log can't crowd out
+    the evidence list); only then are the lowest-priority sections truncated
+    (or dropped). Section order is preserved. Any trimming is logged as a warning.
+    """
+    sections = [s for s in _dedupe([s for s in sections if s.content not in (None, "", [], {})])
+                if s.content not in (None, "", [], {})]
+    max_chars = budget * CHARS_PER_TOKEN
+    rendered = [_render(s) for s in sections]
+    total = sum(len(r) + 1 for r in rendered)
+    truncated = dropped = 0
+    original_chars = total
+    if total > max_chars and sections:
+        floor = max(MIN_SECTION_CHARS * 2, max_chars // (4 * len(sections)))
+        truncated += _trim_text(sections, rendered, total - max_chars, floor)
+        total = sum(len(r) + 1 for r in rendered)
+    # Lowest priority first; within a priority level the longest section gives way first
+    for i in sorted(range(len(sections)), key=lambda i: (-sections[i].priority, -len(rendered[i]), -i)):
+        if total <= max_chars:
+            break
+        excess = total - max_chars
+        smaller = _shrink(sections[i], len(rendered[i]) - excess)
+        total -= len(rendered[i]) + 1
+        if smaller is None:
+            sections[i], rendered[i] = None, None
+            dropped += 1
+        else:
+            sections[i], rendered[i] = smaller, _render(smaller)
+            total += len(rendered[i]) + 1
+        truncated += 1
+    block = "\n".join(r for r in rendered if r is not None)
+    if truncated:
+        logger.warning("Prompt data block over budget (%d > %d chars): trimmed %d section(s), dropped %d",
+                       original_chars, max_chars, truncated - dropped, dropped)
+    tracing.record(prompt_tokens=estimate_tokens(block), prompt_sections_truncated=truncated)
+    return block
@@ -0,0 +1,445 @@
+"""Case report rendering (PDF + Markdown).
+
+Usage:
+    python csi_reports.py                 # render missing/outdated reports for every stored case
+    python csi_reports.py --force --workers 8
+
+Reports are built from REPORT_TEMPLATE: every aggregate section, with tables
+for evidence, weapons, injuries, suspects and the timeline. They are written
+to csi_output/ as <case_id>-<content hash>.pdf and .md, so a case whose
+content has not changed is never re-rendered.
+"""
+import argparse
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+REPORT_DIR = Path(os.getenv("CSI_REPORT_DIR", "csi_output"))
+REPORT_WORKERS = int(os.getenv("CSI_REPORT_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 renders inline
+RENDERER_VERSION = 2  # bump when the layout changes so cached reports are re-rendered
+
+# (aggregate key, heading, table columns) in report order. Columns are
+# (item key, label, relative width); None renders text, or a field/value
+# table for dicts.
+REPORT_TEMPLATE = (
+    ("executive_summary", "Executive Summary", None),
+    ("description", "Scene Description", None),
+    ("evidence_items", "Evidence", (("type", "Type", 2), ("description", "Description", 5),
+                                    ("location", "Location", 3), ("confidence", "Conf.", 1))),
+    ("weapons", "Weapons", (("weapon", "Weapon", 2), ("confidence", "Conf.", 1), ("reason", "Reason", 6))),
+    ("injuries", "Injuries", (("injury", "Injury", 2), ("lethality_probability", "Lethality", 1.5),
+                              ("reason", "Reason", 5.5))),
+    ("victim_profile", "Victim Profile", None),
+    ("suspect_hypotheses", "Suspect Hypotheses", (("age_range", "Age", 1.2), ("build", "Build", 1.5),
+                                                  ("reason", "Reason", 6.3))),
+    ("timeline", "Timeline", (("step", "Step", 0.8), ("event", "Event", 3.5), ("reason", "Reason", 4.7))),
+    ("gis_location", "Location", None),
+)
+_FIELD_COLUMNS = (("field", "Field", 1), ("value", "Value", 3))
+
+_KEY_CHARS = 16
+_pool = None
+_pending = {}  # pdf path -> Future of the render in flight
+_latest = {}  # case_id -> pdf path of the newest report submitted for it
+_lock = threading.RLock()  # add_done_callback may run _finished immediately, under the lock
+
+
+def report_key(case_id, aggregate):
+    """Content hash of a report: same case content and layout -> same files."""
+    content = {key: aggregate.get(key) for key, _, _ in REPORT_TEMPLATE}
+    content["risk_score"] = aggregate.get("risk_score")
+    blob = json.dumps([RENDERER_VERSION, case_id, content], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:_KEY_CHARS]
+
+
+def pdf_path(case_id, aggregate):
+    """Path of the PDF for the case's current content (whether or not it has been rendered yet)."""
+    return REPORT_DIR / f"{case_id}-{report_key(case_id, aggregate)}.pdf"
+
+
+# --- Report structure ---
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_cell_text(v) for v in value)
+    if isinstance(value, dict):
+        return ", ".join(f"{k}: {_cell_text(v)}" for k, v in value.items())
+    return str(value)
+
+
+def report_blocks(case_id, aggregate, template=REPORT_TEMPLATE):
+    """Yield the report as format-neutral blocks, lazily.
+
+    ("title", text), ("heading", text), ("paragraph", text) and
+    ("table", columns, rows) where rows is an iterable of dicts.
+    """
+    yield ("title", f"Case Report: {case_id}")
+    if aggregate.get("risk_score") is not None:
+        yield ("paragraph", f"Risk score: {aggregate['risk_score']}/10")
+    for key, heading, columns in template:
+        value = aggregate.get(key)
+        if value in (None, "", [], {}):
+            continue
+        yield ("heading", heading)
+        if columns and isinstance(value, list):
+            yield ("table", columns, (item for item in value if isinstance(item, dict)))
+        elif isinstance(value, dict):
+            yield ("table", _FIELD_COLUMNS,
+                   ({"field": k.replace("_", " ").title(), "value": v} for k, v in value.items()))
+        else:
+            yield ("paragraph", _cell_text(value))
+
+
+# --- Writers ---
+
+def _tmp_for(out_path):
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    return out_path, out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+
+
+def _md_cell(value):
+    return " ".join(_cell_text(value).split()).replace("|", "\\|")
+
+
+def write_markdown_report(blocks, out_path):
+    """Stream report blocks to a Markdown file, one line at a time."""
+    out_path, tmp_path = _tmp_for(out_path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for block in blocks:
+            kind = block[0]
+            if kind == "title":
+                f.write(f"# {block[1]}\n\n")
+            elif kind == "heading":
+                f.write(f"## {block[1]}\n\n")
+            elif kind == "paragraph":
+                f.write(f"{block[1].strip()}\n\n")
+            elif kind == "table":
+                _, columns, rows = block
+                f.write("| " + " | ".join(label for _, label, _ in columns) + " |\n")
+                f.write("|" + "---|" * len(columns) + "\n")
+                for row in rows:
+                    f.write("| " + " | ".join(_md_cell(row.get(key)) for key, _, _ in columns) + " |\n")
+                f.write("\n")
+    # Write-then-rename so an existing path is always a complete report
+    os.replace(tmp_path, out_path)
+    return str(out_path)
+
+
+def _latin1(text):
+    text = (
+        text.replace("—", "-")
+            .replace("–", "-")
+            .replace("’", "'")
+            .replace("“", '"')
+            .replace("”", '"')
+    )
+    # Simple fix for utf-8 chars in FPDF
+    return text.encode("latin-1", "ignore").decode("latin-1")
+
+
+class _PdfWriter:
+    """Draws report blocks straight onto FPDF pages (tables wrap and repeat their header)."""
+
+    LINE = 5  # table line height (mm)
+
+    def __init__(self):
+        from fpdf import FPDF  # deferred: importing this module should stay cheap
+
+        self.pdf = FPDF()
+        self.pdf.set_margins(15, 15, 15)
+        self.pdf.set_auto_page_break(auto=True, margin=15)
+        self.pdf.add_page()
+        self.width = self.pdf.w - self.pdf.l_margin - self.pdf.r_margin
+
+    def write(self, block):
+        kind = block[0]
+        pdf = self.pdf
+        if kind == "title":
+            pdf.set_font("Arial", "B", 16)
+            pdf.cell(0, 10, _latin1(block[1]), ln=1)
+        elif kind == "heading":
+            pdf.ln(3)
+            pdf.set_font("Arial", "B", 13)
+            pdf.cell(0, 8, _latin1(block[1]), ln=1)
+            pdf.line(pdf.l_margin, pdf.get_y(), pdf.l_margin + self.width, pdf.get_y())
+            pdf.ln(2)
+        elif kind == "paragraph":
+            pdf.set_font("Arial", "", 11)
+            for para in block[1].split("\n\n"):
+                pdf.multi_cell(0, 6, _latin1(para.strip()))
+                pdf.ln(1)
+        elif kind == "table":
+            self._table(block[1], block[2])
+
+    def _wrap(self, text, width):
+        """Greedy word wrap to `width` mm using the current font."""
+        fits = lambda s: self.pdf.get_string_width(s) <= width
+        lines = []
+        for para in _latin1(text).splitlines() or [""]:
+            line = ""
+            for word in para.split():
+                if not fits(word):  # hard-split words wider than the column, in one pass
+                    if line:
+                        lines.append(line)
+                        line = ""
+                    piece, used = "", 0.0
+                    for ch in word:
+                        w = self.pdf.get_string_width(ch)
+                        if piece and used + w > width:
+                            lines.append(piece)
+                            piece, used = "", 0.0
+                        piece += ch
+                        used += w
+                    word = piece
+                candidate = f"{line} {word}" if line else word
+                if fits(candidate):
+                    line = candidate
+                else:
+                    lines.append(line)
+                    line = word
+            lines.append(line)
+        return lines
+
+    def _header(self, columns, widths):
+        pdf = self.pdf
+        pdf.set_font("Arial", "B", 9)
+        pdf.set_fill_color(226, 232, 240)
+        for (_, label, _), w in zip(columns, widths):
+            pdf.cell(w, self.LINE + 1, _latin1(label), border=1, fill=1)
+        pdf.ln()
+        pdf.set_font("Arial", "", 9)
+
+    def _table(self, columns, rows):
+        pdf = self.pdf
+        total = sum(weight for _, _, weight in columns)
+        widths = [self.width * weight / total for _, _, weight in columns]
+        max_lines = int((pdf.page_break_trigger - pdf.t_margin) / self.LINE) - 2  # a row never outgrows a page
+        self._header(columns, widths)
+        for row in rows:
+            cells = [self._wrap(_cell_text(row.get(key)), w - 2)[:max_lines] for (key, _, _), w in zip(columns, widths)]
+            height = self.LINE * max(len(c) for c in cells)
+            if pdf.get_y() + height > pdf.page_break_trigger:
+                pdf.add_page()
+                self._header(columns, widths)
+            x, y = pdf.l_margin, pdf.get_y()
+            for lines, w in zip(cells, widths):
+                pdf.rect(x, y, w, height)
+                for i, line in enumerate(lines):
+                    pdf.set_xy(x + 1, y + i * self.LINE)
+                    pdf.cell(w - 2, self.LINE, line)
+                x += w
+            pdf.set_xy(pdf.l_margin, y + height)
+        pdf.ln(2)
+
+    def save(self, out_path):
+        out_path, tmp_path = _tmp_for(out_path)
+        self.pdf.output(str(tmp_path))
+        os.replace(tmp_path, out_path)
+        return str(out_path)
+
+
+def write_pdf_report(blocks, out_path):
+    """Render report blocks to a PDF, drawing each block as it is produced. Errors propagate."""
+    writer = _PdfWriter()
+    for block in blocks:
+        writer.write(block)
+    return writer.save(out_path)
+
+
+def render_pdf(md_text, out_path):
+    """Render plain text as a one-section PDF."""
+    return write_pdf_report([("paragraph", md_text)], out_path)
+
+
+def render_case(case_id, aggregate, pdf_out, md_out):
+    """Write both report formats for a case. Runs in the report pool."""
+    write_pdf_report(report_blocks(case_id, aggregate), pdf_out)
+    write_markdown_report(report_blocks(case_id, aggregate), md_out)
+    return str(pdf_out)
+
+
+# --- Background rendering ---
+
+def _spawn_pool(workers):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # spawn: the callers run event-loop and worker threads, which fork() would copy mid-flight
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = _spawn_pool(REPORT_WORKERS)
+    return _pool
+
+
+def _remove_stale(case_id, keep):
+    """Delete the case's other reports, but only when `keep` is its newest submitted one.
+
+    Renders can finish out of order; an older one must not remove the files of
+    the report that superseded it.
+    """
+    stale = re.compile(re.escape(case_id) + rf"-[0-9a-f]{{{_KEY_CHARS}}}\.(pdf|md)")
+    with _lock:
+        if _latest.get(case_id) != keep:
+            return
+        for path in REPORT_DIR.glob(f"{case_id}-*"):
+            if path.stem != keep.stem and stale.fullmatch(path.name):
+                path.unlink(missing_ok=True)
+
+
+def _finished(case_id, path, future):
+    with _lock:
+        _pending.pop(path, None)
+    error = future.exception()
+    if error is not None:
+        logger.error("Report for %s failed: %s", case_id, error)
+        return
+    _remove_stale(case_id, path)
+
+
+def _is_current(path):
+    return path.exists() and path.with_suffix(".md").exists()
+
+
+def _queue(case_id, aggregate, path):
+    if _is_current(path):
+        return path
+    if REPORT_WORKERS <= 0:
+        render_case(case_id, aggregate, path, path.with_suffix(".md"))
+        _remove_stale(case_id, path)
+        return path
+    with _lock:
+        if path not in _pending:
+            future = _executor().submit(render_case, case_id, aggregate, str(path), str(path.with_suffix(".md")))
+            _pending[path] = future
+            future.add_done_callback(functools.partial(_finished, case_id, path))
+    return path
+
+
+def submit(case_id, aggregate):
+    """Queue the case report for rendering unless an identical one exists; returns the PDF path.
+
+    Rendering happens in a process pool, so the file may not exist yet when
+    this returns; ensure_pdf waits for it. The report becomes the case's
+    current one: older reports are removed once it is written.
+    """
+    path = pdf_path(case_id, aggregate)
+    with _lock:
+        _latest[case_id] = path
+    return _queue(case_id, aggregate, path)
+
+
+def ensure_pdf(case_id, aggregate, timeout=None):
+    """Path of the case PDF, rendering it (or waiting for the render in flight) if needed."""
+    path = _queue(case_id, aggregate, pdf_path(case_id, aggregate))
+    with _lock:
+        future = _pending.get(path)
+    if future is not None:
+        future.result(timeout)
+    elif not path.exists():
+        # the queued render failed in the meantime: retry here so the error reaches the caller
+        render_case(case_id, aggregate, path, path.with_suffix(".md"))
+    return path
+
+
+def read_pdf(case_id, aggregate):
+    """PDF bytes for a case; used for lazy "Export PDF" downloads."""
+    return ensure_pdf(case_id, aggregate).read_bytes()
+
+
+def drain(timeout=None):
+    """Wait for every queued report (e.g. before a batch run exits)."""
+    with _lock:
+        futures = list(_pending.values())
+    wait(futures, timeout)
+
+
+# --- Archive rendering ---
+
+def _iter_cases(case_manager, page_size=500):
+    """(case_id, aggregate) for every stored case, one keyset page at a time."""
+    cursor = None
+    while True:
+        rows = case_manager.list_cases(limit=page_size, offset=cursor, columns=["case_id"], order_by="case_id")
+        for row in rows:
+            state = case_manager.get_session(row["case_id"]) or {}
+            if "case:aggregate" in state:
+                yield row["case_id"], state["case:aggregate"]
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1]["case_id"], rows[-1]["case_id"])
+
+
+def render_all(workers=None, force=False, log=print):
+    """Render the reports of every stored case across all cores; returns a stats dict."""
+    import csi_backend as csi  # here, not at the top: csi_backend imports this module
+
+    workers = workers or os.cpu_count() or 1
+    stats = {"rendered": 0, "skipped": 0, "failed": 0}
+    started = time.time()
+    in_flight = {}
+
+    def collect(done):
+        for future in done:
+            case_id, path = in_flight.pop(future)
+            if future.exception() is not None:
+                stats["failed"] += 1
+                log(f"[failed] {case_id}: {future.exception()}")
+            else:
+                stats["rendered"] += 1
+                _remove_stale(case_id, path)
+
+    with _spawn_pool(workers) as pool:
+        for case_id, aggregate in _iter_cases(csi.case_manager):
+            path = pdf_path(case_id, aggregate)
+            if not force and _is_current(path):
+                stats["skipped"] += 1
+                continue
+            # Bounded window so only a few aggregates are held in memory at a time
+            if len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            with _lock:
+                _latest[case_id] = path
+            future = pool.submit(render_case, case_id, aggregate, str(path), str(path.with_suffix(".md")))
+            in_flight[future] = (case_id, path)
+        collect(wait(in_flight)[0])
+    stats["elapsed_s"] = round(time.time() - started, 2)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render PDF/Markdown reports for every stored case.")
+    parser.add_argument("--workers", type=int, help="render processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="re-render reports that are already current")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    stats = render_all(workers=args.workers, force=args.force)
+    print(json.dumps(stats))
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
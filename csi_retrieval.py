@@ -0,0 +1,141 @@
+import math
+import os
+import re
+from collections import Counter
+
+# --- Configuration ---
+CHUNK_CHARS = int(os.getenv("CSI_CHUNK_CHARS", "600"))
+MEMORY_TOP_K = int(os.getenv("CSI_MEMORY_TOP_K", "8"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+INDEX_VERSION = 1  # bump when chunking/tokenizing changes; stale indexes are rebuilt lazily
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by did do does for from had has have he her his how i if in into is it
+its of on or she that the their there they this to was we were what when where which who why will with
+you your any all about after before than then them these those there's can could would should
+""".split())
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stopwords; trailing plural "s" folded."""
+    tokens = []
+    for word in _WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def _windows(text, size=CHUNK_CHARS):
+    """Split text into chunks of about `size` chars on paragraph, then sentence boundaries."""
+    chunks, current = [], ""
+    for para in re.split(r"\n\s*\n|\n(?=\[)", text):
+        for piece in re.split(r"(?<=[.!?])\s+", para.strip()) if len(para) > size else [para.strip()]:
+            if not piece:
+                continue
+            if current and len(current) + len(piece) + 1 > size:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {piece}".strip()
+        if current and len(current) >= size // 2:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _officer_log(aggregate):
+    description = str(aggregate.get("description", ""))
+    visual = aggregate.get("visual_analysis", "")
+    if visual and visual in description:
+        description = description.replace(visual, "")
+    return description.replace("Visual Forensics Data:", "").strip()
+
+
+def chunk_case(aggregate):
+    """Split a case aggregate into (field, text) retrieval chunks."""
+    chunks = [("description", c) for c in _windows(_officer_log(aggregate))]
+    for line in str(aggregate.get("visual_analysis", "")).splitlines():
+        chunks.extend(("visual_analysis", c) for c in _windows(line))
+    for e in aggregate.get("evidence_items", []):
+        chunks.append(("evidence", f"{e.get('type', '')}: {e.get('description', '')} "
+                                   f"(location: {e.get('location', 'unknown')}, confidence: {e.get('confidence', '')})"))
+    for w in aggregate.get("weapons", []):
+        chunks.append(("weapons", f"Weapon {w.get('weapon', '')} (confidence {w.get('confidence', '')}): {w.get('reason', '')}"))
+    for i in aggregate.get("injuries", []):
+        chunks.append(("injuries", f"Injury {i.get('injury', '')} (lethality {i.get('lethality_probability', '')}): {i.get('reason', '')}"))
+    for s in aggregate.get("suspect_hypotheses", []):
+        chunks.append(("suspects", "Suspect hypothesis: " + ", ".join(f"{k} {v}" for k, v in s.items())))
+    victim = aggregate.get("victim_profile") or {}
+    if victim:
+        chunks.append(("victim", "Victim profile: " + ", ".join(f"{k}: {v}" for k, v in victim.items())))
+    for t in aggregate.get("timeline", []):
+        chunks.append(("timeline", f"Timeline step {t.get('step', '')}: {t.get('event', '')} ({t.get('reason', '')})"))
+    chunks.extend(("summary", c) for c in _windows(str(aggregate.get("executive_summary", ""))))
+    if aggregate.get("risk_score") is not None:
+        chunks.append(("summary", f"Risk score: {aggregate['risk_score']}"))
+    loc = aggregate.get("gis_location") or {}
+    if loc:
+        chunks.append(("location", f"Location: lat {loc.get('lat')}, lon {loc.get('lon')}"))
+    return [(field, text) for field, text in chunks if text.strip()]
+
+
+def build_index(aggregate):
+    """BM25 index over the case's chunks, as a JSON-serializable dict."""
+    chunks = chunk_case(aggregate)
+    tfs = [Counter(tokenize(text)) for _, text in chunks]
+    df = Counter(term for tf in tfs for term in tf)
+    lengths = [sum(tf.values()) for tf in tfs]
+    return {
+        "version": INDEX_VERSION,
+        "chunks": [{"field": field, "text": text} for field, text in chunks],
+        "tf": [dict(tf) for tf in tfs],
+        "df": dict(df),
+        "lengths": lengths,
+        "avgdl": (sum(lengths) / len(lengths)) if lengths else 0.0
+    }
+
+
+def search(index, query, k=MEMORY_TOP_K):
+    """Top-k chunks for a query as [{"field", "text", "score"}], in case order.
+
+    When no chunk shares a term with the query, the summary (then the first
+    chunks) is returned so the model still gets an overview.
+    """
+    chunks = index.get("chunks", [])
+    if not chunks:
+        return []
+    n = len(chunks)
+    avgdl = index.get("avgdl") or 1.0
+    scores = [0.0] * n
+    for term in set(tokenize(query)):
+        df = index["df"].get(term)
+        if not df:
+            continue
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        for i, tf in enumerate(index["tf"]):
+            f = tf.get(term)
+            if f:
+                norm = f + BM25_K1 * (1 - BM25_B + BM25_B * index["lengths"][i] / avgdl)
+                scores[i] += idf * f * (BM25_K1 + 1) / norm
+    ranked = sorted((i for i in range(n) if scores[i] > 0), key=lambda i: -scores[i])[:k]
+    if not ranked:
+        ranked = [i for i in range(n) if chunks[i]["field"] == "summary"][:k] or list(range(min(k, n)))
+    return [dict(chunks[i], score=round(scores[i], 4)) for i in sorted(ranked)]
+
+
+# Words that describe the question rather than the cases being searched for
+SEARCH_STOPWORDS = STOPWORDS | {"case", "cases", "involve", "involved", "involving", "show", "find", "list",
+                                "me", "which", "scene", "scenes"}
+
+
+def fts_query(text):
+    """FTS5 MATCH expression for a free-text question: its distinct terms, quoted and OR-ed."""
+    terms = [w for w in _WORD.findall(text.lower()) if w not in SEARCH_STOPWORDS]
+    return " OR ".join(f'"{t}"' for t in dict.fromkeys(terms))
@@ -0,0 +1,171 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+_current_trace = contextvars.ContextVar("csi_trace", default=None)
+_current_span = contextvars.ContextVar("csi_span", default=None)
+
+
+def _lane():
+    """Thread name, plus the asyncio task name when running inside a task."""
+    name = threading.current_thread().name
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return f"{name}/{task.get_name()}" if task else name
+
+
+class Span:
+    """One timed unit of work inside a trace."""
+
+    def __init__(self, name, parent_id=None, **attrs):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:12]
+        self.parent_id = parent_id
+        self.thread = _lane()
+        self.start = time.time()
+        self.duration_ms = None
+        self.attrs = dict(attrs)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def incr(self, key, n=1):
+        self.attrs[key] = self.attrs.get(key, 0) + n
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "thread": self.thread,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs
+        }
+
+
+class Trace:
+    """Collects the spans recorded for one investigation run (thread-safe)."""
+
+    def __init__(self, name, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs)
+        self.start = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans]
+        return {"trace_id": self.trace_id, "name": self.name, "start": self.start,
+                "attrs": self.attrs, "spans": spans}
+
+
+@contextmanager
+def start_trace(name, **attrs):
+    """Make a new Trace current for this context (and contexts copied from it)."""
+    trace = Trace(name, **attrs)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block as a child of the current span; a no-op outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    s = Span(name, parent.span_id if parent else None, **attrs)
+    token = _current_span.set(s)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        s.duration_ms = round((time.perf_counter() - t0) * 1000, 3)
+        _current_span.reset(token)
+        trace.add(s)
+
+
+def traced(name):
+    """Decorator form of span(); works on plain and async functions."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_span():
+    return _current_span.get()
+
+
+def record(**attrs):
+    """Attach attributes to the current span, if any."""
+    s = _current_span.get()
+    if s is not None:
+        s.set(**attrs)
+
+
+def incr(key, n=1):
+    s = _current_span.get()
+    if s is not None:
+        s.incr(key, n)
+
+
+# --- Export ---
+
+def to_jsonl(trace_dict):
+    """One JSON object per span, tagged with the trace id."""
+    return "".join(json.dumps(dict(s, trace_id=trace_dict["trace_id"])) + "\n" for s in trace_dict["spans"])
+
+
+def to_chrome_trace(trace_dict):
+    """Chrome trace-event format (load in chrome://tracing or Perfetto)."""
+    threads = {}
+    events = []
+    for s in sorted(trace_dict["spans"], key=lambda s: s["start"]):
+        tid = threads.setdefault(s["thread"], len(threads) + 1)
+        events.append({
+            "name": s["name"],
+            "cat": s["name"].split(":", 1)[0],
+            "ph": "X",
+            "ts": round(s["start"] * 1e6),
+            "dur": round((s["duration_ms"] or 0) * 1000),
+            "pid": 1,
+            "tid": tid,
+            "args": s["attrs"]
+        })
+    for thread, tid in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread}})
+    return {"traceEvents": events, "displayTimeUnit": "ms",
+            "otherData": {"trace_id": trace_dict["trace_id"], "name": trace_dict["name"]}}
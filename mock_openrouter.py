@@ -0,0 +1,213 @@
+"""Offline stand-in for the OpenRouter chat-completions endpoint.
+
+Serves canned vision / evidence / victim-profile / summary responses (plain
+or SSE-streamed) with configurable latency and error rate, so the pipeline
+can be exercised and benchmarked without network access:
+
+    python mock_openrouter.py --port 8799 --latency 0.2 --error-rate 0.05
+    OPENROUTER_URL=http://127.0.0.1:8799/api/v1/chat/completions streamlit run app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CHAT_PATH = "/api/v1/chat/completions"
+
+DEFAULT_RESPONSES = {
+    "vision": "Visible: overturned chair, kitchen knife near the doorway, blood spatter on the wall, "
+              "partial shoe print in the hallway.",
+    "evidence": json.dumps({"evidence_items": [
+        {"type": "blood_stain", "description": "Blood spatter on the wall", "confidence": 0.9, "location": "living room wall"},
+        {"type": "weapon_blade", "description": "Kitchen knife near the doorway", "confidence": 0.85, "location": "doorway"},
+        {"type": "footprint", "description": "Partial shoe print", "confidence": 0.6, "location": "hallway"}
+    ]}),
+    "victim": json.dumps({
+        "risk_level": "High",
+        "demographics_inferred": "Adult, lived alone",
+        "relation_to_suspect_hypothesis": "Likely acquainted; no forced entry",
+        "notes": "Defensive injuries suggested by spatter pattern."
+    }),
+    "summary": "Executive Summary: a close-quarters assault with a bladed weapon. Blood spatter and a "
+               "partial shoe print place the suspect in the hallway before exiting through the front door.",
+    "query": "Based on the case data, the primary weapon was a bladed object (kitchen knife)."
+}
+
+
+def classify(messages):
+    """Return (kind, image_count) for a chat request."""
+    content = messages[-1]["content"] if messages else ""
+    if isinstance(content, list):
+        images = sum(1 for part in content if part.get("type") == "image_url")
+        return "vision", images
+    if "Extract ALL potential evidence items" in content:
+        return "evidence", 0
+    if "Victim Profile" in content:
+        return "victim", 0
+    if "Answer the user query" in content:
+        return "query", 0
+    return "summary", 0
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # async clients open many connections at once
+
+
+class MockOpenRouter:
+    """Threaded HTTP server speaking the chat-completions protocol."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.0, error_rate=0.0,
+                 error_status=429, retry_after=1, responses=None, seed=None, break_stream_after=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.break_stream_after = break_stream_after  # close SSE streams after this many words, without [DONE]
+        self.responses = dict(DEFAULT_RESPONSES, **(responses or {}))
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = _Server((host, port), self._handler_class())
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{CHAT_PATH}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reply_for(self, body):
+        kind, images = classify(body.get("messages", []))
+        if kind == "vision" and images > 1:
+            return json.dumps([f"[Image {i+1}] {self.responses['vision']}" for i in range(images)])
+        return self.responses[kind]
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+                with mock._lock:
+                    mock.stats["bytes_out"] += len(data)
+
+            def _chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, body, delay):
+                """SSE response; the latency is spread across the chunks like token generation."""
+                words = mock.reply_for(body).split(" ")
+                cut = mock.break_stream_after
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                sent = 0
+                self._chunk(b": OPENROUTER PROCESSING\n\n")
+                for i, word in enumerate(words):
+                    if cut is not None and i >= cut:
+                        break
+                    time.sleep(delay / len(words))
+                    event = {"id": "mock-completion", "model": body.get("model"), "choices": [
+                        {"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+                    data = f"data: {json.dumps(event)}\n\n".encode("utf-8")
+                    self._chunk(data)
+                    sent += len(data)
+                if cut is None or cut >= len(words):
+                    self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+                with mock._lock:
+                    mock.stats["bytes_out"] += sent
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with mock._lock:
+                    mock.stats["requests"] += 1
+                    mock.stats["bytes_in"] += len(raw)
+                    fail = mock._random.random() < mock.error_rate
+                    delay = mock.latency + mock._random.uniform(0, mock.jitter)
+                if self.path != CHAT_PATH:
+                    return self._send(404, {"error": {"message": "not found"}})
+                body = json.loads(raw or b"{}")
+                if body.get("stream"):
+                    with mock._lock:
+                        mock.stats["streams"] += 1
+                else:
+                    time.sleep(delay)
+                if fail:
+                    with mock._lock:
+                        mock.stats["errors"] += 1
+                    return self._send(mock.error_status, {"error": {"message": "Rate limit exceeded (mock)"}},
+                                      {"Retry-After": str(mock.retry_after)})
+                if body.get("stream"):
+                    try:
+                        return self._stream(body, delay)
+                    except (BrokenPipeError, ConnectionResetError):
+                        return  # client stopped reading mid-stream
+                self._send(200, {
+                    "id": "mock-completion",
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": mock.reply_for(body)}}]
+                })
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline OpenRouter chat-completions stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--responses", help="JSON file overriding the canned responses by kind")
+    args = parser.parse_args(argv)
+
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = json.load(f)
+    mock = MockOpenRouter(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, error_status=args.error_status, responses=responses)
+    print(f"Mock OpenRouter listening on {mock.url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,594 @@
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+import csi_backend as csi
+
+
+def _state(risk, weapon="knife", evidence=(), description="", summary=""):
+    aggregate = {
+        "description": description,
+        "executive_summary": summary,
+        "weapons": [{"weapon": weapon, "confidence": 0.9}],
+        "evidence_items": [dict(e) for e in evidence],
+        "gis_location": {"lat": 40.7, "lon": -74.0},
+        "risk_score": risk
+    }
+    return csi.case_state(aggregate, [])
+
+
+@pytest.fixture
+def manager(tmp_path):
+    cm = csi.CaseManager(str(tmp_path / "csi_app.db"))
+    yield cm
+    cm.close()
+
+
+@pytest.fixture
+def mock_api(tmp_path, monkeypatch):
+    """Mock OpenRouter server with a fresh response cache and no client-side rate limit."""
+    pytest.importorskip("httpx")
+    from mock_openrouter import MockOpenRouter
+
+    with MockOpenRouter(latency=0.01) as mock:
+        monkeypatch.setattr(csi, "OPENROUTER_URL", mock.url)
+        monkeypatch.setattr(csi, "_response_cache", csi.ResponseCache(str(tmp_path / "cache.db")))
+        monkeypatch.setattr(csi.rate_limiter, "rate", 0)
+        yield mock
+
+
+@pytest.fixture
+def store(manager, tmp_path, monkeypatch):
+    """The manager as the backend's case store, with output files kept in tmp_path."""
+    monkeypatch.setattr(csi, "_case_manager", manager)
+    monkeypatch.setattr(csi, "OUT_DIR", tmp_path / "out")
+    monkeypatch.setattr(csi.reports, "submit", lambda case_id, aggregate: tmp_path / f"{case_id}.pdf")
+    return manager
+
+
+@pytest.fixture
+def prepare_calls(monkeypatch):
+    calls = []
+    prepare = csi.media.prepare_image
+
+    def counting(path, *args, **kwargs):
+        calls.append(str(path))
+        return prepare(path, *args, **kwargs)
+
+    monkeypatch.setattr(csi.media, "prepare_image", counting)
+    return calls
+
+
+def _photo(path, seed):
+    """A small image whose dHash differs from every other seed's."""
+    Image = pytest.importorskip("PIL.Image")
+    img = Image.new("L", (9, 8))
+    img.putdata([((x * 37 + y * 11) * (seed + 3) + seed * 101) % 256 for y in range(8) for x in range(9)])
+    img.resize((90, 80)).save(path, format="PNG")
+    return str(path)
+
+
+def _image(n):
+    return csi.media.PreparedImage(f"image-{n}".encode(), "image/jpeg", n << 20, 10)
+
+
+# --- Schema migration ---
+
+def test_migrates_legacy_sessions_db(tmp_path):
+    db = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, state TEXT, updated_at TIMESTAMP)")
+    evidence = [{"type": "blood_stain", "description": "Spatter on the wall", "confidence": 0.9, "location": "hall"},
+                {"type": "footprint", "description": "Partial shoe print", "confidence": "n/a", "location": "door"}]
+    conn.executemany("INSERT INTO sessions VALUES (?, ?, ?)", [
+        ("CASE-a", json.dumps(_state(80, "kitchen_knife", evidence, "Victim found near the garage")),
+         "2024-01-02 10:00:00"),
+        ("CASE-b", "{not json", "2024-01-01 09:00:00")
+    ])
+    conn.commit()
+    conn.close()
+
+    cm = csi.CaseManager(str(db))
+    try:
+        conn = cm._conn
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == csi.CaseManager.SCHEMA_VERSION
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {"cases", "evidence_items", "case_traces", "case_index", "case_text", "case_fts", "case_media"} <= tables
+
+        # v1 backfill: summary columns and one row per evidence item
+        rows = {r["case_id"]: r for r in cm.list_cases()}
+        assert rows["CASE-a"]["risk_score"] == 80
+        assert rows["CASE-a"]["mem_primary_weapon"] == "kitchen_knife"
+        assert rows["CASE-a"]["num_evidence"] == 2
+        assert rows["CASE-a"]["updated_at"] == "2024-01-02 10:00:00"
+        assert rows["CASE-b"]["num_evidence"] == 0  # unreadable blob still gets a row
+        items = conn.execute("SELECT idx, type, confidence FROM evidence_items WHERE case_id = 'CASE-a' ORDER BY idx").fetchall()
+        assert items == [(0, "blood_stain", 0.9), (1, "footprint", None)]
+
+        # v4 backfill: existing cases are searchable
+        assert [r["case_id"] for r in cm.search_cases("garage")] == ["CASE-a"]
+        # v6: existing sessions start at revision 1
+        assert cm.get_revision("CASE-a") == 1
+        assert cm.case_stats() == {"total_cases": 2, "total_evidence": 2}
+    finally:
+        cm.close()
+
+
+def test_concurrent_processes_migrate_once(tmp_path):
+    db = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, state TEXT, updated_at TIMESTAMP)")
+    conn.executemany("INSERT INTO sessions VALUES (?, ?, ?)",
+                     [(f"CASE-{i}", json.dumps(_state(i)), "2024-01-01 09:00:00") for i in range(200)])
+    conn.commit()
+    conn.close()
+
+    start = time.time() + 1.0
+    code = ("import sys, time; import csi_backend as csi; time.sleep(max(0, float(sys.argv[2]) - time.time())); "
+            "csi.CaseManager(sys.argv[1]).close()")
+    procs = [subprocess.Popen([sys.executable, "-c", code, str(db), str(start)], cwd=os.path.dirname(csi.__file__),
+                              stderr=subprocess.PIPE) for _ in range(6)]
+    errors = [p.communicate(timeout=60)[1].decode() for p in procs]
+    assert [p.returncode for p in procs] == [0] * len(procs), "\n".join(errors)
+    conn = sqlite3.connect(db)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == csi.CaseManager.SCHEMA_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM evidence_items").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM cases").fetchone()[0] == 200
+    conn.close()
+
+
+def test_revision_bumps_on_every_save(manager):
+    manager.save_session("CASE-1", _state(10))
+    manager.save_session("CASE-1", _state(20))
+    assert manager.get_revision("CASE-1") == 2
+    assert manager.get_revision("CASE-missing") is None
+
+
+# --- list_cases ---
+
+def test_list_cases_keyset_paging(manager):
+    manager.save_sessions([(f"CASE-{i:02d}", _state(i * 10 % 70)) for i in range(11)])
+    full = manager.list_cases(limit=100, columns=["case_id", "risk_score", "updated_at"])
+    # Saved in one transaction: updated_at ties, so case_id breaks them
+    assert [r["case_id"] for r in full] == [f"CASE-{i:02d}" for i in reversed(range(11))]
+
+    for order_by, key in (("-updated_at", "updated_at"), ("risk_score", "risk_score")):
+        pages, cursor = [], None
+        while True:
+            page = manager.list_cases(limit=4, offset=cursor, columns=["case_id", key], order_by=order_by)
+            if not page:
+                break
+            pages.append(page)
+            cursor = (page[-1][key], page[-1]["case_id"])
+        seen = [r["case_id"] for page in pages for r in page]
+        expected = [r["case_id"] for r in manager.list_cases(limit=100, columns=["case_id"], order_by=order_by)]
+        assert seen == expected
+        assert len(set(seen)) == 11
+        assert [len(p) for p in pages] == [4, 4, 3]
+
+    ordered = manager.list_cases(limit=100, columns=["risk_score", "case_id"], order_by="risk_score")
+    assert ordered == sorted(ordered, key=lambda r: (r["risk_score"], r["case_id"]))
+
+
+def test_list_cases_filters_and_int_offset(manager):
+    manager.save_sessions([(f"CASE-{i}", _state(i * 20, "gun" if i % 2 else "knife")) for i in range(5)])
+    assert [r["case_id"] for r in manager.list_cases(columns=["case_id"], filters={"mem_primary_weapon": "gun"})] \
+        == ["CASE-3", "CASE-1"]
+    assert [r["case_id"] for r in manager.list_cases(columns=["case_id"], filters={"risk_score": (">=", 60)})] \
+        == ["CASE-4", "CASE-3"]
+    assert [r["case_id"] for r in manager.list_cases(limit=2, offset=2, columns=["case_id"])] == ["CASE-2", "CASE-1"]
+
+
+def test_list_cases_rejects_unknown_columns(manager):
+    with pytest.raises(ValueError):
+        manager.list_cases(columns=["state"])
+    with pytest.raises(ValueError):
+        manager.list_cases(order_by="-state")
+    with pytest.raises(ValueError):
+        manager.list_cases(filters={"risk_score": ("; DROP", 1)})
+
+
+def test_list_cases_sees_new_saves(manager):
+    manager.save_session("CASE-1", _state(10))
+    assert len(manager.list_cases()) == 1
+    manager.save_session("CASE-2", _state(20))
+    assert len(manager.list_cases()) == 2
+    manager.delete_session("CASE-1")
+    assert [r["case_id"] for r in manager.list_cases()] == ["CASE-2"]
+
+
+# --- Search ---
+
+def test_search_cases(manager):
+    manager.save_sessions([
+        ("CASE-1", _state(50, "kitchen_knife", [{"type": "weapon_blade", "description": "Knife by the door",
+                                                  "confidence": 0.8, "location": "door"}],
+                          "Body found in the kitchen", "Stabbing at close range")),
+        ("CASE-2", _state(30, "rope", [], "Victim found hanging in the garage", "Possible strangulation"))
+    ])
+    hits = manager.search_cases("knife")
+    assert [h["case_id"] for h in hits] == ["CASE-1"]
+    assert hits[0]["score"] > 0
+    assert "**" in hits[0]["snippet"]
+    assert hits[0]["primary_weapon"] == "kitchen_knife"
+
+    assert {h["case_id"] for h in manager.search_cases("Which cases involve a garage or stabbing?")} == {"CASE-1", "CASE-2"}
+    assert manager.search_cases("show me the cases") == []  # stopwords only
+    assert manager.search_cases('knife" OR NEAR(') == manager.search_cases("knife")  # FTS syntax is quoted away
+
+    # Re-saving replaces the indexed text
+    manager.save_session("CASE-1", _state(50, "gun", [], "Shot in the lounge", ""))
+    assert manager.search_cases("knife") == []
+    assert [h["case_id"] for h in manager.search_cases("lounge")] == ["CASE-1"]
+    manager.delete_session("CASE-1")
+    assert manager.search_cases("lounge") == []
+
+
+# --- Evidence merging ---
+
+def test_merge_evidence():
+    existing = [{"type": "blood_stain", "description": "Spatter on wall", "location": "hall", "confidence": 0.6}]
+    new_items = [
+        {"type": "Blood_Stain", "description": " spatter on wall ", "location": "Hall", "confidence": 0.9},
+        {"type": "footprint", "description": "Shoe print", "location": "door", "confidence": 0.5},
+        {"type": "footprint", "description": "Shoe print", "location": "door", "confidence": 0.4}
+    ]
+    merged = csi.merge_evidence(existing, new_items)
+    assert [(e["type"], e["confidence"]) for e in merged] == [("blood_stain", 0.9), ("footprint", 0.5)]
+    # Inputs are left untouched
+    assert existing[0]["confidence"] == 0.6
+
+
+def test_merge_evidence_keeps_distinct_locations():
+    item = {"type": "footprint", "description": "Shoe print", "confidence": 0.5}
+    merged = csi.merge_evidence([dict(item, location="door")], [dict(item, location="window")])
+    assert [e["location"] for e in merged] == ["door", "window"]
+
+
+# --- Rate limiting and retries ---
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_burst_then_rate(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(csi.time, "monotonic", clock)
+    bucket = csi.TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve() for _ in range(5)] == [0.0, 0.0, 0.0, 0.5, 1.0]
+    clock.now += 10  # refills up to the burst, no further
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.0, 0.5]
+    assert csi.TokenBucket(rate=0).reserve() == 0.0
+
+
+def test_token_bucket_pause_spaces_queued_callers(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(csi.time, "monotonic", clock)
+    bucket = csi.TokenBucket(rate=2, burst=5)
+    bucket.pause(5)
+    waits = [bucket.reserve() for _ in range(15)]
+    assert waits == [5 + (i + 1) * 0.5 for i in range(15)]
+
+    clock.now += 20  # pause long over: back to the full burst
+    assert bucket.reserve() == 0.0
+    bucket.pause(1)
+    bucket.pause(0.5)  # a shorter pause doesn't cut a longer one short
+    assert bucket.reserve() == 1.5
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [csi.backoff_delay(attempt, base=1.0, cap=8.0) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= d <= 8.0 for d in delays)
+    assert all(0 <= csi.backoff_delay(0, base=1.0, cap=8.0) <= 1.0 for _ in range(50))
+    assert len(set(delays)) > 1
+
+
+def test_retry_after_is_capped(monkeypatch):
+    pytest.importorskip("httpx")
+    from mock_openrouter import MockOpenRouter
+
+    class Limiter:
+        paused = []
+
+        async def aacquire(self):
+            return 0.0
+
+        def pause(self, seconds):
+            self.paused.append(seconds)
+
+    slept = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        slept.append(delay)
+        await real_sleep(0)
+
+    with MockOpenRouter(latency=0, error_rate=1.0, retry_after=3600) as mock:
+        monkeypatch.setattr(csi, "OPENROUTER_URL", mock.url)
+        monkeypatch.setattr(csi.asyncio, "sleep", fake_sleep)
+
+        async def call():
+            client = csi.OpenRouterClient(limiter=Limiter(), max_attempts=2)
+            try:
+                return await client.post_chat({"model": "m", "messages": []})
+            finally:
+                await client.aclose()
+
+        response = asyncio.run(call())
+    assert response.status_code == 429
+    assert mock.stats["requests"] == 2
+    assert slept == [csi.RETRY_MAX_DELAY]
+    assert Limiter.paused == [csi.RETRY_MAX_DELAY]
+
+
+# --- Stage graph ---
+
+def _graph(log, delays):
+    def stage(name, deps):
+        async def fn(results):
+            assert set(deps) <= set(results)
+            log.append(("start", name))
+            await asyncio.sleep(delays.get(name, 0))
+            log.append(("end", name))
+            return name.upper()
+        return deps, fn
+    return {
+        "vision": stage("vision", ()),
+        "evidence": stage("evidence", ("vision",)),
+        "victim": stage("victim", ("vision",)),
+        "weapons": stage("weapons", ("evidence",)),
+        "summary": stage("summary", ("weapons", "victim"))
+    }
+
+
+def test_stage_graph_runs_stages_after_their_deps():
+    log, progress = [], []
+    results = asyncio.run(csi.arun_stage_graph(_graph(log, {"victim": 0.05}), max_workers=4,
+                                               progress_callback=lambda *p: progress.append(p)))
+    assert results == {n: n.upper() for n in ("vision", "evidence", "victim", "weapons", "summary")}
+    order = [name for event, name in log if event == "end"]
+    assert order.index("weapons") < order.index("victim")  # evidence/weapons overlap the slow victim stage
+    assert order[-1] == "summary"
+    assert progress[:5] == [(n, "pending") for n in ("vision", "evidence", "victim", "weapons", "summary")]
+    assert [s for n, s in progress if n == "summary"] == ["pending", "started", "done"]
+
+
+def test_stage_graph_respects_worker_cap():
+    log = []
+    running = peak = 0
+
+    def stage(results):
+        async def fn():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+        return fn()
+
+    stages = {f"s{i}": ((), stage) for i in range(6)}
+    asyncio.run(csi.arun_stage_graph(stages, max_workers=2))
+    assert peak == 2
+
+    # One worker reproduces the serial path in insertion order
+    asyncio.run(csi.arun_stage_graph(_graph(log, {}), max_workers=1))
+    assert [name for event, name in log if event == "start"] == ["vision", "evidence", "victim", "weapons", "summary"]
+    assert all(log[i][1] == log[i + 1][1] for i in range(0, len(log), 2))
+
+
+def test_stage_graph_rejects_unresolvable_deps():
+    with pytest.raises(ValueError):
+        csi.run_stage_graph({"a": (("missing",), lambda r: 1)})
+
+
+def test_stage_graph_cancels_siblings_on_failure():
+    cancelled = []
+
+    async def slow(results):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    def boom(results):
+        raise RuntimeError("stage failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(csi.arun_stage_graph({"slow": ((), slow), "boom": ((), boom)}))
+    assert cancelled == ["slow"]
+
+
+# --- Retrieval index ---
+
+def test_case_index_is_stored_and_rebuilt_when_stale(manager):
+    manager.save_session("CASE-1", _state(50, evidence=[{"type": "footprint", "description": "Boot print",
+                                                          "location": "door", "confidence": 0.6}]))
+    index = manager.get_case_index("CASE-1")
+    assert index["version"] == csi.retrieval.INDEX_VERSION
+    assert csi.retrieval.search(index, "boot", k=1)[0]["field"] == "evidence"
+
+    with manager._conn:
+        manager._conn.execute("UPDATE case_index SET version = 0, idx = '{}' WHERE case_id = 'CASE-1'")
+    assert manager.get_case_index("CASE-1") == index
+    assert manager._conn.execute("SELECT version FROM case_index WHERE case_id = 'CASE-1'").fetchone()[0] \
+        == csi.retrieval.INDEX_VERSION
+    assert manager.get_case_index("CASE-missing") is None
+
+
+# --- Vision ---
+
+def test_cancelled_batch_makes_no_fallback_calls(mock_api):
+    mock_api.latency = 0.3
+
+    async def run():
+        task = asyncio.create_task(csi.aanalyze_image_batch_openrouter([_image(i) for i in range(3)]))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.4)
+
+    asyncio.run(run())
+    assert mock_api.stats["requests"] == 1
+
+
+def _labelled(n):
+    return csi.media.PreparedImage(f"image-{n}".encode(), "image/jpeg", f"print-{n}", 10)
+
+
+def _label_reply(body):
+    """Name each image in the request; a packed request holding image-5 gets an unsplittable answer."""
+    parts = body["messages"][-1]["content"]
+    labels = [base64.b64decode(p["image_url"]["url"].split(",", 1)[1]).decode()
+              for p in parts if p.get("type") == "image_url"]
+    if len(labels) == 1:
+        return f"analysis of {labels[0]}"
+    if "image-5" in labels:
+        return json.dumps([f"analysis of {label}" for label in labels[1:]])
+    return json.dumps([f"analysis of {label}" for label in labels])
+
+
+def test_packed_batches_keep_input_order(tmp_path, mock_api, monkeypatch):
+    monkeypatch.setattr(mock_api, "reply_for", _label_reply)
+    mock_api.jitter = 0.05  # groups finish out of order
+    images = [_labelled(0), _labelled(1), str(tmp_path / "missing.jpg"), _labelled(3),
+              _labelled(4), _labelled(5), _labelled(6)]
+    cache = csi.get_response_cache()
+    for n in (1, 4):
+        cache.put(csi._vision_cache_key(images[n]), csi.OPENROUTER_MODEL, f"cached analysis of image-{n}")
+
+    results = csi.analyze_images_openrouter(images, max_workers=2, images_per_request=3)
+    assert results == ["analysis of image-0", "cached analysis of image-1", None, "analysis of image-3",
+                       "cached analysis of image-4", "analysis of image-5", "analysis of image-6"]
+    # [0, 1, 3] sends 0 and 3 packed; [4, 5, 6] sends 5 and 6 packed, then one by one
+    assert mock_api.stats["requests"] == 4
+
+
+def test_update_compares_against_stored_fingerprints(tmp_path, mock_api, store, prepare_calls):
+    photos = [_photo(tmp_path / f"p{i}.png", i) for i in range(4)]
+    res = csi.run_full_investigation("Victim found in the hall.", photos[:3], case_id="CASE-1")
+    prints = store.get_session("CASE-1")["case:fingerprints"]
+    assert len(prints) == 3 and len({p for p in prints}) == 3
+    assert res["case_id"] == "CASE-1"
+
+    prepare_calls.clear()
+    res = csi.update_investigation("CASE-1", new_images=[photos[3], photos[0]])
+    assert sorted(prepare_calls) == sorted([photos[3], photos[0]])  # the stored images aren't decoded again
+    state = store.get_session("CASE-1")
+    assert len(state["case:fingerprints"]) == 5
+    assert "[Image 5 Analysis]: [Duplicate of Image 1 - skipped]" in res["aggregate"]["visual_analysis"]
+
+
+def test_update_fingerprints_legacy_cases_once(tmp_path, mock_api, store, prepare_calls):
+    photos = [_photo(tmp_path / f"p{i}.png", i) for i in range(3)]
+    csi.run_full_investigation("Victim found in the hall.", photos[:2], case_id="CASE-1")
+    state = store.get_session("CASE-1")
+    del state["case:fingerprints"]  # saved before fingerprints were stored
+    store.save_session("CASE-1", state)
+
+    prepare_calls.clear()
+    csi.update_investigation("CASE-1", new_notes="Window forced.")
+    assert sorted(prepare_calls) == sorted(photos[:2])
+    prepare_calls.clear()
+    csi.update_investigation("CASE-1", new_images=[photos[2]])
+    assert prepare_calls == [photos[2]]
+
+
+
+def test_update_merges_new_material_into_the_stored_case(tmp_path, mock_api, store, prepare_calls):
+    photos = [_photo(tmp_path / f"p{i}.png", i) for i in range(4)]
+    csi.run_full_investigation("Victim found in the hall.", photos[:2], case_id="CASE-1")
+    before = store.get_session("CASE-1")
+    revision = store.get_revision("CASE-1")
+    old_lines = before["case:aggregate"]["visual_analysis"].splitlines()
+    assert len(old_lines) == 2
+
+    mock_api.responses["vision"] = "Second visit: pry marks on the window frame."
+    mock_api.responses["evidence"] = json.dumps({"evidence_items": [
+        {"type": "blood_stain", "description": "Blood spatter on the wall", "confidence": 0.95, "location": "living room wall"},
+        {"type": "tool_mark", "description": "Pry marks", "confidence": 0.8, "location": "window frame"}
+    ]})
+    prepare_calls.clear()
+    missing = str(tmp_path / "missing.jpg")
+    requests = mock_api.stats["requests"]
+    res = csi.update_investigation("CASE-1", new_notes="Window forced.", new_images=[photos[2], missing, photos[3]])
+
+    assert sorted(prepare_calls) == sorted([photos[2], missing, photos[3]])  # only the new images
+    # One vision request per loadable new image, then extraction, victim profile and summary
+    assert mock_api.stats["requests"] - requests == 2 + 3
+    state = store.get_session("CASE-1")
+    assert store.get_revision("CASE-1") == revision + 1
+    assert state["case:images"] == photos[:2] + [photos[2], missing, photos[3]]
+    assert state["case:failed_images"] == [3]
+    assert len(state["case:fingerprints"]) == 5 and state["case:fingerprints"][3] is None
+    aggregate = state["case:aggregate"]
+    assert aggregate == res["aggregate"]
+    assert aggregate["visual_analysis"].splitlines() == old_lines + [
+        "[Image 3 Analysis]: Second visit: pry marks on the window frame.",
+        "[Image 5 Analysis]: Second visit: pry marks on the window frame."]
+    assert "[UPDATED LOG]: Window forced." in aggregate["description"]
+    evidence = {e["type"]: e for e in aggregate["evidence_items"]}
+    assert set(evidence) == {"blood_stain", "weapon_blade", "footprint", "tool_mark"}
+    assert evidence["blood_stain"]["confidence"] == 0.95
+    assert aggregate["executive_summary"] == state["case:summary"]
+
+# --- Streaming ---
+
+def test_stream_yields_deltas_in_order_and_caches_the_answer(mock_api):
+    chunks = list(csi.call_openrouter_text_stream("Summarise the scene."))
+    assert len(chunks) > 1
+    assert "".join(chunks) == mock_api.responses["summary"]
+    assert list(csi.call_openrouter_text_stream("Summarise the scene.")) == [mock_api.responses["summary"]]
+    assert mock_api.stats["streams"] == 1
+
+
+def test_broken_stream_raises_after_the_partial_text(mock_api):
+    mock_api.break_stream_after = 3
+    chunks = []
+    with pytest.raises(ConnectionError):
+        for chunk in csi.call_openrouter_text_stream("Summarise the scene."):
+            chunks.append(chunk)
+    assert "".join(chunks) == " ".join(mock_api.responses["summary"].split(" ")[:3])
+    mock_api.break_stream_after = None
+    assert len(list(csi.call_openrouter_text_stream("Summarise the scene."))) > 1  # nothing was cached
+
+
+def _summary_partials(store, mock_api):
+    partials = []
+    res = csi.run_full_investigation("Victim found in the hall.", case_id="CASE-1",
+                                     partial_callback=lambda stage, text: partials.append((stage, text)))
+    assert {stage for stage, _ in partials} == {"summary"}
+    texts = [text for _, text in partials]
+    assert res["aggregate"]["executive_summary"] == mock_api.responses["summary"]
+    assert store.get_session("CASE-1")["case:summary"] == mock_api.responses["summary"]
+    return texts
+
+
+def test_summary_partials_arrive_in_order(mock_api, store):
+    texts = _summary_partials(store, mock_api)
+    assert len(texts) == len(mock_api.responses["summary"].split(" "))
+    assert all(later.startswith(earlier) and len(later) > len(earlier) for earlier, later in zip(texts, texts[1:]))
+    assert texts[-1] == mock_api.responses["summary"]
+    assert mock_api.stats["streams"] == 1
+
+
+def test_summary_falls_back_when_the_stream_breaks(mock_api, store):
+    mock_api.break_stream_after = 3
+    texts = _summary_partials(store, mock_api)
+    words = mock_api.responses["summary"].split(" ")
+    assert texts == [" ".join(words[:n]) for n in (1, 2, 3)] + [mock_api.responses["summary"]]
+    assert mock_api.stats["streams"] == 1
+    # The complete summary came from one non-streaming request, next to extraction and the profile
+    assert mock_api.stats["requests"] == 4
@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+import csi_backend as csi
+import csi_batch as batch
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Offline backend: temporary case store and output dir, LLM calls fall back."""
+    cm = csi.CaseManager(str(tmp_path / "csi_app.db"))
+    monkeypatch.setattr(csi, "_case_manager", cm)
+    monkeypatch.setattr(csi, "OUT_DIR", tmp_path / "out")
+    monkeypatch.setattr(csi.reports, "submit", lambda case_id, aggregate: tmp_path / f"{case_id}.pdf")
+
+    async def no_llm(prompt, use_cache=True):
+        return None
+
+    monkeypatch.setattr(csi, "acall_openrouter_text", no_llm)
+    yield cm
+    cm.close()
+
+
+def _write_jsonl(path, records):
+    path.write_text("".join((r if isinstance(r, str) else json.dumps(r)) + "\n" for r in records),
+                    encoding="utf-8")
+    return path
+
+
+def test_batch_does_not_store_traces(tmp_path, store):
+    corpus = _write_jsonl(tmp_path / "cases.jsonl", [{"case_id": "CASE-1", "scene_text": "Knife and blood in the hall."}])
+    stats = batch.run_batch(corpus, workers=1, write_pdf=False, log=lambda msg: None)
+    assert stats["done"] == 1
+    assert store.get_session("CASE-1")["case:aggregate"]["case_id"] == "CASE-1"
+    assert store.get_traces("CASE-1") == []
+
+    # Interactive runs still keep theirs
+    csi.run_full_investigation("Glass on the floor.", case_id="CASE-2")
+    assert len(store.get_traces("CASE-2")) == 1
+
+
+# --- Checkpoint and resume ---
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    calls, failing = [], set()
+
+    def investigate(scene_text, image_paths, case_id=None, max_workers=None, persist=True):
+        calls.append(case_id)
+        if case_id in failing:
+            raise RuntimeError("model unavailable")
+        aggregate = {"case_id": case_id, "description": scene_text, "executive_summary": "", "evidence_items": [],
+                     "risk_score": 1}
+        return {"case_id": case_id, "aggregate": aggregate, "failed_images": []}
+
+    monkeypatch.setattr(csi, "run_full_investigation", investigate)
+    return calls, failing
+
+
+def _checkpoint(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+def test_resume_skips_finished_cases_and_retries_failures(tmp_path, store, fake_pipeline):
+    calls, failing = fake_pipeline
+    corpus = _write_jsonl(tmp_path / "cases.jsonl", [
+        {"case_id": "CASE-1", "scene_text": "Knife in the hall."},
+        "{not json",
+        {"case_id": "CASE-2", "scene_text": "Glass by the window."},
+        {"case_id": "CASE-1", "scene_text": "Knife in the hall."},  # duplicate
+        {"case_id": "CASE-3", "text": ""},  # no scene text
+        {"case_id": "CASE-4", "scene": "Blood on the stairs."}
+    ])
+    ckpt = tmp_path / "run.ckpt.jsonl"
+    failing.add("CASE-2")
+    stats = batch.run_batch(corpus, ckpt, workers=2, flush_every=2, write_pdf=False, log=lambda msg: None)
+    assert (stats["done"], stats["failed"], stats["skipped"]) == (2, 1, 3)
+    assert sorted(calls) == ["CASE-1", "CASE-2", "CASE-4"]
+    entries = _checkpoint(ckpt)
+    assert {e["case_id"] for e in entries if e["status"] == "done"} == {"CASE-1", "CASE-4"}
+    assert [e["line"] for e in entries if e["status"] == "invalid"] == [2]
+    assert {r["case_id"] for r in store.list_cases()} == {"CASE-1", "CASE-4"}
+
+    calls.clear()
+    failing.clear()
+    stats = batch.run_batch(corpus, ckpt, workers=2, write_pdf=False, log=lambda msg: None)
+    assert calls == ["CASE-2"]
+    assert (stats["done"], stats["failed"]) == (1, 0)
+    assert batch.load_checkpoint(ckpt) == {"CASE-1", "CASE-2", "CASE-4"}
+
+
+def test_torn_checkpoint_line_is_ignored(tmp_path, store, fake_pipeline):
+    calls, _ = fake_pipeline
+    corpus = _write_jsonl(tmp_path / "cases.jsonl", [{"case_id": "CASE-1", "scene_text": "Knife."},
+                                                     {"case_id": "CASE-2", "scene_text": "Glass."}])
+    ckpt = tmp_path / "run.ckpt.jsonl"
+    ckpt.write_text('{"case_id": "CASE-1", "status": "done"}\n{"case_id": "CASE-2", "sta', encoding="utf-8")
+    logged = []
+    assert batch.load_checkpoint(ckpt, logged.append) == {"CASE-1"}
+    assert logged == ["[checkpoint] line 2: unreadable entry ignored"]
+
+    batch.run_batch(corpus, ckpt, write_pdf=False, log=lambda msg: None)
+    assert calls == ["CASE-2"]
+    # The new entry starts on its own line instead of extending the torn one
+    assert batch.load_checkpoint(ckpt, lambda msg: None) == {"CASE-1", "CASE-2"}
+
+
+def test_normalize_record_ids_and_paths(tmp_path):
+    record = {"scene": "Knife.", "image_paths": "a.jpg; /abs/b.jpg"}
+    case_id, text, images = batch.normalize_record(record, tmp_path)
+    assert text == "Knife."
+    assert images == [str(tmp_path / "a.jpg"), "/abs/b.jpg"]
+    assert case_id.startswith("CASE-") and case_id == batch.normalize_record(dict(record), tmp_path)[0]
+    assert batch.normalize_record(dict(record, scene="Gun."), tmp_path)[0] != case_id
+    assert batch.normalize_record(dict(record, case_id="CASE-x"), tmp_path)[0] == "CASE-x"
@@ -0,0 +1,78 @@
+import pytest
+
+import csi_cache
+from csi_cache import ResponseCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(csi_cache.time, "time", clock)
+    return clock
+
+
+def test_make_key_separates_parts():
+    key = ResponseCache.make_key("m", "prompt", b"img")
+    assert key == ResponseCache.make_key("m", "prompt", b"img")
+    assert key != ResponseCache.make_key("m", "prompt", b"im", b"g")
+    assert key != ResponseCache.make_key("mp", "rompt", b"img")
+    assert key != ResponseCache.make_key("m", "prompt")
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl=60)
+    cache.put("k", "m", "answer")
+    clock.now += 59
+    assert cache.get("k") == "answer"
+    clock.now += 2  # reads don't extend the TTL
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_entries_are_purged_on_write(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl=60)
+    cache.put("old", "m", "a")
+    clock.now += 120
+    cache.put("new", "m", "b")
+    assert cache.stats()["entries"] == 1
+
+
+def test_evicts_least_recently_used_by_count(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.put("a", "m", "1")
+    clock.now += 1
+    cache.put("b", "m", "2")
+    clock.now += 1
+    assert cache.get("a") == "1"  # touching "a" makes "b" the oldest
+    clock.now += 1
+    cache.put("c", "m", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.evictions == 1
+
+
+def test_evicts_by_stored_bytes(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=10)
+    for i, key in enumerate("abc"):
+        clock.now += 1
+        cache.put(key, "m", str(i) * 4)
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"]) == (2, 8)
+    assert cache.get("a") is None
+
+
+def test_bypass_skips_reads_but_still_writes(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    bypassed = ResponseCache(path, bypass=True)
+    bypassed.put("k", "m", "answer")
+    assert bypassed.get("k") is None
+    assert ResponseCache(path).get("k") == "answer"
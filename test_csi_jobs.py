@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import csi_backend as csi
+import csi_jobs as jobs
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return jobs.JobQueue(str(tmp_path / "jobs.db"), workers=1, poll_interval=0.01)
+
+
+def _wait_for(queue, job_id, statuses, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status["status"] in statuses:
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"{job_id} still {queue.status(job_id)['status']}")
+
+
+def _insert_running(queue, job_id, owner):
+    with queue._conn:
+        queue._conn.execute(
+            "INSERT INTO jobs (job_id, kind, status, params, progress, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, "investigate", jobs.RUNNING, json.dumps({"case_id": "CASE-1"}), "{}", owner, 0, 0))
+
+
+def test_cancel_queued_job(queue, monkeypatch):
+    monkeypatch.setattr(queue, "start", lambda: None)  # keep it queued
+    job_id = queue.submit("Scene log", case_id="CASE-1")
+    assert queue.status(job_id)["status"] == jobs.QUEUED
+    assert queue.cancel(job_id) is True
+    assert queue.status(job_id)["status"] == jobs.CANCELLED
+    assert queue.cancel(job_id) is False  # already finished
+    with pytest.raises(RuntimeError):
+        queue.result(job_id)
+
+
+def test_cancel_running_job_stops_at_next_stage(queue, monkeypatch):
+    reached, release = threading.Event(), threading.Event()
+    stages = []
+
+    def fake_investigation(scene_text, image_paths, case_id=None, progress_callback=None, partial_callback=None):
+        progress_callback("vision", "done")
+        stages.append("vision")
+        reached.set()
+        release.wait(5)
+        progress_callback("evidence", "started")
+        stages.append("evidence")
+        return {"case_id": case_id, "json_path": "x.json", "pdf_path": None}
+
+    monkeypatch.setattr(csi, "run_full_investigation", fake_investigation)
+    job_id = queue.submit("Scene log", case_id="CASE-1")
+    assert reached.wait(5)
+    assert queue.cancel(job_id) is True
+    release.set()
+    status = _wait_for(queue, job_id, jobs.FINISHED)
+    assert status["status"] == jobs.CANCELLED
+    assert status["error"] == "Cancelled by user."
+    assert stages == ["vision"]
+
+
+def test_failed_job_records_error(queue, monkeypatch):
+    def broken(*args, **kwargs):
+        raise ValueError("no scene")
+
+    monkeypatch.setattr(csi, "run_full_investigation", broken)
+    job_id = queue.submit("Scene log")
+    status = _wait_for(queue, job_id, jobs.FINISHED)
+    assert (status["status"], status["error"]) == (jobs.FAILED, "ValueError: no scene")
+
+
+def test_orphaned_jobs_are_requeued(queue):
+    now = time.time()
+    with queue._conn:
+        queue._conn.executemany("INSERT INTO job_owners (owner, heartbeat) VALUES (?, ?)", [
+            ("other-live", now), ("other-stale", now - jobs.JOB_OWNER_TIMEOUT - 1)])
+    _insert_running(queue, "JOB-live", "other-live")
+    _insert_running(queue, "JOB-stale", "other-stale")
+    _insert_running(queue, "JOB-unknown", "never-registered")
+    _insert_running(queue, "JOB-unowned", None)
+    _insert_running(queue, "JOB-reused-pid", os.getpid())  # a pid is never proof of life
+    _insert_running(queue, "JOB-mine", queue.owner)
+
+    assert queue._requeue_orphans() == 4
+    statuses = {j["job_id"]: j["status"] for j in queue.list_jobs()}
+    assert statuses == {"JOB-live": jobs.RUNNING, "JOB-mine": jobs.RUNNING,
+                        "JOB-stale": jobs.QUEUED, "JOB-unknown": jobs.QUEUED,
+                        "JOB-unowned": jobs.QUEUED, "JOB-reused-pid": jobs.QUEUED}
+    owners = {r[0] for r in queue._conn.execute("SELECT owner FROM job_owners")}
+    assert owners == {"other-live"}
+
+
+def test_each_queue_run_has_its_own_owner(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first, second = jobs.JobQueue(path), jobs.JobQueue(path)
+    assert first.owner != second.owner
+    assert first.owner.startswith(f"{os.getpid()}-")
@@ -0,0 +1,96 @@
+import hashlib
+import io
+
+import pytest
+
+import csi_media as media
+
+
+def _scene(path, size=(640, 480), flip=False, fmt="PNG"):
+    Image = pytest.importorskip("PIL.Image")
+    w, h = 64, 48
+    img = Image.new("RGB", (w, h))
+    img.putdata([((x * 255 // w), (y * 255 // h), ((x * y) % 97 * 2)) for y in range(h) for x in range(w)])
+    img = img.resize(size, Image.BILINEAR)
+    if flip:
+        img = img.transpose(Image.FLIP_LEFT_RIGHT)
+    img.save(path, format=fmt)
+    return path
+
+
+# --- Preprocessing and dedupe ---
+
+def test_prepare_image_downscales_and_fingerprints(tmp_path):
+    prepared = media.prepare_image(_scene(tmp_path / "scene.png", size=(3000, 1500)), max_edge=1000)
+    Image = pytest.importorskip("PIL.Image")
+    with Image.open(io.BytesIO(prepared.data)) as img:
+        assert img.size == (1000, 500)
+    assert prepared.mime == "image/jpeg"
+    assert isinstance(prepared.fingerprint, int)
+    assert prepared.bytes_in == (tmp_path / "scene.png").stat().st_size
+
+
+def test_recompressed_copy_is_a_duplicate(tmp_path):
+    original = media.prepare_image(_scene(tmp_path / "a.png"))
+    resized = media.prepare_image(_scene(tmp_path / "b.jpg", size=(320, 240), fmt="JPEG"))
+    flipped = media.prepare_image(_scene(tmp_path / "c.png", flip=True))
+    assert media.is_duplicate(original.fingerprint, resized.fingerprint)
+    assert not media.is_duplicate(original.fingerprint, flipped.fingerprint)
+    assert not media.is_duplicate(original.fingerprint, resized.fingerprint, max_distance=-1)
+
+
+def test_undecodable_files_fall_back_to_sha256(tmp_path):
+    path = tmp_path / "notes.bin"
+    path.write_bytes(b"not an image")
+    prepared = media.prepare_image(path)
+    assert prepared.data == b"not an image"
+    assert prepared.mime == "application/octet-stream"
+    assert prepared.fingerprint == hashlib.sha256(b"not an image").hexdigest()
+    assert not media.is_duplicate(prepared.fingerprint, 0)  # never matches a dHash
+
+
+def test_find_duplicates_points_at_first_copy():
+    fingerprints = [0b1111, 0b1110, None, 0b1111_0000_0000, 0b1100]
+    assert media.find_duplicates(fingerprints, max_distance=1) == [None, 0, None, None, 0]
+    # Reference entries before `start` are matched but not reported
+    assert media.find_duplicates(fingerprints, max_distance=1, start=3) == [None, 1]
+    assert media.find_duplicates(["abc", "abc", "abd"], max_distance=0) == [None, 0, None]
+
+
+# --- Blob store ---
+
+def test_store_blob_is_content_addressed(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, "MEDIA_CHUNK_BYTES", 7)  # several chunks per blob
+    data = b"crime scene photo bytes" * 3
+    stream = io.BytesIO(data)
+    stream.read(5)  # a partly read upload is stored from the start
+    blob = media.store_blob(stream, tmp_path)
+    digest = hashlib.sha256(data).hexdigest()
+    assert blob == media.Blob(digest, str(media.blob_path(digest, tmp_path)), len(data))
+    assert blob.path.endswith(f"blobs/{digest[:2]}/{digest}")
+    with open(blob.path, "rb") as f:
+        assert f.read() == data
+
+    again = media.store_blob(io.BytesIO(data), tmp_path)
+    assert again == blob
+    assert list((tmp_path / "tmp").iterdir()) == []  # the duplicate's temp file is gone
+    assert media.store_blob(io.BytesIO(b"other"), tmp_path).digest != digest
+
+
+def test_store_blob_cleans_up_after_a_failed_read(tmp_path):
+    class Broken(io.BytesIO):
+        def read(self, n=-1):
+            raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        media.store_blob(Broken(b"x"), tmp_path)
+    assert list((tmp_path / "tmp").iterdir()) == []
+    assert not (tmp_path / "blobs").exists()
+
+
+def test_blob_digest_only_recognises_store_paths(tmp_path):
+    blob = media.store_blob(io.BytesIO(b"data"), tmp_path)
+    assert media.blob_digest(blob.path) == blob.digest
+    assert media.blob_digest(tmp_path / "scene.jpg") is None
+    assert media.blob_digest(tmp_path / "other" / blob.digest[:2] / blob.digest) is None
+    assert media.blob_digest(None) is None
@@ -0,0 +1,76 @@
+import logging
+
+import csi_backend as csi
+import csi_prompts as prompts
+
+
+def _analysis(n):
+    return f"Image {n} shows " + " ".join(f"detail-{n}-{k}" for k in range(200))
+
+
+# --- fit_sections ---
+
+def test_fit_sections_keeps_small_blocks_whole():
+    block = prompts.fit_sections([prompts.Section("Scene", "Kitchen", 1),
+                                  prompts.Section("Evidence", [{"type": "knife"}], 1),
+                                  prompts.Section("Empty", "", 1)])
+    assert block == 'Scene: Kitchen\nEvidence: [{"type":"knife"}]'
+
+
+def test_fit_sections_sends_repeated_text_once():
+    visual = "[Image 1 Analysis]: Broken window glass on the kitchen floor near the door"
+    block = prompts.fit_sections([prompts.Section("Scene", f"Officer log: body in kitchen\n{visual}", 1),
+                                  prompts.Section("Visual Analysis", visual, 3)])
+    assert block.count("Broken window glass") == 1
+    assert "Visual Analysis: " + visual in block
+
+
+def test_fit_sections_trims_free_text_before_lists(caplog):
+    evidence = [{"type": "blood_stain", "description": f"Stain {i}", "confidence": 0.9} for i in range(20)]
+    sections = [prompts.Section("Scene", "x" * 20000, 1),
+                prompts.Section("Evidence", evidence, 1)]
+    with caplog.at_level(logging.WARNING, logger="csi_prompts"):
+        block = prompts.fit_sections(sections, budget=1000)
+    assert len(block) <= 1000 * prompts.CHARS_PER_TOKEN
+    assert prompts.TRUNCATED in block
+    assert prompts.compact_json(evidence) in block
+    assert "trimmed 1 section(s), dropped 0" in caplog.text
+
+
+def test_fit_sections_drops_lowest_priority_first(caplog):
+    sections = [prompts.Section("Scene", "s" * 150, 1),
+                prompts.Section("Hypotheses", ["h" * 300] * 3, 4)]
+    with caplog.at_level(logging.WARNING, logger="csi_prompts"):
+        block = prompts.fit_sections(sections, budget=100)
+    assert block == "Scene: " + "s" * 150
+    assert "dropped 1" in caplog.text
+
+
+def test_fit_sections_is_silent_within_budget(caplog):
+    with caplog.at_level(logging.WARNING, logger="csi_prompts"):
+        prompts.fit_sections([prompts.Section("Scene", "Kitchen", 1)])
+    assert caplog.text == ""
+
+
+# --- Evidence extraction input ---
+
+def test_extraction_sees_every_image_of_a_large_case(monkeypatch, caplog):
+    _, context = csi._build_context("Victim found in the hallway.", [_analysis(n) for n in range(1, 21)])
+    assert len(context) > prompts.PROMPT_TOKEN_BUDGET * prompts.CHARS_PER_TOKEN
+
+    seen = []
+
+    async def fake_text(prompt, use_cache=True):
+        seen.append(prompt)
+        return '{"evidence_items": []}'
+
+    monkeypatch.setattr(csi, "acall_openrouter_text", fake_text)
+    with caplog.at_level(logging.WARNING, logger="csi_prompts"):
+        assert csi.extract_evidence_llm(context) == {"evidence_items": []}
+        csi.generate_victim_profile(context, [])
+    assert len(seen) == 2
+    for prompt in seen:
+        assert "[Image 20 Analysis]" in prompt
+        assert "detail-20-199" in prompt
+        assert prompts.TRUNCATED not in prompt
+    assert caplog.text == ""
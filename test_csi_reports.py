@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+import csi_reports as reports
+
+
+AGGREGATE = {
+    "executive_summary": "Close-range stabbing.",
+    "description": "Victim found in the kitchen.",
+    "evidence_items": [{"type": "weapon_blade", "description": "Knife", "confidence": 0.8}],
+    "risk_score": 70
+}
+
+
+def test_report_key_is_stable():
+    key = reports.report_key("CASE-1", AGGREGATE)
+    assert key == reports.report_key("CASE-1", dict(reversed(list(AGGREGATE.items()))))
+    assert len(key) == 16 and int(key, 16) >= 0
+
+
+def test_report_key_tracks_report_content():
+    key = reports.report_key("CASE-1", AGGREGATE)
+    assert reports.report_key("CASE-2", AGGREGATE) != key
+    assert reports.report_key("CASE-1", dict(AGGREGATE, risk_score=71)) != key
+    assert reports.report_key("CASE-1", dict(AGGREGATE, executive_summary="Revised.")) != key
+    # Fields the report doesn't show don't force a re-render
+    assert reports.report_key("CASE-1", dict(AGGREGATE, scratch="x")) == key
+
+
+def test_report_key_changes_with_renderer_version(monkeypatch):
+    key = reports.report_key("CASE-1", AGGREGATE)
+    monkeypatch.setattr(reports, "RENDERER_VERSION", reports.RENDERER_VERSION + 1)
+    assert reports.report_key("CASE-1", AGGREGATE) != key
+
+
+def test_pdf_path_uses_report_key():
+    path = reports.pdf_path("CASE-1", AGGREGATE)
+    assert path.parent == reports.REPORT_DIR
+    assert path.name == f"CASE-1-{reports.report_key('CASE-1', AGGREGATE)}.pdf"
+
+
+# --- PDF rendering ---
+
+def test_wrap_splits_long_tokens_to_fit():
+    pytest.importorskip("fpdf")
+    writer = reports._PdfWriter()
+    writer.pdf.set_font("Arial", "", 9)
+    token = "ab0f" * 250
+    lines = writer._wrap(f"hash {token} end", 40)
+    assert lines[0] == "hash"
+    assert "".join(lines[1:-1]) + lines[-1].split(" ")[0] == token
+    assert lines[-1].endswith(" end")
+    assert all(writer.pdf.get_string_width(line) <= 40 for line in lines)
+    assert all(line for line in lines)
+
+
+def test_report_with_long_unbroken_tokens_renders_quickly(tmp_path):
+    pytest.importorskip("fpdf")
+    aggregate = dict(AGGREGATE, evidence_items=[
+        {"type": "digital_hash", "description": f"{i:04d}" + "f" * 996, "confidence": 0.5, "location": "disk"}
+        for i in range(100)
+    ])
+    started = time.perf_counter()
+    out = reports.write_pdf_report(reports.report_blocks("CASE-1", aggregate), tmp_path / "long.pdf")
+    assert time.perf_counter() - started < 5
+    assert (tmp_path / "long.pdf").stat().st_size > 0 and out.endswith("long.pdf")
@@ -0,0 +1,64 @@
+import csi_retrieval as retrieval
+
+
+def test_fts_query_quotes_distinct_terms():
+    assert retrieval.fts_query("Knife knife BLOOD") == '"knife" OR "blood"'
+
+
+def test_fts_query_drops_stopwords_and_punctuation():
+    assert retrieval.fts_query("Which cases involve a garage?") == '"garage"'
+    assert retrieval.fts_query("show me the cases") == ""
+    assert retrieval.fts_query("") == ""
+
+
+def test_fts_query_neutralises_fts_syntax():
+    query = retrieval.fts_query('knife" OR NEAR(blood, 5) AND -gun*')
+    assert query == '"knife" OR "near" OR "blood" OR "5" OR "gun"'
+
+
+AGGREGATE = {
+    "description": "Officer Log: Victim found in the kitchen. Back door forced open.\n\nVisual Forensics Data:\n"
+                   "[Image 1 Analysis]: Kitchen knife on the floor near the sink.",
+    "visual_analysis": "[Image 1 Analysis]: Kitchen knife on the floor near the sink.",
+    "evidence_items": [{"type": "weapon_blade", "description": "Kitchen knife", "location": "sink", "confidence": 0.9},
+                       {"type": "footprint", "description": "Muddy boot prints", "location": "back door",
+                        "confidence": 0.6}],
+    "weapons": [{"weapon": "bladed_object", "confidence": 0.9, "reason": "Presence of weapon_blade"}],
+    "executive_summary": "Forced entry followed by a stabbing in the kitchen.",
+    "risk_score": 7
+}
+
+
+def test_tokenize_folds_plurals_and_drops_stopwords():
+    assert retrieval.tokenize("The prints of the boots, and glass") == ["print", "boot", "glass"]
+
+
+def test_chunk_case_sends_visual_text_once():
+    chunks = retrieval.chunk_case(AGGREGATE)
+    fields = [field for field, _ in chunks]
+    assert fields.count("visual_analysis") == 1
+    description = [text for field, text in chunks if field == "description"]
+    assert description and all("Kitchen knife on the floor" not in t for t in description)
+    assert ("summary", "Risk score: 7") in chunks
+
+
+def test_search_ranks_matching_chunks():
+    index = retrieval.build_index(AGGREGATE)
+    hits = retrieval.search(index, "Where were the boot prints?", k=1)
+    assert len(hits) == 1
+    assert hits[0]["field"] == "evidence" and "boot" in hits[0]["text"].lower()
+    assert hits[0]["score"] > 0
+
+    hits = retrieval.search(index, "knife", k=3)
+    assert {h["field"] for h in hits} >= {"visual_analysis", "evidence"}
+    # Returned in case order, not score order
+    order = [c["text"] for c in index["chunks"]]
+    assert [order.index(h["text"]) for h in hits] == sorted(order.index(h["text"]) for h in hits)
+
+
+def test_search_falls_back_to_summary():
+    index = retrieval.build_index(AGGREGATE)
+    hits = retrieval.search(index, "helicopter", k=5)
+    assert [h["field"] for h in hits] == ["summary", "summary"]
+    assert all(h["score"] == 0 for h in hits)
+    assert retrieval.search(retrieval.build_index({}), "knife") == []
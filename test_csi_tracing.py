@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import csi_tracing as tracing
+
+
+def _by_name(trace):
+    return {s.name: s for s in trace.spans}
+
+
+# --- Span nesting ---
+
+def test_spans_nest_across_threads_and_gathered_tasks():
+    def blocking(name):
+        with tracing.span(name):
+            time.sleep(0.01)
+
+    async def stage(name):
+        with tracing.span(name):
+            await asyncio.sleep(0.01)
+            await asyncio.to_thread(blocking, f"{name}:io")
+
+    async def pipeline():
+        with tracing.span("pipeline"):
+            await asyncio.gather(stage("vision"), stage("text"))
+
+    with tracing.start_trace("investigation", case_id="CASE-1") as trace:
+        asyncio.run(pipeline())
+
+    spans = _by_name(trace)
+    assert set(spans) == {"pipeline", "vision", "text", "vision:io", "text:io"}
+    assert spans["pipeline"].parent_id is None
+    assert spans["vision"].parent_id == spans["text"].parent_id == spans["pipeline"].span_id
+    assert spans["vision:io"].parent_id == spans["vision"].span_id
+    assert spans["text:io"].parent_id == spans["text"].span_id
+    assert spans["vision"].thread != spans["text"].thread  # one lane per task
+    assert spans["vision:io"].thread != spans["vision"].thread
+    assert tracing.current_span() is None
+
+
+def test_span_records_errors_and_is_a_noop_outside_a_trace():
+    with tracing.span("orphan") as s:
+        tracing.record(ignored=True)
+    assert s is None
+
+    @tracing.traced("parse")
+    def parse():
+        tracing.incr("attempts")
+        tracing.incr("attempts")
+        raise ValueError("bad json")
+
+    with tracing.start_trace("investigation") as trace:
+        with pytest.raises(ValueError):
+            parse()
+    (s,) = trace.spans
+    assert s.attrs == {"attempts": 2, "error": "ValueError: bad json"}
+    assert s.duration_ms is not None
+
+
+# --- Export ---
+
+def _sample_trace():
+    with tracing.start_trace("investigation", case_id="CASE-1") as trace:
+        with tracing.span("pipeline"):
+            with tracing.span("stage:vision", images=2):
+                time.sleep(0.02)
+    return trace.to_dict()
+
+
+def test_to_jsonl_has_one_span_per_line():
+    data = _sample_trace()
+    lines = [json.loads(line) for line in tracing.to_jsonl(data).splitlines()]
+    assert [line["name"] for line in lines] == ["stage:vision", "pipeline"]
+    assert all(line["trace_id"] == data["trace_id"] for line in lines)
+    vision, pipeline = lines
+    assert vision["parent_id"] == pipeline["span_id"]
+    assert vision["attrs"] == {"images": 2}
+    assert 20 <= vision["duration_ms"] <= pipeline["duration_ms"]
+
+
+def test_to_chrome_trace_emits_complete_events():
+    data = _sample_trace()
+    chrome = json.loads(json.dumps(tracing.to_chrome_trace(data)))
+    assert chrome["otherData"] == {"trace_id": data["trace_id"], "name": "investigation"}
+    complete = [e for e in chrome["traceEvents"] if e["ph"] == "X"]
+    meta = [e for e in chrome["traceEvents"] if e["ph"] == "M"]
+    assert [e["name"] for e in complete] == ["pipeline", "stage:vision"]  # sorted by start
+    pipeline, vision = complete
+    assert vision["cat"] == "stage"
+    spans = {s["name"]: s for s in data["spans"]}
+    for event in complete:
+        span = spans[event["name"]]
+        assert event["ts"] == round(span["start"] * 1e6)
+        assert event["dur"] == round(span["duration_ms"] * 1000)
+    assert pipeline["ts"] <= vision["ts"]
+    assert vision["ts"] + vision["dur"] <= pipeline["ts"] + pipeline["dur"] + 1000  # wall vs perf clock
+    assert [(e["tid"], e["args"]["name"]) for e in meta] == [(pipeline["tid"], spans["pipeline"]["thread"])]